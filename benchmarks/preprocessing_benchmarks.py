@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import contextlib
+import datetime
+import importlib.util
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import nltk.data
+
+_repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, _repo_dir)
+
+from benchmarks.synthetic_corpus import LANGUAGES, generate_corpus, generate_document
+from preprocessing import cleaning, tokenization
+from preprocessing.tokenization import sentence_tokenizer
+
+_language_names = {
+    "de": "german",
+    "en": "english",
+    "es": "spanish",
+    "fr": "french",
+    "it": "italian",
+}
+
+
+def _load_preprocessing_script():
+    # the script has the same name as the package, so it is loaded by path
+    spec = importlib.util.spec_from_file_location("preprocessing_script", os.path.join(_repo_dir, "preprocessing.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _new_sentence_tokenizer(language: str, cache_dir: str = ""):
+    # the tokenizers are kept for the process (and nltk keeps the models it
+    # loaded), which would leave only a lookup to measure, so each call
+    # builds (or unpickles) a new one
+    tokenization.use_tokenizer_cache(cache_dir)
+    tokenization._tokenizer_cache.clear()
+    nltk.data._resource_cache.clear()
+    return sentence_tokenizer(_language_names[language])
+
+
+def _remove_end_of_line_hyphens_cold(lines: [str], language: str) -> [str]:
+    # the decisions are memoized for the process, which would leave only
+    # lookups to measure instead of the spellchecking
+    cleaning._decision_memo.clear()
+    return cleaning.remove_end_of_line_hyphens(list(lines), language)
+
+
+def _measure(fn, repeat: int) -> [float]:
+    result = []
+    # the steps print some of their decisions, which is just noise here
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        # an untimed first run loads models and fills caches
+        fn()
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            result.append(time.perf_counter() - start)
+    return result
+
+
+def _result(timings: [float], size: int) -> dict:
+    best = min(timings)
+    return {
+        "repeat": len(timings),
+        "seconds_min": best,
+        "seconds_median": statistics.median(timings),
+        "seconds_mean": statistics.mean(timings),
+        "bytes": size,
+        "mb_per_s": size / best / 1e6 if best > 0 else None,
+    }
+
+
+def micro_benchmarks(args: argparse.Namespace) -> dict:
+    results = {}
+    tokenizer_cache_dir = tempfile.mkdtemp(prefix="chronoi-benchmarks-")
+    try:
+        for language in args.languages:
+            results.update(_language_micro_benchmarks(args, language, tokenizer_cache_dir))
+    finally:
+        tokenization.use_tokenizer_cache("")
+        shutil.rmtree(tokenizer_cache_dir, ignore_errors=True)
+    return results
+
+
+def _language_micro_benchmarks(args: argparse.Namespace, language: str, tokenizer_cache_dir: str) -> dict:
+    results = {}
+    text = generate_document(args.seed, language, pages=args.pages)
+    lines = text.splitlines()
+    cleaned = cleaning.cleanup_whitespace(lines)
+    de_hyphenated = "\n".join(cleaning.remove_end_of_line_hyphens(list(cleaned), language))
+    tokenizer = sentence_tokenizer(_language_names[language])
+    sentences = "\n".join(tokenizer.tokenize(de_hyphenated))
+    cleaned_size = len("\n".join(cleaned).encode("utf-8"))
+
+    benchmarks = [
+        ("cleanup_whitespace", lambda: cleaning.cleanup_whitespace(lines), len(text.encode("utf-8"))),
+        # the function changes the list it is given, so it gets a fresh copy every time
+        ("remove_end_of_line_hyphens", lambda: _remove_end_of_line_hyphens_cold(cleaned, language), cleaned_size),
+        # with the decisions of the earlier runs, like for a document's later hyphens
+        ("remove_end_of_line_hyphens_memoized",
+         lambda: cleaning.remove_end_of_line_hyphens(list(cleaned), language), cleaned_size),
+        ("sentence_tokenizer", lambda: _new_sentence_tokenizer(language), 0),
+        # the untimed first run writes the pickle that is then loaded
+        ("sentence_tokenizer_cached", lambda: _new_sentence_tokenizer(language, tokenizer_cache_dir), 0),
+        ("tokenize", lambda: tokenizer.tokenize(de_hyphenated), len(de_hyphenated.encode("utf-8"))),
+        ("escape_xml_chars", lambda: cleaning.escape_xml_chars(sentences), len(sentences.encode("utf-8"))),
+    ]
+    for name, fn, size in benchmarks:
+        key = f"{name}[{language}]"
+        if args.only and args.only not in key:
+            continue
+        results[key] = _result(_measure(fn, args.repeat), size)
+    return results
+
+
+def end_to_end_benchmark(args: argparse.Namespace) -> dict:
+    key = "end_to_end_per_document"
+    if args.only and args.only not in key:
+        return {}
+
+    script = _load_preprocessing_script()
+    script_args = script.build_argument_parser().parse_args(["--skip_manual_cleaning", "--random_seed", "0"])
+    work_dir = tempfile.mkdtemp(prefix="chronoi-benchmark-")
+    try:
+        input_dir = os.path.join(work_dir, "input")
+        paths = generate_corpus(input_dir, documents=len(args.languages), pages=args.pages, seed=args.seed)
+        size = sum(os.path.getsize(p) for p in paths)
+        runs = []
+
+        def process_corpus():
+            # a fresh output directory each time, so that no step is skipped
+            output_dir = tempfile.mkdtemp(dir=work_dir)
+            runs.append(output_dir)
+            for path in paths:
+                script.process_file(path, output_dir, script_args, record={})
+
+        timings = [t / len(paths) for t in _measure(process_corpus, args.repeat)]
+        return {key: _result(timings, size // len(paths))}
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=_repo_dir,
+                                       stderr=subprocess.DEVNULL).decode("utf-8").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def print_results(results: dict, previous: dict = None):
+    print("%-40s %12s %12s %10s %10s" % ("benchmark", "min [ms]", "median [ms]", "MB/s", "change"))
+    for name, result in results.items():
+        change = ""
+        if previous and name in previous:
+            change = "%+.1f%%" % (100 * (result["seconds_min"] / previous[name]["seconds_min"] - 1))
+        mb_per_s = "%.2f" % result["mb_per_s"] if result["mb_per_s"] else ""
+        print("%-40s %12.3f %12.3f %10s %10s" % (name, 1000 * result["seconds_min"],
+                                                 1000 * result["seconds_median"], mb_per_s, change))
+
+
+def main(args: argparse.Namespace):
+    results = micro_benchmarks(args)
+    if not args.skip_end_to_end:
+        results.update(end_to_end_benchmark(args))
+
+    report = {
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "params": {"seed": args.seed, "pages": args.pages, "repeat": args.repeat, "languages": args.languages},
+        "results": results,
+    }
+
+    previous = None
+    if args.compare:
+        with open(args.compare, "r") as file:
+            previous = json.load(file)["results"]
+    print_results(results, previous)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmark the preprocessing steps on a synthetic corpus.")
+    parser.add_argument("--output", type=str, default="", help="Write the results to this json file.")
+    parser.add_argument("--compare", type=str, default="", help="A json file of earlier results to compare to.")
+    parser.add_argument("--only", type=str, default="", help="Only run benchmarks with names containing this.")
+    parser.add_argument("--languages", type=str, nargs="+", default=LANGUAGES, choices=LANGUAGES)
+    parser.add_argument("--pages", type=int, default=20, help="The number of pages per synthetic document.")
+    parser.add_argument("--repeat", type=int, default=5, help="How often to run each benchmark.")
+    parser.add_argument("--seed", type=int, default=0, help="The seed for the synthetic corpus.")
+    parser.add_argument("--skip_end_to_end", action="store_true",
+                        help="Only run the microbenchmarks, e.g. if langid or the dictionaries are missing.")
+
+    main(parser.parse_args())
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import os
+import random
+
+# Small vocabularies are enough to exercise the preprocessing steps, the
+# long words are the ones most likely to be hyphenated at a line end.
+_vocabulary = {
+    "de": {
+        "words": ["der", "die", "das", "und", "mit", "von", "im", "auf", "einer", "wurde", "Tempel", "Stadt",
+                  "Kaiser", "Inschrift", "Grabung", "Heiligtum", "Römer", "Zeit", "Jahrhundert", "Mauer"],
+        "long_words": ["Ausgrabungsbericht", "Kaiserzeit", "Befestigungsanlage", "Bauinschrift",
+                       "Stadtgeschichte", "Keramikfunde", "Grabungskampagne", "Heiligtümer"],
+        "abbreviations": ["S.", "Jh.", "ca.", "Abb.", "vgl.", "Taf.", "Anm.", "n. Chr.", "v. Chr."],
+    },
+    "en": {
+        "words": ["the", "of", "and", "in", "was", "a", "temple", "city", "emperor", "inscription",
+                  "excavation", "sanctuary", "wall", "period", "century", "found", "built", "near"],
+        "long_words": ["fortification", "excavations", "inscriptions", "architectural", "chronological",
+                       "archaeological", "reconstruction", "settlement"],
+        "abbreviations": ["p.", "cf.", "fig.", "e.g.", "i.e.", "vol.", "no.", "ed."],
+    },
+    "fr": {
+        "words": ["le", "la", "les", "de", "et", "dans", "une", "temple", "ville", "empereur", "fouille",
+                  "sanctuaire", "mur", "époque", "siècle", "trouvé", "construit", "près"],
+        "long_words": ["fortification", "inscriptions", "architecturale", "chronologique",
+                       "archéologique", "reconstruction", "établissement", "découvertes"],
+        "abbreviations": ["p.", "cf.", "fig.", "op. cit.", "ibid.", "chap.", "éd."],
+    },
+    "it": {
+        "words": ["il", "la", "di", "e", "nel", "una", "tempio", "città", "imperatore", "iscrizione",
+                  "scavo", "santuario", "muro", "epoca", "secolo", "trovato", "costruito", "presso"],
+        "long_words": ["fortificazione", "iscrizioni", "architettonico", "cronologico", "archeologico",
+                       "ricostruzione", "insediamento", "ritrovamenti"],
+        "abbreviations": ["p.", "cfr.", "fig.", "tav.", "pag.", "cit.", "vol."],
+    },
+    "es": {
+        "words": ["el", "la", "de", "y", "en", "una", "templo", "ciudad", "emperador", "inscripción",
+                  "excavación", "santuario", "muro", "época", "siglo", "hallado", "construido", "cerca"],
+        "long_words": ["fortificación", "inscripciones", "arquitectónico", "cronológico", "arqueológico",
+                       "reconstrucción", "asentamiento", "hallazgos"],
+        "abbreviations": ["p.", "pág.", "fig.", "lám.", "cf.", "vol.", "ed."],
+    },
+}
+
+_roman_numerals = ["II", "III", "IV", "VI", "IX", "XII", "XIV", "XIX"]
+
+LANGUAGES = sorted(_vocabulary.keys())
+
+
+def _sentence(rng: random.Random, language: str) -> str:
+    vocabulary = _vocabulary[language]
+    words = []
+    for _ in range(rng.randint(6, 24)):
+        roll = rng.random()
+        if roll < 0.15:
+            words.append(rng.choice(vocabulary["long_words"]))
+        elif roll < 0.22:
+            words.append(rng.choice(vocabulary["abbreviations"]))
+        elif roll < 0.26:
+            # numbers and page references like "19.", "12f." or "XIV."
+            words.append(rng.choice([str(rng.randint(1, 999)) + ".", str(rng.randint(1, 400)) + "f.",
+                                     str(rng.randint(1, 400)) + "ff.", rng.choice(_roman_numerals) + "."]))
+        else:
+            words.append(rng.choice(vocabulary["words"]))
+    words[0] = words[0][0].upper() + words[0][1:]
+    return " ".join(words) + "."
+
+
+def _wrap_with_hyphens(rng: random.Random, text: str, width: int) -> [str]:
+    # wrap like a pdf extraction would, splitting some long words at the line end
+    lines = []
+    line = ""
+    for word in text.split(" "):
+        if len(line) + len(word) + 1 <= width:
+            line = f"{line} {word}" if line else word
+            continue
+        if len(word) > 8 and rng.random() < 0.6:
+            cut = rng.randint(3, len(word) - 3)
+            lines.append(f"{line} {word[:cut]}-" if line else f"{word[:cut]}-")
+            line = word[cut:]
+        else:
+            lines.append(line)
+            line = word
+    if line:
+        lines.append(line)
+    return lines
+
+
+def generate_document(seed: int, language: str, pages: int = 10, lines_per_page: int = 40, width: int = 70) -> str:
+    """
+    Generate the text of a document as it might come out of the extraction,
+    with hyphenated line ends, abbreviations, numbers, page numbers and
+    irregular whitespace. The same arguments always yield the same text.
+    """
+    rng = random.Random(f"{seed}:{language}")
+    result = []
+    for page in range(1, pages + 1):
+        text = " ".join(_sentence(rng, language) for _ in range(lines_per_page // 2))
+        lines = _wrap_with_hyphens(rng, text, width)[:lines_per_page]
+        for line in lines:
+            if rng.random() < 0.05:
+                line = line.replace(" ", "   ", 1)
+            result.append(line)
+            if rng.random() < 0.03:
+                result.append("   ")
+        # a page number and a form feed, like mutool produces them
+        result.append("")
+        result.append(f"   {page}   ")
+        result.append("\f")
+    return "\n".join(result)
+
+
+def generate_corpus(directory: str, documents: int = 10, pages: int = 10, seed: int = 0) -> [str]:
+    """
+    Write a deterministic multi-language corpus of text files to the directory.
+    :return: The paths of the written files
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for idx in range(documents):
+        language = LANGUAGES[idx % len(LANGUAGES)]
+        path = os.path.join(directory, f"synthetic_{idx:04d}_{language}.txt")
+        with open(path, "w") as file:
+            file.write(generate_document(seed + idx, language, pages=pages))
+        paths.append(path)
+    return paths
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Write a deterministic synthetic corpus for benchmarks.")
+    parser.add_argument("directory", type=str, help="The directory to write the text files to.")
+    parser.add_argument("--documents", type=int, default=10, help="The number of documents to write.")
+    parser.add_argument("--pages", type=int, default=10, help="The number of pages per document.")
+    parser.add_argument("--seed", type=int, default=0, help="Different seeds give different corpora.")
+    args = parser.parse_args()
+
+    generate_corpus(args.directory, args.documents, args.pages, args.seed)
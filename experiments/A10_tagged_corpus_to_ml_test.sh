@@ -22,11 +22,11 @@ do
 
   # prepare a table of the input texts words enriched with pos-tags
   csv="${CHRONOI_HOME}/pilotkorpus/out/A10_ml_tagged/${lang}.csv"
-  $CHRONOI_HOME/pilotkorpus-code/postprocessing/docs_to_sentences_table.py "${CHRONOI_HOME}/pilotkorpus/out/A10_ml_tagged/bronze/${lang}" > "$csv"
+  (cd "$CHRONOI_HOME/pilotkorpus-code" && python3 -m postprocessing.docs_to_sentences_table "${CHRONOI_HOME}/pilotkorpus/out/A10_ml_tagged/bronze/${lang}") > "$csv"
 
   # prepare a table with the literature tags only
   csv="${CHRONOI_HOME}/pilotkorpus/out/A10_ml_tagged/${lang}-lit.csv"
-  $CHRONOI_HOME/pilotkorpus-code/postprocessing/docs_to_sentences_table.py --literature "${CHRONOI_HOME}/pilotkorpus/out/A10_ml_tagged/bronze/${lang}" > "$csv"
+  (cd "$CHRONOI_HOME/pilotkorpus-code" && python3 -m postprocessing.docs_to_sentences_table --literature "${CHRONOI_HOME}/pilotkorpus/out/A10_ml_tagged/bronze/${lang}") > "$csv"
 done
 
 # Remove the "B-" and "I-"prefixes from NER-tags
@@ -37,7 +37,7 @@ done
 out_dir="${bronze_dir}/en-timex"
 docker exec -it chronoi-pilot python3 postprocessing/prepare_tempeval.py --a06tagged-no-window "${tagged_dir}/en/*.xml" "$out_dir"
 csv="${CHRONOI_HOME}/pilotkorpus/out/A10_ml_tagged/en-timex.csv"
-$CHRONOI_HOME/pilotkorpus-code/postprocessing/docs_to_sentences_table.py "${CHRONOI_HOME}/pilotkorpus/out/A10_ml_tagged/bronze/en-timex" > "$csv"
+(cd "$CHRONOI_HOME/pilotkorpus-code" && python3 -m postprocessing.docs_to_sentences_table "${CHRONOI_HOME}/pilotkorpus/out/A10_ml_tagged/bronze/en-timex") > "$csv"
 
 # Example evaluation using the machine learning container
 # cp $CHRONOI_HOME/pilotkorpus/out/A10_ml_tagged/*.csv ~/Downloads/entity-annotated-corpus
@@ -3,28 +3,113 @@
 
 from __future__ import annotations
 
+import array
 import bs4
+import collections
+import collections.abc
+import html.parser
+import mmap
+import os
+
+# A tag in a line with its lower case name, its attributes and the offsets of
+# its text in the line's text (the end is exclusive).
+TagSpan = collections.namedtuple("TagSpan", ["name", "attrs", "start", "end"])
+
+
+class _LineParser(html.parser.HTMLParser):
+    """
+    Parses the lines of a document with the same parser and keeps only the
+    text and the tags of the current line. Every line is read on its own, as
+    it was when each line was given to BeautifulSoup's lxml parser, so the
+    lines can be parsed in any order: Tags still open at the end of a line are closed there, end
+    tags without a start tag in the line are ignored and whitespace before
+    the first text or tag (even an unmatched end tag) of a line is dropped.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self._text = []
+        self._length = 0
+        self._started = False
+        # the tags in the order of their start tags as [name, attrs, start, end]
+        self._tags = []
+        self._open = []
+
+    def handle_starttag(self, tag, attrs):
+        self._started = True
+        self._tags.append([tag, {k: v if v is not None else "" for k, v in reversed(attrs)}, self._length, None])
+        self._open.append(self._tags[-1])
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        self._open.pop()[3] = self._length
+
+    def handle_endtag(self, tag):
+        self._started = True
+        for idx in range(len(self._open) - 1, -1, -1):
+            if self._open[idx][0] == tag:
+                for open_tag in self._open[idx:]:
+                    open_tag[3] = self._length
+                del self._open[idx:]
+                return
+
+    def handle_data(self, data):
+        if not self._started:
+            data = data.lstrip()
+            if not data:
+                return
+            self._started = True
+        self._text.append(data)
+        self._length += len(data)
+
+    def parse_line(self, line: str) -> (str, [TagSpan]):
+        self.feed(line)
+        self.close()
+        for open_tag in self._open:
+            open_tag[3] = self._length
+        result = "".join(self._text), [TagSpan(*t) for t in self._tags]
+        self.reset()
+        self._text, self._length, self._started, self._tags, self._open = [], 0, False, [], []
+        return result
+
+
+def parse_lines(lines):
+    """
+    Parse the lines of a document in a single pass.
+    :return: The line, its text without the tags and its tags for each line
+    """
+    parser = _LineParser()
+    for line in lines:
+        text, tags = parser.parse_line(line)
+        yield line, text, tags
 
 
 class DocumentLine:
 
-    def __init__(self, doc: Document, line: str, previous: DocumentLine = None):
+    def __init__(self, doc: Document, line: str, text: str, tags: [TagSpan], previous: DocumentLine = None,
+                 idx: int = 0, start: int = 0):
+        """
+        :param previous: The line before this one, which determines the index
+                         and start in the document's text, if given
+        """
         self.doc = doc
         self.line = line
-        self.idx = previous.idx + 1 if previous else 0
-        self._xml_repr = self._build_xml_repr(line)
-        self.length = len(self._xml_repr.text)
-        self.start = previous.end + 1 if previous else 0
+        self.text = text
+        self.tags = tags
+        self.idx = previous.idx + 1 if previous else idx
+        self.length = len(text)
+        self.start = previous.end + 1 if previous else start
         self.end = self.start + self.length - 1
 
-    @property
-    def text(self):
-        return self._xml_repr.text
-
     @property
     def is_gold(self):
         return self.doc.is_gold
 
+    @property
+    def _xml_repr(self) -> bs4.BeautifulSoup:
+        # only built when needed to walk the tags' contents
+        return self._build_xml_repr(self.line)
+
     def _bounds_check_text_idx(self, idx: int) -> int:
         if idx < 0:
             idx = 0
@@ -38,7 +123,7 @@ class DocumentLine:
         return self.text[start:end]
 
     def get_tags_with_name(self, tag_name: str):
-        tags = self._xml_repr.find_all(tag_name)
+        tags = [t for t in self.tags if t.name == tag_name]
         return list(map(lambda t: TagInContext(tag=t, doc_line=self), tags))
 
     @staticmethod
@@ -46,24 +131,98 @@ class DocumentLine:
         return bs4.BeautifulSoup(line, "lxml")
 
 
+class LazyLines(collections.abc.Sequence):
+    """
+    The lines of a memory-mapped document file, that are only parsed when
+    they are accessed. The parsed lines are kept in a bounded LRU cache, so
+    the memory needed does not grow with the size of the document, apart
+    from an index of 16 bytes per line. Lines are split at newlines only.
+    The start of a line in the document's text depends on the lengths of
+    all lines before it, so the lines up to an accessed line are parsed
+    once, which costs nothing extra when walking the lines in order.
+    """
+
+    def __init__(self, doc: Document, path: str, cache_size: int = 1024):
+        self.doc = doc
+        self.cache_size = cache_size
+        with open(path, "rb") as file:
+            self._data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(file.fileno()).st_size \
+                else b""
+        # the byte offset of each line, followed by the end of the data
+        self._offsets = array.array("q", [0])
+        idx = self._data.find(b"\n")
+        while idx >= 0:
+            self._offsets.append(idx + 1)
+            idx = self._data.find(b"\n", idx + 1)
+        if self._offsets[-1] < len(self._data):
+            self._offsets.append(len(self._data))
+        # the start in the document's text of the lines parsed so far and of
+        # the line after them
+        self._text_starts = array.array("q", [0])
+        self._cache = collections.OrderedDict()
+        self._parser = _LineParser()
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError("line index out of range")
+        result = self._cache.get(idx, None)
+        if result is not None:
+            self._cache.move_to_end(idx)
+            return result
+        while len(self._text_starts) <= idx:
+            self._parse(len(self._text_starts) - 1)
+        return self._parse(idx)
+
+    def _parse(self, idx: int) -> DocumentLine:
+        line = self._data[self._offsets[idx]:self._offsets[idx + 1]].decode("utf-8")
+        # like reading the file in text mode
+        line = line.replace("\r\n", "\n")
+        text, tags = self._parser.parse_line(line)
+        result = DocumentLine(doc=self.doc, line=line, text=text, tags=tags, idx=idx, start=self._text_starts[idx])
+        if len(self._text_starts) == idx + 1:
+            self._text_starts.append(result.start + result.length)
+        self._cache[idx] = result
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return result
+
+
 class Document:
 
-    def __init__(self, path: str, basename: str = "", is_gold: bool = False):
+    def __init__(self, path: str, basename: str = "", is_gold: bool = False, lazy: bool = False,
+                 cache_size: int = 1024, parsed_lines=None):
+        """
+        :param lazy: Memory-map the file and only parse the lines that are
+                     accessed, keeping the last cache_size of them, cf. LazyLines
+        :param parsed_lines: The lines as parse_lines() gives them, to use
+                             instead of reading the file (e.g. from a cache)
+        """
         self.path = path
         self.basename = basename
         self.is_gold = is_gold
-        self.lines = self._read_lines()
+        if parsed_lines is not None:
+            self.lines = self._lines_to_doc_lines(parsed_lines)
+        else:
+            self.lines = LazyLines(self, path, cache_size) if lazy else self._read_lines()
 
     def _read_lines(self) -> [DocumentLine]:
         with open(self.path) as f:
-            lines = f.read().splitlines(keepends=True)
-        return self._lines_to_doc_lines(lines)
+            # lines as splitlines(keepends=True) would give them
+            lines = (l for line in f for l in line.splitlines(keepends=True))
+            return self._lines_to_doc_lines(parse_lines(lines))
 
-    def _lines_to_doc_lines(self, lines: [str]) -> [DocumentLine]:
+    def _lines_to_doc_lines(self, parsed_lines) -> [DocumentLine]:
         result = []
         previous = None
-        for line in lines:
-            doc_line = DocumentLine(doc=self, line=line, previous=previous)
+        for line, text, tags in parsed_lines:
+            doc_line = DocumentLine(doc=self, line=line, text=text, tags=tags, previous=previous)
             result.append(doc_line)
             previous = doc_line
         return result
@@ -74,23 +233,10 @@ class Document:
 
 class TagInContext:
 
-    def __init__(self, tag: bs4.Tag, doc_line: DocumentLine):
+    def __init__(self, tag: TagSpan, doc_line: DocumentLine):
         self.tag = tag
         self.doc_line = doc_line
-        self._span = self._determine_line_pos()
-
-    def _determine_line_pos(self) -> range:
-        start = self._count_chars_preceding(self.tag)
-        return range(start, start + len(self.text))
-
-    def _count_chars_preceding(self, tag: bs4.Tag, count: int = 0) -> int:
-        previous = tag.previous
-        if type(previous) == bs4.NavigableString:
-            return self._count_chars_preceding(previous, count + len(previous))
-        elif previous is None:
-            return count
-        else:
-            return self._count_chars_preceding(previous, count)
+        self._span = range(tag.start, tag.end)
 
     @property
     def doc(self) -> Document:
@@ -102,7 +248,7 @@ class TagInContext:
 
     @property
     def text(self) -> str:
-        return self.tag.text
+        return self.doc_line.text[self.tag.start:self.tag.end]
 
     @property
     def line(self) -> str:
@@ -138,4 +284,46 @@ class TagInContext:
         return self.tag.attrs.get(k, "")
 
     def overlaps(self, other: TagInContext) -> bool:
-        return bool(set(self._span).intersection(set(other._span)))
+        return max(self._span.start, other._span.start) < min(self._span.stop, other._span.stop)
+
+
+# TESTS
+
+def _bs4_parse_line(line: str, names: [str]) -> (str, [TagSpan]):
+    # how a line was read before, with a soup of its own
+    soup = DocumentLine._build_xml_repr(line)
+
+    def chars_preceding(tag: bs4.Tag) -> int:
+        count = 0
+        previous = tag.previous
+        while previous is not None:
+            if type(previous) == bs4.NavigableString:
+                count += len(previous)
+            previous = previous.previous
+        return count
+
+    tags = [TagSpan(t.name, dict(t.attrs), chars_preceding(t), chars_preceding(t) + len(t.text))
+            for t in soup.find_all(names)]
+    return soup.text, tags
+
+
+def test_line_parser_same_as_bs4():
+    lines = [
+        '<s>On <TIMEX3 tid="t1" type="DATE" value="1998">May 1998</TIMEX3> it rained.</s>\n',
+        '   <s>  leading blanks <temponym type="TEMPONYM">the war</temponym></s>\n',
+        'text &amp; &lt;entities&gt; &unknown; &#228; <dne type="person">Anna &amp; Bob</dne>\n',
+        '<s>nested <temponym tid="t2"><dne type="place">Rome</dne> times</temponym> end</s>\n',
+        '</s> an unmatched end tag <timex3 tid="t3">today</timex3>\n',
+        '<s>unclosed <timex3 tid="t4">tag at the end\n',
+        '<literature>A. Author: <dne>Title</dne></literature> (1999)\n',
+        '<timex3 tid="t5" value="" functionInDocument="NONE">then</timex3><timex3 tid="t6">now</timex3>\n',
+        '<s><annotation-window>window <timex3 tid="t7">1.1.2000</timex3></annotation-window></s>\n',
+        'no tags at all\n',
+        '\n',
+        'the last line without a newline',
+    ]
+    names = ["s", "timex3", "temponym", "dne", "literature", "annotation-window"]
+    # one parser for all lines, as when reading a document
+    parser = _LineParser()
+    for line in lines:
+        assert parser.parse_line(line) == _bs4_parse_line(line, names), line
@@ -5,7 +5,6 @@ import argparse
 import bs4
 import csv
 import glob
-import langdetect
 import os
 import sys
 import treetaggerwrapper
@@ -18,6 +17,11 @@ except ImportError:
     # Import for pytest as that will have a different path
     from .corpus_reading import Document
 
+# the language identification and the manifest are shared with the
+# preprocessing, so this is run as a module from the repository's directory
+from preprocessing.language_identification import LanguageIdentification
+from preprocessing.manifest import Manifest
+
 # TODO: Remove
 os.environ['TAGDIR'] = "/home/david/Documents/Projekte/chronoi/tree-tagger"
 
@@ -40,6 +44,10 @@ taggers = {
 
 csv_writer = None
 
+# the same identification as in the preprocessing, for documents that the
+# preprocessing's manifest does not know
+_language_identification = LanguageIdentification(languages.keys())
+
 
 # The default function tag function using all possible ner values
 def _tag_to_ner_name_default(tag: bs4.Tag, default="") -> str:
@@ -200,6 +208,15 @@ def _handle_sentence(sentence: bs4.Tag, lang: str, sentence_no: int) -> [(str, s
     return result
 
 
+def _language_of(doc: Document, manifest: Manifest) -> str:
+    # the documents keep the basename of their input file, only the extension may differ
+    name = os.path.splitext(doc.basename)[0]
+    lang = manifest.value(name, "language") if manifest else None
+    if lang is None:
+        lang = _language_identification.identify([line.text for line in doc.lines])
+    return lang
+
+
 def _get_files_from_arg(arg_value: str):
     if os.path.isdir(arg_value):
         return glob.glob(os.path.join(arg_value, "*"))
@@ -221,6 +238,7 @@ def main(args: argparse.Namespace):
 
 
     files = _get_files_from_arg(args.input)
+    manifest = Manifest(args.preprocessing_dir) if args.preprocessing_dir else None
 
     _print_csv_header()
 
@@ -229,8 +247,7 @@ def main(args: argparse.Namespace):
     for file in files:
         basename = os.path.basename(file)
         doc = Document(path=file, basename=basename)
-        text = " ".join([line.text for line in doc.lines])
-        lang = langdetect.detect(text)
+        lang = _language_of(doc, manifest)
 
         for line in doc.lines:
             result = _handle_sentence(line._xml_repr, lang=lang, sentence_no=sentence_no)
@@ -243,7 +260,8 @@ if __name__ == '__main__':
 
     description = """
         Output a csv file with the sentences in the text, containing POS-Tags as well as NER-tags
-        according to the xml tags used.
+        according to the xml tags used. Run this as 'python3 -m postprocessing.docs_to_sentences_table'
+        from the repository's directory.
     """
     description = "".join(map(str.lstrip, description.splitlines()))
 
@@ -251,6 +269,9 @@ if __name__ == '__main__':
     parser.add_argument("input", type=str, help="A directory or single file to use as input.")
     parser.add_argument("--literature", action="store_true", help="If set, only mark <literature/> contents as nes.")
     parser.add_argument("--nes-only", action="store_true", help="If set, only mark named entity contents, not time expressions as nes.")
+    parser.add_argument("--preprocessing-dir", type=str, default="",
+                        help="The output directory of preprocessing.py, to read the languages of the documents from "
+                             "its manifest instead of identifying them again.")
     parser.add_argument("--timex-only", action="store_true", help="If set, only mark time expression contents, not other nes.")
 
     main(parser.parse_args())
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import struct
+
+import numpy as np
+
+try:
+    from corpus_reading import Document, TagSpan
+    import corpus_reading
+except ImportError:
+    # Import for pytest as that will have a different path
+    from .corpus_reading import Document, TagSpan
+    from . import corpus_reading
+
+# File layout: the magic bytes, the length of the json metadata, the json,
+# the int64 arrays of the line and text offsets (line count + 1 each) and of
+# the tags' line, start, end and name code (tag count each) and at last the
+# utf-8 encoded lines, texts and the json list of the tags' attributes.
+_MAGIC = b"CHRPARSE"
+_HEADER = struct.Struct("<8sQ")
+
+
+def _hash_file(path: str) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+# documents parsed by another version of the parser are parsed again
+_parser_version = _hash_file(corpus_reading.__file__)
+
+
+class DocumentCache:
+    """
+    Keeps the parsed lines of documents in a directory, one file per
+    document path. An entry is used if the document's size and modification
+    time are unchanged, or else if its content hash is, so only changed
+    documents are parsed again.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+
+    def _entry_path(self, path: str) -> str:
+        name = hashlib.sha256(os.path.abspath(path).encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.directory, f"{name}.doc")
+
+    def document(self, path: str, basename: str = "", is_gold: bool = False) -> Document:
+        stat = os.stat(path)
+        entry_path = self._entry_path(path)
+        meta, parsed_lines = _read_entry(entry_path) if os.path.isfile(entry_path) else (None, None)
+        key = {"path": os.path.abspath(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+               "parser": _parser_version}
+        if meta and all(meta.get(k) == v for k, v in key.items()):
+            self.hits += 1
+            return Document(path=path, basename=basename, is_gold=is_gold, parsed_lines=parsed_lines)
+
+        content_hash = _hash_file(path)
+        if meta and meta.get("hash") == content_hash and meta.get("parser") == _parser_version:
+            # e.g. a copied or touched file, only the key is renewed
+            self.hits += 1
+            doc = Document(path=path, basename=basename, is_gold=is_gold, parsed_lines=parsed_lines)
+        else:
+            self.misses += 1
+            doc = Document(path=path, basename=basename, is_gold=is_gold)
+        _write_entry(entry_path, dict(key, hash=content_hash), doc)
+        return doc
+
+
+def _write_entry(entry_path: str, meta: dict, doc: Document):
+    names = {}
+    tag_columns = [[], [], [], []]
+    attrs = []
+    for line in doc.lines:
+        for tag in line.tags:
+            values = (line.idx, tag.start, tag.end, names.setdefault(tag.name, len(names)))
+            for column, value in zip(tag_columns, values):
+                column.append(value)
+            attrs.append(tag.attrs)
+    blobs = ["".join(line.line for line in doc.lines).encode("utf-8"),
+             "".join(line.text for line in doc.lines).encode("utf-8"),
+             json.dumps(attrs, ensure_ascii=False).encode("utf-8")]
+    meta = dict(meta, names=list(names.keys()), lines=len(doc.lines), tags=len(attrs),
+                blobs=[len(blob) for blob in blobs])
+    meta_json = json.dumps(meta).encode("utf-8")
+
+    os.makedirs(os.path.dirname(os.path.abspath(entry_path)), exist_ok=True)
+    tmp_path = f"{entry_path}.part"
+    with open(tmp_path, "wb") as file:
+        file.write(_HEADER.pack(_MAGIC, len(meta_json)))
+        file.write(meta_json)
+        for attr in ("line", "text"):
+            lengths = [len(getattr(line, attr)) for line in doc.lines]
+            file.write(np.concatenate(([0], np.cumsum(lengths, dtype="<i8"))).astype("<i8").tobytes())
+        for column in tag_columns:
+            file.write(np.array(column, dtype="<i8").tobytes())
+        for blob in blobs:
+            file.write(blob)
+    os.replace(tmp_path, entry_path)
+
+
+def _read_entry(entry_path: str) -> (dict, list):
+    """
+    :return: The entry's metadata and its lines as parse_lines() gives
+             them, (None, None) for a file that is not an entry or can not
+             be decoded (e.g. a truncated one), so the document is parsed again
+    """
+    with open(entry_path, "rb") as file:
+        data = file.read()
+    try:
+        return _decode_entry(data)
+    except (struct.error, ValueError, KeyError, IndexError, TypeError):
+        # the json and utf-8 decoding errors are ValueErrors, too
+        return None, None
+
+
+def _decode_entry(data: bytes) -> (dict, list):
+    if len(data) < _HEADER.size:
+        return None, None
+    magic, meta_length = _HEADER.unpack_from(data, 0)
+    if magic != _MAGIC:
+        return None, None
+    pos = _HEADER.size + meta_length
+    meta = json.loads(data[_HEADER.size:pos].decode("utf-8"))
+
+    def read_array(count: int) -> list:
+        nonlocal pos
+        result = np.frombuffer(data, dtype="<i8", count=count, offset=pos)
+        pos += 8 * count
+        return result.tolist()
+
+    line_offsets = read_array(meta["lines"] + 1)
+    text_offsets = read_array(meta["lines"] + 1)
+    tag_lines, starts, ends, name_codes = (read_array(meta["tags"]) for _ in range(4))
+    blobs = []
+    for length in meta["blobs"]:
+        blobs.append(data[pos:pos + length].decode("utf-8"))
+        pos += length
+    if pos != len(data):
+        raise ValueError(f"Entry of {len(data)} bytes, expected {pos}")
+    raw, texts, attrs = blobs[0], blobs[1], json.loads(blobs[2])
+    names = meta["names"]
+
+    tags_by_line = [[] for _ in range(meta["lines"])]
+    for idx, line_idx in enumerate(tag_lines):
+        tags_by_line[line_idx].append(TagSpan(names[name_codes[idx]], attrs[idx], starts[idx], ends[idx]))
+    parsed_lines = [(raw[line_offsets[idx]:line_offsets[idx + 1]], texts[text_offsets[idx]:text_offsets[idx + 1]],
+                     tags_by_line[idx]) for idx in range(meta["lines"])]
+    return meta, parsed_lines
+
+
+# TESTS
+
+def _lines_and_tags(doc: Document) -> list:
+    return [(line.line, line.text, line.tags) for line in doc.lines]
+
+
+def test_document_cache_hit_and_miss():
+    import tempfile
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "doc.txt")
+        with open(path, "w") as file:
+            file.write('<s>On <timex3 tid="t1" value="1998">May 1998</timex3> it rained.</s>\n'
+                       'ä line &amp; <dne type="person">Anna</dne> without tags of its own\n\n')
+        cache = DocumentCache(os.path.join(tmp_dir, "cache"))
+        expected = _lines_and_tags(Document(path=path))
+
+        assert _lines_and_tags(cache.document(path)) == expected
+        assert (cache.hits, cache.misses) == (0, 1)
+        assert _lines_and_tags(cache.document(path)) == expected
+        assert (cache.hits, cache.misses) == (1, 1)
+
+        # same content, but another modification time: a hit by the content hash
+        os.utime(path, ns=(0, 0))
+        assert _lines_and_tags(cache.document(path)) == expected
+        assert (cache.hits, cache.misses) == (2, 1)
+
+        with open(path, "a") as file:
+            file.write('<timex3 tid="t2">today</timex3>\n')
+        changed = cache.document(path)
+        assert (cache.hits, cache.misses) == (2, 2)
+        assert _lines_and_tags(changed) == _lines_and_tags(Document(path=path))
+        assert _lines_and_tags(cache.document(path)) == _lines_and_tags(changed)
+        assert (cache.hits, cache.misses) == (3, 2)
+
+
+def test_document_cache_corrupt_entries():
+    import tempfile
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "doc.txt")
+        with open(path, "w") as file:
+            file.write('<s>On <timex3 tid="t1" value="1998">May 1998</timex3> it rained.</s>\n')
+        cache = DocumentCache(os.path.join(tmp_dir, "cache"))
+        expected = _lines_and_tags(cache.document(path))
+        entry_path = cache._entry_path(path)
+        with open(entry_path, "rb") as file:
+            entry = file.read()
+
+        corrupt_entries = [
+            entry[:len(entry) // 2],
+            entry[:_HEADER.size - 1],
+            entry + b"\0",
+            b"NOTCACHE" + entry[8:],
+            _HEADER.pack(_MAGIC, len(entry)) + entry[_HEADER.size:],
+            _HEADER.pack(_MAGIC, 3) + b"{x}" + entry[_HEADER.size:],
+        ]
+        for idx, corrupt_entry in enumerate(corrupt_entries):
+            with open(entry_path, "wb") as file:
+                file.write(corrupt_entry)
+            assert _read_entry(entry_path) == (None, None), idx
+            misses = cache.misses
+            assert _lines_and_tags(cache.document(path)) == expected, idx
+            assert cache.misses == misses + 1, idx
+            # the entry was written anew
+            with open(entry_path, "rb") as file:
+                assert file.read() == entry, idx
@@ -10,6 +10,7 @@ import glob
 import os.path
 
 from corpus_reading import TagInContext, Document, DocumentLine
+from document_cache import DocumentCache
 
 
 class TaskType(enum.Enum):
@@ -286,9 +287,17 @@ class PrintUtil:
         csv_writer.writerow(row)
 
 
-def process_files(gold_file: str, system_file: str, basename: str) -> [Result]:
-    gold_doc = Document(path=gold_file, basename=basename, is_gold=True)
-    system_doc = Document(path=system_file, basename=basename, is_gold=False)
+def read_document(path: str, basename: str, is_gold: bool, lazy: bool = False,
+                  cache: DocumentCache = None) -> Document:
+    if cache and not lazy:
+        return cache.document(path=path, basename=basename, is_gold=is_gold)
+    return Document(path=path, basename=basename, is_gold=is_gold, lazy=lazy)
+
+
+def process_files(gold_file: str, system_file: str, basename: str, lazy: bool = False,
+                  cache: DocumentCache = None) -> [Result]:
+    gold_doc = read_document(gold_file, basename, is_gold=True, lazy=lazy, cache=cache)
+    system_doc = read_document(system_file, basename, is_gold=False, lazy=lazy, cache=cache)
     comparator = Comparator(gold_doc=gold_doc, system_doc=system_doc, tag_name="timex3", attributes=["type", "value"])
     return comparator.compare()
 
@@ -314,6 +323,7 @@ def main(args):
     gold_files = get_files_from_arg(args.gold)
     system_files = get_files_from_arg(args.system)
 
+    cache = DocumentCache(args.cache_dir) if args.cache_dir else None
     results = []
     for system_file in system_files:
         basename = basename_without_extension(system_file)
@@ -322,7 +332,8 @@ def main(args):
         except StopIteration:
             print("WARN: No matching gold file for: " + basename)
             continue
-        results += process_files(gold_file=gold_file, system_file=system_file, basename=basename)
+        results += process_files(gold_file=gold_file, system_file=system_file, basename=basename,
+                                 lazy=args.lazy_documents, cache=cache)
 
     if args.only_with_attr:
         attr, value = args.only_with_attr.split(":", maxsplit=1)
@@ -378,5 +389,10 @@ if __name__ == '__main__':
                         help="Instead of evaluating every task only print some from relaxed matching and normalisation accuracy.")
     parser.add_argument("--print_results_csv", action="store_true",
                         help="Instead of printing evaluation results, output detailed csv records for each decision.")
+    parser.add_argument("--lazy_documents", action="store_true",
+                        help="Memory-map the files and only keep recently used lines parsed, for very large files.")
+    parser.add_argument("--cache_dir", type=str, default="",
+                        help="A directory to keep the parsed files in, so that later runs only parse changed files "
+                             "again (not with --lazy_documents).")
 
     main(parser.parse_args())
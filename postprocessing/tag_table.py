@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from __future__ import annotations
+
+import argparse
+import glob
+import os
+
+import numpy as np
+
+try:
+    from corpus_reading import Document
+except ImportError:
+    # Import for pytest as that will have a different path
+    from .corpus_reading import Document
+
+# the attributes that get a column of their own, by column name
+ATTRIBUTES = {
+    "tid": "tid",
+    "type": "type",
+    "value": "value",
+    "literature_time": "literature-time",
+}
+
+# the columns of the offsets, all ends are exclusive
+_OFFSET_COLUMNS = ["line", "start_in_line", "end_in_line", "start_in_doc", "end_in_doc"]
+
+# the columns of codes into a list of strings
+_INTERNED_COLUMNS = ["doc", "name"] + list(ATTRIBUTES.keys())
+
+
+class _Interning:
+
+    def __init__(self):
+        # the empty string (i.e. a missing attribute) is always code 0
+        self.codes = {"": 0}
+
+    def code(self, value: str) -> int:
+        result = self.codes.get(value, None)
+        if result is None:
+            result = len(self.codes)
+            self.codes[value] = result
+        return result
+
+    def values(self) -> np.ndarray:
+        return np.array(list(self.codes.keys()), dtype=object)
+
+
+class TagTable:
+    """
+    All tags of some documents as columns of numpy arrays, one row per tag
+    in the order of the documents and of the tags' start in them.
+    The document, the tag name and the attributes are interned: Their column
+    holds codes into the column's array of strings in vocabularies, where the
+    empty string has code 0. Counting, filtering and distributions are then
+    vectorized operations, e.g.
+        table.where(name="timex3", type="TEMPONYM").counts("value")
+    """
+
+    def __init__(self, columns: {str: np.ndarray}, vocabularies: {str: np.ndarray}):
+        self.columns = columns
+        self.vocabularies = vocabularies
+
+    def __len__(self):
+        return len(self.columns["line"])
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        return self.columns[column]
+
+    def strings(self, column: str) -> np.ndarray:
+        """
+        :return: The decoded values of an interned column
+        """
+        return self.vocabularies[column][self.columns[column]]
+
+    def code_of(self, column: str, value: str) -> int:
+        """
+        :return: The code of the value in an interned column, -1 if it does not occur
+        """
+        matches = np.flatnonzero(self.vocabularies[column] == value)
+        return int(matches[0]) if len(matches) else -1
+
+    def mask(self, **values: str) -> np.ndarray:
+        """
+        :param values: Values of interned columns, that a row must all have
+        :return: A boolean array selecting the rows
+        """
+        result = np.ones(len(self), dtype=bool)
+        for column, value in values.items():
+            result &= self.columns[column] == self.code_of(column, value)
+        return result
+
+    def filter(self, mask: np.ndarray) -> TagTable:
+        return TagTable({name: column[mask] for name, column in self.columns.items()}, self.vocabularies)
+
+    def where(self, **values: str) -> TagTable:
+        return self.filter(self.mask(**values))
+
+    def counts(self, column: str) -> [(str, int)]:
+        """
+        :return: The values of an interned column with their number of rows,
+                 the most frequent first
+        """
+        counts = np.bincount(self.columns[column], minlength=len(self.vocabularies[column]))
+        order = np.argsort(-counts, kind="stable")
+        return [(self.vocabularies[column][code], int(counts[code])) for code in order if counts[code] > 0]
+
+    @staticmethod
+    def from_documents(documents: [Document]) -> TagTable:
+        offsets = {name: [] for name in _OFFSET_COLUMNS}
+        codes = {name: [] for name in _INTERNED_COLUMNS}
+        interning = {name: _Interning() for name in _INTERNED_COLUMNS}
+        for doc in documents:
+            doc_code = interning["doc"].code(doc.basename)
+            for line in doc.lines:
+                for tag in line.tags:
+                    for name, value in zip(_OFFSET_COLUMNS, (line.idx, tag.start, tag.end,
+                                                             line.start + tag.start, line.start + tag.end)):
+                        offsets[name].append(value)
+                    codes["doc"].append(doc_code)
+                    codes["name"].append(interning["name"].code(tag.name))
+                    for column, attr in ATTRIBUTES.items():
+                        codes[column].append(interning[column].code(tag.attrs.get(attr, "")))
+        columns = {name: np.array(values, dtype=np.int64) for name, values in offsets.items()}
+        columns.update({name: np.array(values, dtype=np.int32) for name, values in codes.items()})
+        return TagTable(columns, {name: i.values() for name, i in interning.items()})
+
+
+def read_tag_table(path: str, lazy: bool = False) -> TagTable:
+    """
+    Build the tag table of a directory of annotated documents or of a single
+    one. Each document is identified by its file name.
+    """
+    paths = sorted(glob.glob(os.path.join(path, "*"))) if os.path.isdir(path) else [path]
+    documents = (Document(path=p, basename=os.path.basename(p), lazy=lazy) for p in paths if os.path.isfile(p))
+    return TagTable.from_documents(documents)
+
+
+def main(args: argparse.Namespace):
+    table = read_tag_table(args.input, lazy=args.lazy_documents)
+    conditions = dict(c.split(":", maxsplit=1) for c in args.where)
+    if args.name:
+        conditions["name"] = args.name
+    table = table.where(**conditions)
+
+    print(f"{len(table)} tags")
+    for value, count in table.counts(args.count):
+        print("%7d %s" % (count, value))
+
+
+if __name__ == '__main__':
+
+    description = """
+        Read all tags of a directory of annotated files into a table and count the values of a column
+        for the tags matching some conditions, e.g. the values of temponyms with:
+        '--name timex3 --where type:TEMPONYM --count value'
+    """
+    description = "".join(map(str.lstrip, description.splitlines()))
+
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("input", type=str, help="A directory or single file to use as input.")
+    parser.add_argument("--name", type=str, default="", help="Only count tags with this (lower case) name.")
+    parser.add_argument("--where", type=str, nargs="*", default=[],
+                        help="Format: 'column:value'. Only count tags with these values, the columns are 'doc', "
+                             "'name' and " + ", ".join(f"'{c}'" for c in ATTRIBUTES.keys()) + ".")
+    parser.add_argument("--count", type=str, default="doc", choices=_INTERNED_COLUMNS,
+                        help="The column whose values are counted.")
+    parser.add_argument("--lazy_documents", action="store_true",
+                        help="Memory-map the files and only keep recently used lines parsed, for very large files.")
+
+    args = parser.parse_args()
+    for condition in args.where:
+        column, separator, _ = condition.partition(":")
+        if not separator or column not in _INTERNED_COLUMNS:
+            parser.error(f"argument --where: invalid condition '{condition}', expected 'column:value' with one of "
+                         f"the columns: {', '.join(_INTERNED_COLUMNS)}")
+    main(args)
@@ -3,15 +3,31 @@
 
 import argparse
 import glob
-import langid
+import itertools
+import multiprocessing
 import os
 import random
 import re
+import signal
+import sys
+import time
+import traceback
 
 
 from preprocessing import cleaning
+from preprocessing import language_identification
+from preprocessing import tokenization
+from preprocessing.extraction_cache import ExtractionCache
 from preprocessing.file_scheme import FileScheme
-from preprocessing.text_extraction import TextExtractor
+from preprocessing.instrumentation import RunReport
+from preprocessing.language_identification import LanguageIdentification
+from preprocessing.manifest import Manifest
+from preprocessing.sentence_spans import SentenceSpansWriter, sentence_spans_path
+from preprocessing.step_graph import Step, StepContext, StepGraph
+from preprocessing.storage import ContainerStorage, DirectoryStorage, LinkingStorage, StorageInterface
+from preprocessing.strategy_selection import StrategySelection
+from preprocessing.subprocess_runner import ExternalToolError, SubprocessRunner
+from preprocessing.text_extraction import TextExtractor, page_sidecar_path
 from preprocessing.tokenization import sentence_tokenizer
 
 
@@ -23,100 +39,801 @@ _project_languages = {
     "it": "italian",
 }
 
+# how many finished documents to wait for before the manifest is saved again
+_MANIFEST_SAVE_INTERVAL = 25
+
+# identifies the languages of all steps from a sample of the cleaned lines
+_language_identification = LanguageIdentification(_project_languages.keys())
+
+# the characters added on both sides of a lazy window's region, as the
+# sentences at its borders are cut off and dropped
+_WINDOW_MARGIN_CHARS = 2000
+
+
+# Each document gets its own random generator, so that a sentence window does
+# not depend on the order in which (or the process by which) the documents are
+# handled. Without a seed the window is as random as it has always been.
+def _random_for(scheme: FileScheme, seed: str) -> random.Random:
+    if seed is None:
+        return random.Random()
+    return random.Random(f"{seed}:{scheme.basename}")
+
+
+def _extractor_for(path: str, args: argparse.Namespace, runner: SubprocessRunner,
+                   strategy_selection: StrategySelection = None) -> TextExtractor:
+    pdf_strategy = TextExtractor.Strategy[args.pdf_strategy]
+    if strategy_selection:
+        pdf_strategy = strategy_selection.strategy_for(path) or pdf_strategy
+    pdf_fallback = TextExtractor.Strategy[args.pdf_fallback_strategy] if args.pdf_fallback_strategy else None
+    pdf_options = {}
+    if pdf_strategy == TextExtractor.Strategy.PDF_PdfMinerInProcess:
+        pdf_options = dict(workers=args.pdf_page_workers, pages_per_worker=args.pdf_pages_per_worker,
+                           page_sidecar=args.pdf_page_sidecar)
+    return TextExtractor.create_by_file_ext(path, pdf_strategy, pdf_fallback, runner, args.xml_skip_elements,
+                                            **pdf_options)
+
+
+def _remove_page_sidecar(context: StepContext):
+    # the page delimiters of an earlier run would not match the new text,
+    # e.g. of another strategy or without --pdf_page_sidecar
+    sidecar = page_sidecar_path(context.output_path)
+    if context.scheme.file_exists(sidecar):
+        context.scheme.remove_file(sidecar)
+
+
+def _import_page_sidecar(scheme: FileScheme, local_path: str, output_path: str):
+    local_sidecar = page_sidecar_path(local_path)
+    if os.path.isfile(local_sidecar):
+        scheme.storage.import_file(local_sidecar, page_sidecar_path(output_path))
+
+
+def _extract_text(context: StepContext, extractor: TextExtractor, cache: ExtractionCache = None):
+    input_path = context.scheme.input_path
+    # page delimiters are not cached, so their extraction has to run
+    use_cache = cache and not getattr(extractor.strategy, "page_sidecar", False)
+    key = cache.key(context.file_hash(input_path), context.params) if cache else None
+    _remove_page_sidecar(context)
+    # the extraction tools write to a local file, that is then moved into
+    # the storage used for the output directory
+    with context.scheme.local_file_for(context.output_path) as local_path:
+        if use_cache and cache.get(key, local_path):
+            return
+        try:
+            extractor.extract(input_path, local_path)
+            _import_page_sidecar(context.scheme, local_path, context.output_path)
+        finally:
+            if os.path.isfile(page_sidecar_path(local_path)):
+                os.remove(page_sidecar_path(local_path))
+        # texts of the fallback strategy are not cached under the strategy's name
+        if cache and os.path.isfile(local_path) and extractor.used_strategy is extractor.strategy:
+            cache.put(key, local_path)
+
+
+# The cleaned file is never overwritten by the pipeline. If a text is extracted
+# anew, its "-DONE" file has to be removed to be cleaned (or copied) again.
+def _prepare_manual_cleaning(context: StepContext):
+    scheme = context.scheme
+    out_path = context.input_path("extracted_texts")
+    copy_path = scheme.todo_path(2)
+    done_path = context.output_path
+    if not (scheme.file_exists(copy_path) or scheme.file_exists(done_path)):
+        scheme.copy_file(out_path, copy_path, create_dirs=True, editable=True)
+    if context.params["skip_manual_cleaning"] and not scheme.file_exists(done_path):
+        scheme.copy_file(out_path, done_path, create_dirs=True, editable=True)
+    if not scheme.file_exists(done_path):
+        print("WARN:", f"No input file at: '{done_path}'. Was this file manually cleaned?")
+
+
+# The text transformations of steps 3 to 6. Each works on the full content of
+# the previous step's file, so that running them in memory yields exactly the
+# same result as writing and reading the files in between.
+def _cleaned_text(content: str) -> str:
+    return "\n".join(cleaning.cleanup_whitespace(content.splitlines()))
+
+
+def _language_of_text(content: str) -> str:
+    return _language_identification.identify_text(content)
+
+
+def _de_hyphenated_text(content: str, language_code: str, always_combine_hyphens: bool) -> str:
+    lines = cleaning.remove_end_of_line_hyphens(content.splitlines(), language_code, always_combine_hyphens)
+    return "\n".join(lines)
+
+
+def _span_tokenize(content: str, language_code: str, parallel: dict = None) -> [(int, int)]:
+    language = _project_languages[language_code]
+    if parallel and parallel["workers"] > 1:
+        return tokenization.ParallelTokenizer(language, **parallel).span_tokenize(content)
+    return sentence_tokenizer(language).span_tokenize(content)
+
+
+def _sentences_text(content: str, language_code: str, parallel: dict = None) -> str:
+    sentences = (content[start:end] for start, end in _span_tokenize(content, language_code, parallel))
+    # since no hyphen should exist at this point, we can just cat the lines together
+    sentences = map(lambda s: re.sub(r"\s+", " ", s), sentences)
+    sentences = map(str.strip, sentences)
+    return "\n".join(sentences)
+
+
+def _iter_sentence_lines(lines, language_code: str):
+    tokenizer = sentence_tokenizer(_project_languages[language_code])
+    for sentence in tokenization.iter_tokenize(tokenizer, lines):
+        yield re.sub(r"\s+", " ", sentence).strip()
+
+
+def _language_of_lines(iter_lines) -> str:
+    # the lines are read twice to draw the same sample as from the whole text
+    return _language_identification.identify_streamed(iter_lines)
+
+
+def _cleanup_whitespace(context: StepContext):
+    content = context.scheme.read_file(context.input_path("manual_cleaning"))
+    context.scheme.write_file(context.output_path, _cleaned_text(content), create_dirs=True)
+
+
+def _detect_language(context: StepContext) -> str:
+    return _language_of_text(context.scheme.read_file(context.input_path("cleanup_whitespace")))
+
+
+def _de_hyphenate(context: StepContext):
+    content = context.scheme.read_file(context.input_path("cleanup_whitespace"))
+    new_content = _de_hyphenated_text(content, context.value("language"), context.params["always_combine_hyphens"])
+    context.scheme.write_file(context.output_path, new_content, create_dirs=True)
+
+
+def _tokenize_sentences(context: StepContext, parallel: dict = None):
+    content = context.scheme.read_file(context.input_path("de_hyphenate"))
+    if context.params.get("sentence_spans", False):
+        spans = ((start, end, content[start:end])
+                 for start, end in _span_tokenize(content, context.value("language"), parallel))
+        _write_sentences_with_spans(context, spans)
+        return
+    _remove_sentence_spans(context)
+    new_content = _sentences_text(content, context.value("language"), parallel)
+    context.scheme.write_file(context.output_path, new_content, create_dirs=True)
+
+
+def _remove_sentence_spans(context: StepContext):
+    # the spans of an earlier run would not match the new output
+    sidecar = sentence_spans_path(context.output_path)
+    if context.scheme.file_exists(sidecar):
+        context.scheme.remove_file(sidecar)
+
+
+def _write_sentences_with_spans(context: StepContext, spans):
+    """
+    Write the sentences and a sidecar file of their spans in the text they
+    were tokenized from and in the output file.
+    :param spans: The sentences' start, end and text
+    """
+    _remove_sentence_spans(context)
+    with context.scheme.local_file_for(sentence_spans_path(context.output_path)) as local_path, \
+            SentenceSpansWriter(local_path) as writer:
+        def lines():
+            for start, end, sentence in spans:
+                line = re.sub(r"\s+", " ", sentence).strip()
+                writer.add(start, end, line)
+                yield line
+        context.scheme.write_lines_iter(context.output_path, lines(), create_dirs=True)
+
+
+def _escape_xml_chars(context: StepContext):
+    content = context.scheme.read_file(context.input_path("tokenize_sententces"))
+    new_content = cleaning.escape_xml_chars(content)
+    context.scheme.write_file(context.output_path, new_content, create_dirs=True)
+
+
+# Streaming versions of the steps above, that produce the same files but only
+# keep a few lines in memory at a time.
+def _cleanup_whitespace_streaming(context: StepContext):
+    lines = context.scheme.iter_lines(context.input_path("manual_cleaning"))
+    context.scheme.write_lines_iter(context.output_path, cleaning.iter_cleanup_whitespace(lines), create_dirs=True)
+
+
+def _detect_language_streaming(context: StepContext) -> str:
+    return _language_of_lines(lambda: context.scheme.iter_lines(context.input_path("cleanup_whitespace")))
+
+
+def _de_hyphenate_streaming(context: StepContext):
+    lines = context.scheme.iter_lines(context.input_path("cleanup_whitespace"))
+    lines = cleaning.iter_remove_end_of_line_hyphens(lines, context.value("language"),
+                                                     context.params["always_combine_hyphens"])
+    context.scheme.write_lines_iter(context.output_path, lines, create_dirs=True)
+
+
+def _tokenize_sentences_streaming(context: StepContext):
+    lines = context.scheme.iter_lines(context.input_path("de_hyphenate"))
+    if context.params.get("sentence_spans", False):
+        tokenizer = sentence_tokenizer(_project_languages[context.value("language")])
+        _write_sentences_with_spans(context, tokenization.iter_span_tokenize(tokenizer, lines))
+        return
+    _remove_sentence_spans(context)
+    sentences = _iter_sentence_lines(lines, context.value("language"))
+    context.scheme.write_lines_iter(context.output_path, sentences, create_dirs=True)
+
+
+def _escape_xml_chars_streaming(context: StepContext):
+    lines = context.scheme.iter_lines(context.input_path("tokenize_sententces"))
+    context.scheme.write_lines_iter(context.output_path, map(cleaning.escape_xml_chars, lines), create_dirs=True)
+
+
+def _detect_language_fused(context: StepContext) -> str:
+    return _language_of_text(_cleaned_text(context.scheme.read_file(context.input_path("manual_cleaning"))))
+
+
+def _fused_text_steps(context: StepContext, parallel: dict = None):
+    """
+    Run steps 3 to 6 in memory and only write the results of the last step
+    as well as those of the intermediate steps selected for materialization.
+    """
+    scheme = context.scheme
+    materialize = context.params["materialize"]
+
+    def write_if_selected(step: int, content: str):
+        if step in materialize:
+            path = scheme.path(step)
+            if scheme.file_exists(path):
+                scheme.remove_file(path)
+            scheme.write_file(path, content, create_dirs=True)
+
+    content = _cleaned_text(scheme.read_file(context.input_path("manual_cleaning")))
+    write_if_selected(3, content)
+    content = _de_hyphenated_text(content, context.value("language"), context.params["always_combine_hyphens"])
+    write_if_selected(4, content)
+    content = _sentences_text(content, context.value("language"), parallel)
+    write_if_selected(5, content)
+    scheme.write_file(context.output_path, cleaning.escape_xml_chars(content), create_dirs=True)
+
+
+def _detect_language_fused_streaming(context: StepContext) -> str:
+    path = context.input_path("manual_cleaning")
+    return _language_of_lines(lambda: cleaning.iter_cleanup_whitespace(context.scheme.iter_lines(path)))
+
+
+def _fused_text_steps_streaming(context: StepContext):
+    scheme = context.scheme
+    lines = cleaning.iter_cleanup_whitespace(scheme.iter_lines(context.input_path("manual_cleaning")))
+    lines = cleaning.iter_remove_end_of_line_hyphens(lines, context.value("language"),
+                                                     context.params["always_combine_hyphens"])
+    sentences = _iter_sentence_lines(lines, context.value("language"))
+    scheme.write_lines_iter(context.output_path, map(cleaning.escape_xml_chars, sentences), create_dirs=True)
+
+
+def _sentence_window(context: StepContext):
+    window = context.params["random_window"]
+    lines = context.scheme.read_lines(context.input_path("escape_xml_chars"))
+    if len(lines) > window:
+        begin = _random_for(context.scheme, context.params["random_seed"]).randrange(0, len(lines) - window)
+        lines = lines[begin:(begin + window)]
+    context.scheme.write_lines(context.output_path, lines, create_dirs=True)
+
+
+def _sentence_window_streaming(context: StepContext):
+    # one pass to count the lines and one to take the window
+    window = context.params["random_window"]
+    path = context.input_path("escape_xml_chars")
+    line_count = sum(1 for _ in context.scheme.iter_lines(path))
+    begin, end = 0, line_count
+    if line_count > window:
+        begin = _random_for(context.scheme, context.params["random_seed"]).randrange(0, line_count - window)
+        end = begin + window
+    lines = itertools.islice(context.scheme.iter_lines(path), begin, end)
+    context.scheme.write_lines_iter(context.output_path, lines, create_dirs=True)
+
+
+def _window_region(context: StepContext) -> [int, int]:
+    """
+    Choose a random region of lines in the manually cleaned text that likely
+    contains a window of sentences. The length of a sentence is estimated from
+    the number of sentence ends, abbreviations make that estimate a low one,
+    so the region is twice as long as the estimate plus a margin.
+    """
+    window = context.params["random_window"]
+    content = context.scheme.read_file(context.input_path("manual_cleaning"))
+    lines = content.splitlines()
+    sentence_ends = len(re.findall(r"[.!?][\"')\]]*\s", content))
+    chars_per_sentence = len(content) / max(1, sentence_ends)
+    region_length = int(2 * window * chars_per_sentence) + 2 * _WINDOW_MARGIN_CHARS
+    if region_length >= len(content):
+        return [0, len(lines)]
+
+    start = _random_for(context.scheme, context.params["random_seed"]).randrange(0, len(content) - region_length)
+    begin = end = None
+    offset = 0
+    for idx, line in enumerate(lines):
+        if begin is None and offset + len(line) >= start:
+            begin = idx
+        offset += len(line) + 1
+        if offset >= start + region_length:
+            end = idx + 1
+            break
+    return [begin, end if end else len(lines)]
+
+
+def _detect_language_in_region(context: StepContext) -> str:
+    lines = context.scheme.read_lines(context.input_path("manual_cleaning"))
+    begin, end = context.value("window_region")
+    return _language_of_text(_cleaned_text("\n".join(lines[begin:end])))
+
+
+def _lazy_sentence_window(context: StepContext):
+    """
+    Run steps 3 to 6 on the window's region only and choose the window from
+    the sentences in it. The first and last sentence of a region may be cut
+    off, so they are not used unless the region starts or ends with the text.
+    If there are not enough sentences, the region is grown.
+    """
+    window = context.params["random_window"]
+    language_code = context.value("language")
+    all_lines = context.scheme.read_lines(context.input_path("manual_cleaning"))
+    line_count = len(all_lines)
+    begin, end = context.value("window_region")
+    while True:
+        content = _cleaned_text("\n".join(all_lines[begin:end]))
+        content = _de_hyphenated_text(content, language_code, context.params["always_combine_hyphens"])
+        sentences = _sentences_text(content, language_code).splitlines()
+        sentences = sentences[(begin > 0):len(sentences) - (end < line_count)]
+        if len(sentences) >= window or (begin == 0 and end == line_count):
+            break
+        growth = max(1, (end - begin) // 2)
+        begin, end = max(0, begin - growth), min(line_count, end + growth)
+
+    lines = cleaning.escape_xml_chars("\n".join(sentences)).splitlines()
+    if len(lines) > window:
+        first = _random_for(context.scheme, context.params["random_seed"]).randrange(0, len(lines) - window)
+        lines = lines[first:(first + window)]
+    context.scheme.write_lines(context.output_path, lines, create_dirs=True)
+
+
+def _separate_by_language(context: StepContext):
+    path_from_last_step = context.input_path(context.step.inputs[-1])
+    context.scheme.copy_file(path_from_last_step, context.output_path, create_dirs=True)
+
+
+def _language_path(context: StepContext) -> str:
+    language_dir = os.path.join(context.scheme.dirname(42), context.value("language"))
+    return os.path.join(language_dir, os.path.basename(context.scheme.path(42)))
+
+
+def _de_hyphenation_params(args: argparse.Namespace) -> dict:
+    result = {"always_combine_hyphens": args.always_combine_hyphens}
+    # words might be checked differently with the word sets, but the
+    # fingerprints of runs without them stay the same
+    if args.word_sets:
+        result["word_sets"] = True
+    return result
+
+
+def _tokenization_params(args: argparse.Namespace) -> dict:
+    return {"sentence_spans": True} if args.sentence_spans else {}
+
+
+def build_step_graph(scheme: FileScheme, record: dict, args: argparse.Namespace,
+                     measurements: list = None, external_calls: list = None,
+                     strategy_selection: StrategySelection = None) -> StepGraph:
+    # the steps are declared in this script, so its source is part of their code
+    graph = StepGraph(scheme, record, measurements, verify_outputs=args.verify_outputs, code=[sys.modules[__name__]])
+
+    # the slots are shared by all processes writing to the output directory
+    runner = SubprocessRunner(timeout=args.external_tool_timeout or None, retries=args.external_tool_retries,
+                              slots=args.external_tool_slots,
+                              slots_dir=os.path.join(scheme.output_dir, ".external_tool_slots"),
+                              calls=external_calls)
+    extractor = _extractor_for(scheme.input_path, args, runner, strategy_selection)
+    # the output is the same as tokenizing the whole text at once, the
+    # workers have a runner of their own without the extraction tools' slots
+    # and timeout
+    parallel = dict(workers=args.tokenize_workers, chunk_size=args.tokenize_chunk_size,
+                    runner=SubprocessRunner(calls=external_calls))
+    cache = None
+    if args.extraction_cache:
+        cache = ExtractionCache(args.extraction_cache, args.extraction_cache_size * 1024 * 1024)
+    extraction_params = {"strategy": type(extractor.strategy).__name__}
+    if getattr(extractor.strategy, "page_sidecar", False):
+        extraction_params["page_sidecar"] = True
+    if getattr(extractor.strategy, "skip_elements", ()):
+        extraction_params["skip_elements"] = sorted(extractor.strategy.skip_elements)
+    graph.add(Step(1, "extracted_texts", lambda context: _extract_text(context, extractor, cache),
+                   files=[scheme.input_path], params=extraction_params))
+
+    graph.add(Step(2, "manual_cleaning", _prepare_manual_cleaning, inputs=["extracted_texts"],
+                   params={"skip_manual_cleaning": args.skip_manual_cleaning},
+                   output=lambda context: context.scheme.done_path(2), external=True))
+
+    if args.random_window > 0 and args.lazy_window:
+        window_params = {"random_window": args.random_window, "random_seed": args.random_seed}
+        graph.add(Step(None, "window_region", _window_region, inputs=["manual_cleaning"], params=window_params))
+        graph.add(Step(None, "language", _detect_language_in_region, inputs=["manual_cleaning", "window_region"],
+                       params=_language_identification.params(), code=[cleaning, language_identification]))
+        graph.add(Step(7, "sentence_window", _lazy_sentence_window,
+                       inputs=["manual_cleaning", "window_region", "language"],
+                       params=dict(window_params, **_de_hyphenation_params(args)),
+                       code=[cleaning, tokenization]))
+        graph.add(Step(42, "separate_by_language", _separate_by_language, inputs=["language", "sentence_window"],
+                       output=_language_path))
+        return graph
+
+    if args.fused_text_steps:
+        # steps 3 to 5 are only registered to know where to materialize them
+        scheme.add_step(3, "cleanup_whitespace")
+        scheme.add_step(4, "de_hyphenate")
+        scheme.add_step(5, "tokenize_sententces")
+        # the materialized steps are written as a whole, so streaming only
+        # applies without them
+        streaming = args.streaming and not args.materialize
+        graph.add(Step(None, "language", _detect_language_fused_streaming if streaming else _detect_language_fused,
+                       inputs=["manual_cleaning"], params=_language_identification.params(),
+                       code=[cleaning, language_identification]))
+        graph.add(Step(6, "escape_xml_chars", _fused_text_steps_streaming if streaming
+                       else lambda context: _fused_text_steps(context, parallel),
+                       inputs=["manual_cleaning", "language"],
+                       params={**_de_hyphenation_params(args),
+                               "materialize": sorted(set(args.materialize))},
+                       code=[cleaning, tokenization]))
+    elif args.streaming:
+        # the same steps and files as below, with only a few lines in memory
+        graph.add(Step(3, "cleanup_whitespace", _cleanup_whitespace_streaming, inputs=["manual_cleaning"],
+                       code=[cleaning]))
+        graph.add(Step(None, "language", _detect_language_streaming, inputs=["cleanup_whitespace"],
+                       params=_language_identification.params(), code=[language_identification]))
+        graph.add(Step(4, "de_hyphenate", _de_hyphenate_streaming, inputs=["cleanup_whitespace", "language"],
+                       params=_de_hyphenation_params(args), code=[cleaning]))
+        graph.add(Step(5, "tokenize_sententces", _tokenize_sentences_streaming, inputs=["de_hyphenate", "language"],
+                       params=_tokenization_params(args), code=[tokenization]))
+        graph.add(Step(6, "escape_xml_chars", _escape_xml_chars_streaming, inputs=["tokenize_sententces"],
+                       code=[cleaning]))
+    else:
+        graph.add(Step(3, "cleanup_whitespace", _cleanup_whitespace, inputs=["manual_cleaning"], code=[cleaning]))
+        graph.add(Step(None, "language", _detect_language, inputs=["cleanup_whitespace"],
+                       params=_language_identification.params(), code=[language_identification]))
+        graph.add(Step(4, "de_hyphenate", _de_hyphenate, inputs=["cleanup_whitespace", "language"],
+                       params=_de_hyphenation_params(args), code=[cleaning]))
+        graph.add(Step(5, "tokenize_sententces", lambda context: _tokenize_sentences(context, parallel),
+                       inputs=["de_hyphenate", "language"],
+                       params=_tokenization_params(args), code=[tokenization]))
+        graph.add(Step(6, "escape_xml_chars", _escape_xml_chars, inputs=["tokenize_sententces"], code=[cleaning]))
+
+    last_step = "escape_xml_chars"
+    if args.random_window > 0:
+        graph.add(Step(7, "sentence_window", _sentence_window_streaming if args.streaming else _sentence_window,
+                       inputs=[last_step],
+                       params={"random_window": args.random_window, "random_seed": args.random_seed}))
+        last_step = "sentence_window"
+
+    graph.add(Step(42, "separate_by_language", _separate_by_language, inputs=["language", last_step],
+                   output=_language_path))
+    return graph
+
+
+def _storage_for(output_dir: str, args: argparse.Namespace) -> StorageInterface:
+    if args.storage == "link":
+        return LinkingStorage()
+    elif args.storage == "container":
+        container_path = args.storage_container or os.path.join(output_dir, "artifacts.sqlite")
+        return ContainerStorage(container_path, output_dir, args.storage_compression)
+    return DirectoryStorage()
+
+
+class QuarantinedError(Exception):
+    pass
+
+
+def process_file(path: str, output_dir: str, args: argparse.Namespace, record: dict,
+                 measurements: list = None, external_calls: list = None,
+                 strategy_selection: StrategySelection = None) -> dict:
+    """
+    Run all steps for a single input file, that are not up to date.
+    An input whose extraction failed in several runs is quarantined, i.e.
+    not tried again until the file changes.
+    :param strategy_selection: The table of --strategy_table, if given, as
+                               loaded once for all documents
+    :return: The document's updated manifest record
+    """
+    cleaning.use_word_sets(args.word_sets)
+    tokenization.use_tokenizer_cache(args.tokenizer_cache)
+    cleaning.use_dehyphenation_store(args.dehyphenation_store)
+    scheme = FileScheme(path, output_dir=output_dir, storage=_storage_for(output_dir, args))
+    graph = build_step_graph(scheme, record, args, measurements, external_calls, strategy_selection)
+    input_hash = graph.file_hash(path)
+    failures = record.get("extraction_failures", {})
+    count = failures.get("count", 0) if failures.get("input_hash") == input_hash else 0
+    if args.quarantine_after and count >= args.quarantine_after:
+        raise QuarantinedError(f"Quarantined after {count} failed extractions, change the input file to retry.")
+    try:
+        graph.run()
+    except ExternalToolError:
+        graph.record["extraction_failures"] = {"input_hash": input_hash, "count": count + 1}
+        raise
+    graph.record.pop("extraction_failures", None)
+    return graph.record
+
+
+def _counters() -> dict:
+    return {f"dehyphenation_{name}": value for name, value in cleaning.dehyphenation_stats.items()}
+
+
+def _process_file_safely(job: (str, str, argparse.Namespace, dict, StrategySelection)) \
+        -> (str, dict, [dict], [dict], dict, str):
+    """
+    Run the step chain for one input file without letting an exception
+    escape, so that a single broken document does not abort the whole run.
+    :return: The input path, the document's manifest record (containing
+             the steps done before a failure), the step measurements, the
+             accounting of external tool calls, the counters of the
+             document and either None or the formatted traceback
+    """
+    path, output_dir, args, record, strategy_selection = job
+    measurements = []
+    external_calls = []
+    before = _counters()
+    error = None
+    try:
+        process_file(path, output_dir, args, record, measurements, external_calls, strategy_selection)
+    except QuarantinedError as e:
+        error = str(e)
+    except Exception:
+        error = traceback.format_exc()
+    counters = {name: value - before[name] for name, value in _counters().items()}
+    return path, record, measurements, external_calls, counters, error
+
+
+def _report_progress(results, total: int, manifest: Manifest, report: RunReport) -> [(str, str)]:
+    failures = []
+    for idx, (path, record, measurements, external_calls, counters, error) in enumerate(results, start=1):
+        manifest.update(FileScheme(path).basename, record)
+        report.add(measurements, failed_document=path if error else None, external_calls=external_calls,
+                   counters=counters)
+        if idx % _MANIFEST_SAVE_INTERVAL == 0:
+            manifest.save()
+        status = "OK" if error is None else "FAILED"
+        print(f"[{idx:{len(str(total))}d}/{total}] {status}: {path}", flush=True)
+        if error is not None:
+            failures.append((path, error))
+    return failures
+
+
+def _print_failure_summary(failures: [(str, str)], total: int):
+    if not failures:
+        return
+    print(f"\n{len(failures)} of {total} documents failed:")
+    for path, error in failures:
+        print(f"\n--- {path}\n{error}")
+
+
+def _run_jobs(jobs: list, pool, manifest: Manifest, report: RunReport) -> [(str, str)]:
+    # imap() hands back the results in input order, so progress is reported
+    # in the same order as in a serial run
+    if pool:
+        results = pool.imap(_process_file_safely, jobs)
+    else:
+        results = map(_process_file_safely, jobs)
+    return _report_progress(results, len(jobs), manifest, report)
+
+
+def _strategy_selection(args: argparse.Namespace) -> StrategySelection:
+    # read once per run instead of once per document
+    return StrategySelection(args.strategy_table) if args.strategy_table else None
+
+
+def _report_path(output_dir: str, args: argparse.Namespace, name: str = "run_report.json") -> str:
+    return args.run_report if args.run_report else os.path.join(output_dir, name)
+
 
 def main(input_dir: str, output_dir: str, args: argparse.Namespace):
 
     input_files = glob.glob(f"{input_dir}/*")
     input_files.sort()
-    for path in input_files:
+    manifest = Manifest(output_dir)
+    report = RunReport()
+    strategy_selection = _strategy_selection(args)
+    jobs = [(path, output_dir, args, manifest.record(FileScheme(path).basename), strategy_selection)
+            for path in input_files]
 
-        scheme = FileScheme(path, output_dir=output_dir)
+    if args.jobs > 1:
+        with multiprocessing.Pool(processes=args.jobs) as pool:
+            failures = _run_jobs(jobs, pool, manifest, report)
+    else:
+        failures = _run_jobs(jobs, None, manifest, report)
 
-        scheme.add_step(1, "extracted_texts")
-        out_path = scheme.path(1)
-        if not scheme.file_exists(out_path):
-            extractor = TextExtractor.create_by_file_ext(path)
-            extractor.extract(path, out_path)
+    manifest.save()
+    report.write(_report_path(output_dir, args))
+    print("")
+    print(report.summary())
+    _print_failure_summary(failures, len(jobs))
+    return failures
 
-        scheme.add_step(2, "manual_cleaning")
-        copy_path = scheme.todo_path(2)
-        done_path = scheme.done_path(2)
-        if not (scheme.file_exists(copy_path) or scheme.file_exists(done_path)):
-            scheme.copy_file(out_path, copy_path, create_dirs=True)
-        if args.skip_manual_cleaning and not scheme.file_exists(done_path):
-            scheme.copy_file(out_path, done_path, create_dirs=True)
 
-        scheme.add_step(3, "cleanup_whitespace")
-        out_path = scheme.path(3)
-        if not scheme.file_exists(out_path):
-            done_path = scheme.done_path(2)
-            if not scheme.file_exists(done_path):
-                print("WARN:", f"No input file at: '{done_path}'. Was this file manually cleaned?")
-                continue
-            lines = scheme.read_lines(scheme.done_path(2))
-            lines = cleaning.cleanup_whitespace(lines)
-            scheme.write_lines(out_path, lines, create_dirs=True)
-
-        # detect the document language
-        language_code = ""
-        if scheme.file_exists(scheme.path(3)):
-            content = scheme.read_file(scheme.path(3))
-            langid.set_languages(_project_languages.keys())
-            language_code, _ = langid.classify(content)
+def _input_file_stats(input_dir: str) -> {str: (int, int)}:
+    result = {}
+    for entry in os.scandir(input_dir):
+        # hidden files are skipped like glob() does, this includes partial
+        # uploads of tools like rsync
+        if entry.name.startswith(".") or not entry.is_file():
+            continue
+        stat = entry.stat()
+        result[os.path.join(input_dir, entry.name)] = (stat.st_size, stat.st_mtime_ns)
+    return result
 
-        scheme.add_step(4, "de_hyphenate")
-        out_path = scheme.path(4)
-        if not scheme.file_exists(out_path):
-            lines = scheme.read_lines(scheme.path(3))
-            lines = cleaning.remove_end_of_line_hyphens(lines, language_code, args.always_combine_hyphens)
-            scheme.write_lines(out_path, lines, create_dirs=True)
 
-        scheme.add_step(5, "tokenize_sententces")
-        out_path = scheme.path(5)
-        if not scheme.file_exists(out_path):
-            content = scheme.read_file(scheme.path(4))
-            tokenizer = sentence_tokenizer(_project_languages[language_code])
-            sentences = tokenizer.tokenize(content)
-            # since no hyphen should exist at this point, we can just cat the lines together
-            sentences = map(lambda s: re.sub(r"\s+", " ", s), sentences)
-            sentences = map(str.strip, sentences)
-            scheme.write_lines(out_path, sentences, create_dirs=True)
-
-        scheme.add_step(6, "escape_xml_chars")
-        out_path = scheme.path(6)
-        if not scheme.file_exists(out_path):
-            content = scheme.read_file(scheme.path(5))
-            new_content = cleaning.escape_xml_chars(content)
-            scheme.write_file(out_path, new_content, create_dirs=True)
-
-        scheme.add_step(7, "sentence_window")
-        out_path = scheme.path(7)
-        if args.random_window > 0 and not scheme.file_exists(out_path):
-            lines = scheme.read_lines(scheme.path(6))
-            if len(lines) > args.random_window:
-                begin = random.randrange(0, len(lines) - args.random_window)
-                lines = lines[begin:(begin + args.random_window)]
-            scheme.write_lines(out_path, lines, create_dirs=True)
-        else:
-            # reset for the last step
-            out_path = scheme.path(6)
-
-        scheme.add_step(42, "separate_by_language")
-        path_from_last_step = out_path
-        language_dir = os.path.join(scheme.dirname(42), language_code)
-        os.makedirs(language_dir, exist_ok=True)
-        scheme.copy_file(path_from_last_step, language_dir)
+def _known_input_stats(manifest: Manifest, input_dir: str) -> {str: (int, int)}:
+    # the manifest remembers the stats of every input file it has hashed
+    result = {}
+    for record in manifest.documents.values():
+        for path, (size, mtime_ns, _) in record.get("files", {}).items():
+            if os.path.dirname(path) == input_dir:
+                result[path] = (size, mtime_ns)
+    return result
 
 
-if __name__ == "__main__":
+def _waiting_for_manual_cleaning(manifest: Manifest, input_dir: str) -> {str}:
+    # the input files whose text was extracted, but not cleaned by hand yet
+    result = set()
+    for record in manifest.documents.values():
+        steps = record.get("steps", {})
+        if "extracted_texts" in steps and "manual_cleaning" not in steps:
+            result.update(p for p in record.get("files", {}) if os.path.dirname(p) == input_dir)
+    return result
+
+
+def _manual_cleaning_done(path: str, output_dir: str, args: argparse.Namespace) -> bool:
+    scheme = FileScheme(path, output_dir=output_dir, storage=_storage_for(output_dir, args))
+    scheme.add_step(2, "manual_cleaning")
+    return scheme.file_exists(scheme.done_path(2))
 
+
+def watch(input_dir: str, output_dir: str, args: argparse.Namespace):
+    """
+    Poll the input directory and run the step chain for new or changed files
+    only. The process (and its workers) keep running, so that spellcheckers,
+    tokenizers and the language model are only loaded once.
+    Documents waiting for their manual cleaning are run again, once their
+    "-DONE" file appears.
+    """
+    manifest = Manifest(output_dir)
+    known = _known_input_stats(manifest, input_dir)
+    strategy_selection = _strategy_selection(args)
+    previous = {}
+    pool = None
+    if args.jobs > 1:
+        # workers leave the handling of ctrl-c to the main process
+        pool = multiprocessing.Pool(processes=args.jobs, initializer=signal.signal,
+                                    initargs=(signal.SIGINT, signal.SIG_IGN))
+    print(f"Watching '{input_dir}' for new or changed files.", flush=True)
+    try:
+        while True:
+            current = _input_file_stats(input_dir)
+            # a file is only taken once it did not change between two polls,
+            # otherwise it might still be in the process of being copied
+            ready = sorted(p for (p, stat) in current.items() if known.get(p) != stat and previous.get(p) == stat)
+            previous = current
+            ready += sorted(p for p in _waiting_for_manual_cleaning(manifest, input_dir)
+                            if p in current and p not in ready and _manual_cleaning_done(p, output_dir, args))
+            if ready:
+                jobs = [(path, output_dir, args, manifest.record(FileScheme(path).basename), strategy_selection)
+                        for path in ready]
+                # a report per batch, so that it does not grow as long as
+                # the process is running
+                report = RunReport()
+                failures = _run_jobs(jobs, pool, manifest, report)
+                known.update({path: current[path] for path in ready})
+                manifest.save()
+                report.write(_report_path(output_dir, args, "run_report.jsonl"), append=True)
+                print("")
+                print(report.summary())
+                _print_failure_summary(failures, len(jobs))
+            time.sleep(args.watch_interval)
+    except KeyboardInterrupt:
+        print("")
+    finally:
+        if pool:
+            pool.terminate()
+            pool.join()
+
+
+def build_argument_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(
         description="Execute all preprocessing steps over the containers input directory.")
     parser.add_argument("--skip_manual_cleaning", action="store_true",
                         help="If present, skip the manual cleaning step.")
     parser.add_argument("--random_window", type=int, default=0,
                         help="If a random window of n sentences should be extracted from the text set this to n.")
+    parser.add_argument("--lazy_window", action="store_true",
+                        help="With --random_window, choose a region of the text first and only clean, de-hyphenate "
+                             "and tokenize that region (and some margin) to find the window in.")
     parser.add_argument("--always_combine_hyphens", action="store_true",
                         help="If a line ends in a hyphen, always combine the hyphenated words (without a spellcheck).")
+    parser.add_argument("--random_seed", type=str, default=None,
+                        help="Seed the random window per document, so that repeated or parallel runs pick the same window.")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="The number of documents to process in parallel worker processes.")
+    parser.add_argument("--streaming", action="store_true",
+                        help="Read and write the texts of the steps 3 to 7 line by line instead of as a whole, to "
+                             "process large documents in bounded memory. The outputs are the same as without this.")
+    parser.add_argument("--fused_text_steps", action="store_true",
+                        help="Run the steps 3 to 6 in memory and only write the output of step 6.")
+    parser.add_argument("--sentence_spans", action="store_true",
+                        help="Write a binary '.spans' file next to each output of step 5, with the character offsets of "
+                             "every sentence in the text of step 4 and its byte offsets in the output (not with "
+                             "--fused_text_steps or --lazy_window), cf. preprocessing/sentence_spans.py.")
+    parser.add_argument("--tokenize_workers", type=int, default=1,
+                        help="Tokenize the sentences of large texts in chunks in up to this many worker processes, "
+                             "at most one per cpu (not with --streaming or --lazy_window). The sentences are the same "
+                             "as without this. Starting a worker takes about as long as tokenizing a few MB, so "
+                             "this only pays off for much larger texts.")
+    parser.add_argument("--tokenize_chunk_size", type=int, default=1 << 22,
+                        help="The minimal number of characters per chunk for --tokenize_workers, shorter texts "
+                             "are tokenized in one piece. A text is split into at most one chunk per worker.")
+    parser.add_argument("--materialize", type=int, nargs="+", default=[], choices=[3, 4, 5],
+                        help="With --fused_text_steps, also write the output of these intermediate steps.")
+    parser.add_argument("--word_sets", type=str, default="",
+                        help="A directory of word sets compiled with 'python3 -m preprocessing.word_sets', to check "
+                             "words with instead of hunspell. Languages without a word set still use hunspell.")
+    parser.add_argument("--tokenizer_cache", type=str, default="",
+                        help="A directory to keep the sentence tokenizers with our abbreviations in, so that new "
+                             "processes load them instead of building them.")
+    parser.add_argument("--dehyphenation_store", type=str, default="",
+                        help="A sqlite file to keep the spellchecked de-hyphenation decisions in, so that they are "
+                             "reused by later documents and runs. It can be shared by several output directories.")
+    parser.add_argument("--extraction_cache", type=str, default="",
+                        help="A directory to share extracted texts between runs with different output directories.")
+    parser.add_argument("--extraction_cache_size", type=int, default=10240,
+                        help="The size limit of the extraction cache in megabytes.")
+    parser.add_argument("--pdf_strategy", type=str, default="PDF_PdfMutool",
+                        choices=[s.name for s in TextExtractor.Strategy if s.name.startswith("PDF_")],
+                        help="How to extract the text of pdf files.")
+    parser.add_argument("--strategy_table", type=str, default="",
+                        help="A table written by preprocessing/strategy_selection.py to pick the pdf strategy per "
+                             "source, instead of using --pdf_strategy for all pdfs.")
+    parser.add_argument("--pdf_fallback_strategy", type=str, default="PDF_PdfMiner",
+                        choices=[""] + [s.name for s in TextExtractor.Strategy if s.name.startswith("PDF_")],
+                        help="The strategy to use if the external tool of --pdf_strategy fails, '' for none.")
+    parser.add_argument("--external_tool_timeout", type=float, default=0,
+                        help="The number of seconds after which an external extraction tool is stopped, 0 for none.")
+    parser.add_argument("--external_tool_retries", type=int, default=1,
+                        help="How often to retry an external extraction tool that failed or timed out.")
+    parser.add_argument("--external_tool_slots", type=int, default=0,
+                        help="The number of external extraction tools allowed to run at once across all jobs, "
+                             "0 for no limit.")
+    parser.add_argument("--quarantine_after", type=int, default=3,
+                        help="Skip inputs whose extraction failed in this many runs until they change, 0 to never.")
+    parser.add_argument("--pdf_page_workers", type=int, default=0,
+                        help="With 'PDF_PdfMinerInProcess', the number of processes extracting page ranges of a "
+                             "large pdf in parallel, defaults to the number of cpus.")
+    parser.add_argument("--pdf_pages_per_worker", type=int, default=50,
+                        help="With 'PDF_PdfMinerInProcess', the size of the page ranges. Smaller pdfs are "
+                             "extracted in a single process.")
+    parser.add_argument("--pdf_page_sidecar", action="store_true",
+                        help="With 'PDF_PdfMinerInProcess', keep the page delimiters of an extracted text in a "
+                             "json file next to it.")
+    parser.add_argument("--xml_skip_elements", type=str, nargs="+", default=[],
+                        help="Leave out the text of these elements (by name without namespace) when extracting "
+                             "xml or html files, e.g. 'teiHeader note'.")
+    parser.add_argument("--storage", type=str, default="directory", choices=["directory", "link", "container"],
+                        help="Keep step outputs as files, as files that share data with their copies (reflinks or "
+                             "hard links) or in a single sqlite container. Files for manual cleaning are always "
+                             "plain files.")
+    parser.add_argument("--storage_container", type=str, default="",
+                        help="The container file for '--storage container', defaults to the output directory.")
+    parser.add_argument("--storage_compression", type=str, default="none", choices=ContainerStorage.COMPRESSIONS,
+                        help="How to compress the contents of the storage container (zstd needs 'zstandard').")
+    parser.add_argument("--verify_outputs", action="store_true",
+                        help="Also rerun the steps whose output file was removed, e.g. to redo a step by hand. This "
+                             "looks at the storage once per step and document.")
+    parser.add_argument("--run_report", type=str, default="",
+                        help="Where to write the json report of step timings, defaults to the output directory. "
+                             "With --watch, one line of json is appended per batch of documents.")
+
+    parser.add_argument("--watch", action="store_true",
+                        help="Keep running and process new or changed input files as they appear.")
+    parser.add_argument("--watch_interval", type=float, default=5.0,
+                        help="With --watch, the number of seconds between two looks at the input directory.")
+    return parser
+
+
+if __name__ == "__main__":
 
-    main("/srv/input", "/srv/output", parser.parse_args())
+    args = build_argument_parser().parse_args()
+    if args.watch:
+        watch("/srv/input", "/srv/output", args)
+    else:
+        main("/srv/input", "/srv/output", args)
@@ -1,8 +1,13 @@
 
+import collections
+import os
 import re
+import sqlite3
 import hunspell
 import xml.sax.saxutils
 
+from preprocessing import word_sets
+
 # NOTE: Strictly speaking, the german dictionaries are not needed anymore,
 #       but I left this here for future use with different languages
 _hunspell_files = {
@@ -16,17 +21,157 @@ _hunspell_files = {
 # a variable to cache spellcheckers used in this module
 _spellchecker_cache = {}
 
+# a directory of compiled word sets to use instead of hunspell, for the
+# languages that there is a word set for (cf. preprocessing.word_sets)
+_word_set_dir = ""
+
+_hyphen_at_end = re.compile("-$")
+_non_word_at_start = re.compile(r"^\W*")
+_non_word_at_end = re.compile(r"\W*$")
+
+# The spellchecked de-hyphenation decisions by (language, word1, word2), the
+# most recently used ones in memory and optionally all of them in a store
+# on disk, that is shared by processes and runs.
+_DECISION_MEMO_SIZE = 100000
+_decision_memo = collections.OrderedDict()
+_decision_store = None
+
+# how the decisions were made in this process
+dehyphenation_stats = {"memo_hits": 0, "store_hits": 0, "spellchecked": 0}
+
 
 # return the prepared spellchecker for the given language or initialize a
 # new one and keep it
 def __get_spellchecker(language_code):
     result = _spellchecker_cache.get(language_code, None)
     if not result:
-        result = hunspell.HunSpell(*_hunspell_files[language_code])
+        path = _word_set_file(language_code)
+        if path:
+            result = word_sets.WordSet(path)
+        else:
+            result = hunspell.HunSpell(*_hunspell_files[language_code])
         _spellchecker_cache[language_code] = result
     return result
 
 
+def _word_set_file(language_code):
+    path = word_sets.word_set_path(_word_set_dir, language_code) if _word_set_dir else None
+    return path if path and os.path.isfile(path) else None
+
+
+def use_word_sets(directory: str):
+    """
+    Check words with the compiled word sets in the directory instead of
+    hunspell (or with hunspell again if the directory is empty).
+    """
+    global _word_set_dir
+    if directory == _word_set_dir:
+        return
+    _word_set_dir = directory
+    _spellchecker_cache.clear()
+    _decision_memo.clear()
+    if _decision_store is not None:
+        # the stored decisions are checked against the new dictionaries
+        _decision_store.invalidate()
+
+
+def is_known_word(word: str, language_code: str) -> bool:
+    return bool(__get_spellchecker(language_code).spell(word))
+
+
+class DehyphenationStore:
+    """
+    A sqlite file of de-hyphenation decisions. The decisions of a language
+    are dropped when its dictionary file (or word set) changes, as they
+    were made with the old one.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=120, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS dictionaries (language TEXT PRIMARY KEY, version TEXT)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS decisions (language TEXT, word1 TEXT, word2 TEXT, "
+                         "combine INTEGER, PRIMARY KEY (language, word1, word2))")
+        self._checked_languages = set()
+
+    @staticmethod
+    def _dictionary_version(language_code: str) -> str:
+        path = _word_set_file(language_code) or _hunspell_files[language_code][0]
+        stat = os.stat(path)
+        return f"{path}:{stat.st_size}:{stat.st_mtime_ns}"
+
+    def _check_dictionary(self, language_code: str):
+        if language_code in self._checked_languages:
+            return
+        version = self._dictionary_version(language_code)
+        row = self._db.execute("SELECT version FROM dictionaries WHERE language = ?", (language_code,)).fetchone()
+        if not row or row[0] != version:
+            self._db.execute("DELETE FROM decisions WHERE language = ?", (language_code,))
+            self._db.execute("INSERT OR REPLACE INTO dictionaries VALUES (?, ?)", (language_code, version))
+        self._checked_languages.add(language_code)
+
+    def invalidate(self):
+        """
+        Check the dictionaries' versions again on the next use, e.g. after
+        switching to other dictionary files.
+        """
+        self._checked_languages.clear()
+
+    def get(self, language_code: str, word1: str, word2: str):
+        """
+        :return: Whether to combine the words or None if this is not known
+        """
+        self._check_dictionary(language_code)
+        row = self._db.execute("SELECT combine FROM decisions WHERE language = ? AND word1 = ? AND word2 = ?",
+                               (language_code, word1, word2)).fetchone()
+        return bool(row[0]) if row else None
+
+    def put(self, language_code: str, word1: str, word2: str, combine: bool):
+        self._db.execute("INSERT OR REPLACE INTO decisions VALUES (?, ?, ?, ?)",
+                         (language_code, word1, word2, int(combine)))
+
+
+def use_dehyphenation_store(path: str):
+    """
+    Keep the de-hyphenation decisions of this process in the store at the
+    path (or in memory only if the path is empty).
+    """
+    global _decision_store
+    if _decision_store is not None and _decision_store.path == path:
+        return
+    _decision_store = DehyphenationStore(path) if path else None
+
+
+def __spellchecked_decision(word1: str, word2: str, combined: str, language_code: str) -> bool:
+    key = (language_code, word1, word2)
+    decision = _decision_memo.get(key, None)
+    if decision is not None:
+        _decision_memo.move_to_end(key)
+        dehyphenation_stats["memo_hits"] += 1
+        return decision
+    if _decision_store is not None:
+        decision = _decision_store.get(*key)
+    if decision is not None:
+        dehyphenation_stats["store_hits"] += 1
+    else:
+        # when checking the word, remove non-letter characters from both ends
+        # this handles cases like "(final-ly)"
+        word_to_check = _non_word_at_start.sub("", _non_word_at_end.sub("", combined))
+        # if the combined word without the hyphen is recognized we assume
+        # that the words should be de-hyphenated
+        decision = bool(__get_spellchecker(language_code).spell(word_to_check))
+        dehyphenation_stats["spellchecked"] += 1
+        if _decision_store is not None:
+            _decision_store.put(*key, decision)
+    _decision_memo[key] = decision
+    if len(_decision_memo) > _DECISION_MEMO_SIZE:
+        _decision_memo.popitem(last=False)
+    return decision
+
+
 def __conditionally_combine_hyphenated(word1: str, word2: str, language_code: str, always_combine=False):
     """
     Check if a character "-" should be removed from the first word based
@@ -44,21 +189,14 @@ def __conditionally_combine_hyphenated(word1: str, word2: str, language_code: st
         # with a small letter
         if isinstance(word2, str) and len(word2) > 0 and word2[0].islower():
             result = combined
-    else:
-        spell_checker = __get_spellchecker(language_code)
-        # when checking the word, remove non-letter characters from both ends
-        # this handles cases like "(final-ly)"
-        word_to_check = re.compile(r"^\W*").sub("", re.compile(r"\W*$").sub("", combined))
-        # if the combined word without the hyphen is recognized we assume
-        # that the words should be de-hyphenated
-        if spell_checker.spell(word_to_check):
-            result = combined
+    elif __spellchecked_decision(word1, word2, combined, language_code):
+        result = combined
     return result
 
 
 def __lines_remove_hyphens(line1: str, line2: str, language_code: str, always_combine=False) -> (str, str):
     result = (line1, line2)
-    if re.compile("-$").findall(line1):
+    if _hyphen_at_end.search(line1):
         # split the two lines into words
         words1, words2 = map(lambda l: l.split(" "), [line1, line2])
         check_result = __conditionally_combine_hyphenated(words1[-1], words2[0], language_code, always_combine)
@@ -80,6 +218,23 @@ def remove_end_of_line_hyphens(lines: [str], language_code: str = "en", always_c
     return lines
 
 
+def iter_remove_end_of_line_hyphens(lines, language_code: str = "en", always_combine=False):
+    """
+    Like remove_end_of_line_hyphens(), but for any iterable of lines and
+    yielding the result line by line. Only the current line is kept.
+    """
+    previous = None
+    for line in lines:
+        if previous is None:
+            previous = line
+            continue
+        l1, l2 = __lines_remove_hyphens(previous, line, language_code, always_combine)
+        yield l1
+        previous = l2
+    if previous is not None:
+        yield previous
+
+
 def cleanup_whitespace(lines: [str]):
     # filter out all lines, that are entirely whitespace
     lines = [l for l in lines if not re.match(r"^\s*$", l)]
@@ -89,5 +244,15 @@ def cleanup_whitespace(lines: [str]):
     return [re.sub(r"\s{2,}", " ", l) for l in lines]
 
 
+def iter_cleanup_whitespace(lines):
+    """
+    Like cleanup_whitespace(), but for any iterable of lines and yielding
+    the result line by line.
+    """
+    for line in lines:
+        if not re.match(r"^\s*$", line):
+            yield re.sub(r"\s{2,}", " ", line.strip())
+
+
 def escape_xml_chars(text: str):
     return xml.sax.saxutils.escape(text)
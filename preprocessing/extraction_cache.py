@@ -0,0 +1,100 @@
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+# the estimated size of each cache directory and the puts since it was last
+# scanned, kept for the process as a cache is created for every document
+_size_estimates = {}
+
+# entries written by other processes are only seen by a scan
+_SCAN_EVERY_PUTS = 100
+
+
+class ExtractionCache:
+    """
+    A directory of extracted texts keyed by the content hash of the input
+    file and the extraction step's parameters. It can be shared by runs over any
+    number of output directories and by several processes at once.
+    Recency is kept in the files' modification times, when the cache grows
+    beyond its size limit, the least recently used entries are removed. The
+    entries are only scanned for that if a running estimate of the size
+    exceeds the limit or after every _SCAN_EVERY_PUTS puts.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def key(input_hash: str, params: dict) -> str:
+        """
+        :param params: Everything that influences the extracted text, e.g.
+                       the strategy and the xml elements that are skipped
+        """
+        description = json.dumps({"input": input_hash, "params": params}, sort_keys=True)
+        return hashlib.sha256(description.encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.txt")
+
+    def get(self, key: str, output_path: str) -> bool:
+        """
+        Copy the cached text to the output path if there is one.
+        :return: Whether the cache had an entry for the key
+        """
+        entry = self._entry_path(key)
+        try:
+            os.utime(entry)
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            shutil.copyfile(entry, output_path)
+            return True
+        except FileNotFoundError:
+            # either not cached or evicted by another process just now
+            return False
+
+    def put(self, key: str, path: str):
+        entry = self._entry_path(key)
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        # copy to a temporary file in the same directory first, so that
+        # other processes never see a partially written entry
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(entry), suffix=".tmp")
+        os.close(fd)
+        shutil.copyfile(path, tmp_path)
+        os.replace(tmp_path, entry)
+        # the entry itself may already be evicted by another process
+        size = os.path.getsize(path)
+        estimate = _size_estimates.get(os.path.abspath(self.directory), None)
+        if estimate is None or estimate[0] + size > self.max_bytes or estimate[1] + 1 >= _SCAN_EVERY_PUTS:
+            self._evict()
+        else:
+            estimate[0] += size
+            estimate[1] += 1
+
+    def _entries(self) -> [os.DirEntry]:
+        result = []
+        for sub_dir in os.scandir(self.directory):
+            if sub_dir.is_dir():
+                result += [e for e in os.scandir(sub_dir.path) if e.name.endswith(".txt")]
+        return result
+
+    def _evict(self):
+        entries = []
+        for entry in self._entries():
+            try:
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+            except FileNotFoundError:
+                continue
+        total = sum(size for (_, size, _) in entries)
+        for (_, size, path) in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        _size_estimates[os.path.abspath(self.directory)] = [total, 0]
@@ -1,11 +1,14 @@
 
+import contextlib
 import os.path
-import shutil
+import tempfile
+
+from preprocessing.storage import DirectoryStorage, StorageInterface
 
 
 class FileScheme:
 
-    def __init__(self, path: str, output_dir="/srv/output"):
+    def __init__(self, path: str, output_dir="/srv/output", storage: StorageInterface = None):
         self.steps = {
             # 1 => "extract_texts,
             # 2 => "manual_cleaning",
@@ -15,6 +18,7 @@ class FileScheme:
         (basepath, _) = os.path.splitext(path)
         self.basename = os.path.basename(basepath)
         self.output_dir = output_dir
+        self.storage = storage if storage else DirectoryStorage()
 
     def add_step(self, step: int, step_name: str):
         if step in self.steps.keys():
@@ -42,34 +46,49 @@ class FileScheme:
     def done_path(self, step: int) -> str:
         return self.__path_with_instruction(self.dirname(step), "DONE", "txt")
 
-    @staticmethod
-    def read_file(path: str) -> str:
-        with open(path, 'r') as file:
-            return file.read()
-
-    @classmethod
-    def read_lines(cls, path: str) -> [str]:
-        return cls.read_file(path).splitlines()
-
-    @staticmethod
-    def write_file(file_path, content, create_dirs=False):
-        assert not(os.path.isfile(file_path)), f"File already exists: {file_path}"
-        if create_dirs:
-            os.makedirs(os.path.dirname(file_path), exist_ok=True)
-        with open(file_path, 'w') as f:
-            f.write(content)
-
-    @classmethod
-    def write_lines(cls, path, lines: [str], create_dirs=False):
-        return cls.write_file(path, "\n".join(lines), create_dirs)
-
-    @staticmethod
-    def copy_file(src, dst, create_dirs=False):
-        if create_dirs:
-            dir = dst if os.path.isdir(dst) else os.path.dirname(dst)
-            os.makedirs(dir, exist_ok=True)
-        shutil.copy(src, dst)
-
-    @staticmethod
-    def file_exists(path: str) -> bool:
-        return os.path.isfile(path)
+    def read_file(self, path: str) -> str:
+        return self.storage.read_file(path)
+
+    def read_lines(self, path: str) -> [str]:
+        return self.read_file(path).splitlines()
+
+    def iter_lines(self, path: str):
+        return self.storage.iter_lines(path)
+
+    def write_file(self, file_path, content, create_dirs=False):
+        self.storage.write_file(file_path, content, create_dirs)
+
+    def write_lines(self, path, lines: [str], create_dirs=False):
+        return self.write_file(path, "\n".join(lines), create_dirs)
+
+    def write_lines_iter(self, path, lines, create_dirs=False):
+        self.storage.write_lines_iter(path, lines, create_dirs)
+
+    def copy_file(self, src, dst, create_dirs=False, editable=False):
+        self.storage.copy_file(src, dst, create_dirs, editable)
+
+    def remove_file(self, path: str):
+        self.storage.remove_file(path)
+
+    def file_exists(self, path: str) -> bool:
+        return self.storage.file_exists(path)
+
+    @contextlib.contextmanager
+    def local_file_for(self, path: str):
+        """
+        Provide a path on the local disk for external tools to write to. If
+        the tool created the file, it is moved into the storage at the given
+        path afterwards.
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        fd, local_path = tempfile.mkstemp(prefix=f".{self.basename}-", suffix=".txt", dir=self.output_dir)
+        os.close(fd)
+        # the tool is expected to create the file, so that a failure is noticed
+        os.remove(local_path)
+        try:
+            yield local_path
+            if os.path.isfile(local_path):
+                self.storage.import_file(local_path, path)
+        finally:
+            if os.path.isfile(local_path):
+                os.remove(local_path)
@@ -0,0 +1,188 @@
+
+import json
+import os
+import resource
+import time
+
+
+def _cpu_seconds() -> float:
+    # external tools like mutool run as child processes, their cpu time is
+    # only available after they were waited for, which subprocess.call() does
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def _reset_peak_rss() -> bool:
+    # Linux allows resetting the high water mark of the resident set size,
+    # which makes it possible to measure the peak of a single step
+    try:
+        with open("/proc/self/clear_refs", "w") as file:
+            file.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_kb() -> int:
+    try:
+        with open("/proc/self/status", "r") as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    # the maximum over the whole process lifetime (kilobytes on Linux)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _file_size(path: str) -> int:
+    try:
+        return os.stat(path).st_size
+    except (OSError, TypeError):
+        return 0
+
+
+class StepMeasurement:
+    """
+    A context manager measuring a single step of a single document.
+    Peak rss is the step's own peak where the os allows resetting it,
+    otherwise it is the process' peak up to the end of the step.
+    """
+
+    def __init__(self, document: str, step: str, input_paths: [str], output_path: str = None, size=_file_size):
+        self.document = document
+        self.step = step
+        self.input_paths = input_paths
+        self.output_path = output_path
+        self.size = size
+        self.values = {}
+
+    def __enter__(self):
+        self.values["bytes_in"] = sum(map(self.size, self.input_paths))
+        self.values["peak_rss_is_per_step"] = _reset_peak_rss()
+        self._cpu_start = _cpu_seconds()
+        self._wall_start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.values["wall_seconds"] = time.perf_counter() - self._wall_start
+        self.values["cpu_seconds"] = _cpu_seconds() - self._cpu_start
+        self.values["bytes_out"] = self.size(self.output_path)
+        self.values["peak_rss_kb"] = _peak_rss_kb()
+        self.values["failed"] = exc_type is not None
+        return False
+
+    def as_dict(self) -> dict:
+        return dict(document=self.document, step=self.step, pid=os.getpid(), **self.values)
+
+
+class RunReport:
+    """
+    Collects the step measurements of all documents in a run, as well as
+    the accounting of the external tools' calls and counters like cache
+    hits, that are summed up. It can be written as json and summarized for
+    humans.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.measurements = []
+        self.external_calls = []
+        self.failed_documents = []
+        self.counters = {}
+
+    def add(self, measurements: [dict], failed_document: str = None, external_calls: [dict] = (),
+            counters: dict = None):
+        self.measurements += measurements
+        self.external_calls += external_calls
+        for name, value in (counters or {}).items():
+            self.counters[name] = self.counters.get(name, 0) + value
+        if failed_document:
+            self.failed_documents.append(failed_document)
+
+    def write(self, path: str, append: bool = False):
+        """
+        :param append: Append the report as a single line of json, e.g. one
+                       line per batch of a long running process
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        report = {
+            "started": self.started,
+            "wall_seconds": time.time() - self.started,
+            "failed_documents": self.failed_documents,
+            "steps": self._totals_by("step"),
+            "external_tools": self._external_tool_totals(),
+            "counters": self.counters,
+            "measurements": self.measurements,
+            "external_calls": self.external_calls,
+        }
+        with open(path, "a" if append else "w") as file:
+            if append:
+                file.write(json.dumps(report) + "\n")
+            else:
+                json.dump(report, file, indent=2)
+
+    def _totals_by(self, key: str) -> dict:
+        result = {}
+        for m in self.measurements:
+            totals = result.setdefault(m[key], {"count": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0,
+                                                "bytes_in": 0, "bytes_out": 0, "peak_rss_kb": 0})
+            totals["count"] += 1
+            for name in ["wall_seconds", "cpu_seconds", "bytes_in", "bytes_out"]:
+                totals[name] += m[name]
+            totals["peak_rss_kb"] = max(totals["peak_rss_kb"], m["peak_rss_kb"])
+        return result
+
+    def _external_tool_totals(self) -> dict:
+        result = {}
+        for call in self.external_calls:
+            totals = result.setdefault(call["command"], {"count": 0, "failed": 0, "timed_out": 0,
+                                                         "wall_seconds": 0.0, "cpu_seconds": 0.0,
+                                                         "slot_wait_seconds": 0.0, "peak_rss_kb": 0})
+            totals["count"] += 1
+            totals["failed"] += call["returncode"] != 0
+            totals["timed_out"] += call["timed_out"]
+            for name in ["wall_seconds", "cpu_seconds", "slot_wait_seconds"]:
+                totals[name] += call[name]
+            totals["peak_rss_kb"] = max(totals["peak_rss_kb"], call["peak_rss_kb"])
+        return result
+
+    def summary(self, limit: int = 10) -> str:
+        if not self.measurements:
+            return "No steps were executed."
+
+        lines = ["~~~~Steps (by total wall time)~~~~",
+                 "%-24s %6s %10s %10s %10s %12s %10s" % ("step", "count", "wall [s]", "cpu [s]", "max [s]",
+                                                          "MB/s in", "peak MB")]
+        steps = self._totals_by("step")
+        for name, totals in sorted(steps.items(), key=lambda kv: -kv[1]["wall_seconds"]):
+            slowest = max(m["wall_seconds"] for m in self.measurements if m["step"] == name)
+            throughput = totals["bytes_in"] / totals["wall_seconds"] / 1e6 if totals["wall_seconds"] else 0.0
+            lines.append("%-24s %6d %10.2f %10.2f %10.2f %12.2f %10.1f" % (
+                name, totals["count"], totals["wall_seconds"], totals["cpu_seconds"], slowest,
+                throughput, totals["peak_rss_kb"] / 1024))
+
+        lines += ["", f"~~~~Slowest documents (top {limit})~~~~"]
+        documents = self._totals_by("document")
+        for name, totals in sorted(documents.items(), key=lambda kv: -kv[1]["wall_seconds"])[:limit]:
+            slowest_step = max((m for m in self.measurements if m["document"] == name),
+                               key=lambda m: m["wall_seconds"])
+            lines.append("%-40s %10.2f s  (slowest step: %s, %.2f s)" % (
+                name, totals["wall_seconds"], slowest_step["step"], slowest_step["wall_seconds"]))
+
+        tools = self._external_tool_totals()
+        if tools:
+            lines += ["", "~~~~External tools~~~~",
+                      "%-24s %6s %7s %9s %10s %10s %10s %10s" % ("command", "calls", "failed", "timed out",
+                                                                 "wall [s]", "cpu [s]", "wait [s]", "peak MB")]
+            for name, totals in sorted(tools.items(), key=lambda kv: -kv[1]["wall_seconds"]):
+                lines.append("%-24s %6d %7d %9d %10.2f %10.2f %10.2f %10.1f" % (
+                    name, totals["count"], totals["failed"], totals["timed_out"], totals["wall_seconds"],
+                    totals["cpu_seconds"], totals["slot_wait_seconds"], totals["peak_rss_kb"] / 1024))
+
+        if any(self.counters.values()):
+            lines += ["", "~~~~Counters~~~~"]
+            for name, value in sorted(self.counters.items()):
+                lines.append("%-40s %10d" % (name, value))
+        return "\n".join(lines)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import numpy as np
+from langid.langid import LanguageIdentifier, model
+
+# the identifiers of this process by their language set, loading the model
+# takes longer than classifying a sample
+_identifiers = {}
+
+
+def _identifier_for(languages: [str]) -> LanguageIdentifier:
+    key = tuple(sorted(languages))
+    result = _identifiers.get(key, None)
+    if result is None:
+        # normalized probabilities are needed to tell how sure a result is
+        result = LanguageIdentifier.from_modelstring(model, norm_probs=True)
+        result.set_languages(list(key))
+        _identifiers[key] = result
+    return result
+
+
+def _spread_order(count: int) -> [int]:
+    # 0 .. count - 1 ordered by their bit reversed values, so that every
+    # prefix of the order is spread evenly over the whole range
+    bits = max(1, (count - 1).bit_length())
+    return sorted(range(count), key=lambda idx: int(format(idx, f"0{bits}b")[::-1], 2))
+
+
+class LanguageIdentification:
+    """
+    Identifies the language of a text from a sample of its lines instead of
+    the whole text. The text is divided into as many equal parts as lines
+    are sampled and the middle line of each part is taken, in an order that
+    covers the whole text early. The sampled lines are classified in batches
+    and no more lines are looked at, once the most probable language is
+    certain enough.
+    The same sample is drawn from a list of lines and from an iterable that
+    can be read twice, so streaming the text gives the same result.
+    """
+
+    def __init__(self, languages: [str], max_lines: int = 256, batch_lines: int = 16, min_lines: int = 32,
+                 min_confidence: float = 0.9999):
+        self.languages = sorted(languages)
+        self.max_lines = max_lines
+        self.batch_lines = batch_lines
+        self.min_lines = min_lines
+        self.min_confidence = min_confidence
+
+    def params(self) -> dict:
+        """
+        :return: Everything that influences the identified language, e.g. for
+                 a step's fingerprint
+        """
+        return {"languages": self.languages, "max_lines": self.max_lines, "batch_lines": self.batch_lines,
+                "min_lines": self.min_lines, "min_confidence": self.min_confidence}
+
+    def sample_indices(self, line_count: int) -> [int]:
+        """
+        :return: The indices of the sampled lines in the order they are used
+        """
+        count = min(line_count, self.max_lines)
+        if count == 0:
+            return []
+        return [(2 * idx + 1) * line_count // (2 * count) for idx in _spread_order(count)]
+
+    def classify_sample(self, lines: [str]) -> (str, float):
+        """
+        Classify the sampled lines in their order, stopping early if possible.
+        :return: The language and its probability among the languages
+        """
+        identifier = _identifier_for(self.languages)
+        features = np.zeros((identifier.nb_numfeats,), dtype="uint32")
+        language, confidence = self.languages[0], 0.0
+        # an empty sample is classified once, by the languages' priors
+        for start in range(0, max(len(lines), 1), self.batch_lines):
+            for line in lines[start:start + self.batch_lines]:
+                features += identifier.instance2fv(line)
+            probs = identifier.norm_probs(identifier.nb_classprobs(features))
+            best = int(np.argmax(probs))
+            language, confidence = str(identifier.nb_classes[best]), float(probs[best])
+            if start + self.batch_lines >= self.min_lines and confidence >= self.min_confidence:
+                break
+        return language, confidence
+
+    def identify(self, lines: [str]) -> str:
+        return self.classify_sample([lines[idx] for idx in self.sample_indices(len(lines))])[0]
+
+    def identify_text(self, text: str) -> str:
+        return self.identify(text.splitlines())
+
+    def identify_streamed(self, iter_lines) -> str:
+        """
+        Like identify() for lines that are read twice, once to count them
+        and once to pick the sample, without keeping more than the sample.
+        :param iter_lines: A function returning a new iterator over the lines
+        """
+        indices = self.sample_indices(sum(1 for _ in iter_lines()))
+        wanted = set(indices)
+        sampled = {idx: line for idx, line in enumerate(iter_lines()) if idx in wanted}
+        return self.classify_sample([sampled[idx] for idx in indices])[0]
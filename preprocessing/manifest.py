@@ -0,0 +1,63 @@
+
+import json
+import os
+
+
+class Manifest:
+    """
+    A single json file in the output directory that keeps the state of every
+    processed document, so that the step graph does not have to stat each
+    output file to decide whether it has to do some work.
+    The file is only read and written by the main process, workers receive
+    and return copies of their document's record.
+    """
+
+    FILE_NAME = "manifest.json"
+    VERSION = 1
+
+    def __init__(self, output_dir: str):
+        self.path = os.path.join(output_dir, self.FILE_NAME)
+        self.documents = {}
+        self._load()
+
+    def _load(self):
+        if not os.path.isfile(self.path):
+            return
+        with open(self.path, "r") as file:
+            content = json.load(file)
+        # a manifest written by an incompatible version is just discarded,
+        # which means that everything is recomputed once
+        if content.get("version") == self.VERSION:
+            self.documents = content.get("documents", {})
+
+    def record(self, basename: str) -> dict:
+        """
+        :return: A copy of the record for the given document, that may be
+                 changed and handed back via update().
+        """
+        record = self.documents.get(basename, {})
+        return json.loads(json.dumps(record))
+
+    def value(self, basename: str, step_name: str, default=None):
+        """
+        :return: The result of a step that produces a value instead of a file
+                 (e.g. the language) for the given document, so that later
+                 stages do not have to compute it again. This is the value
+                 of the last run, the step's fingerprint is not checked, so
+                 it is outdated if the document or the step's parameters
+                 changed since without running the step again.
+        """
+        state = self.documents.get(basename, {}).get("steps", {}).get(step_name, None)
+        return state["value"] if state and "value" in state else default
+
+    def update(self, basename: str, record: dict):
+        self.documents[basename] = record
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # write to a temporary file first, so that an interrupted run does
+        # not leave a truncated manifest behind
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as file:
+            json.dump({"version": self.VERSION, "documents": self.documents}, file, sort_keys=True)
+        os.replace(tmp_path, self.path)
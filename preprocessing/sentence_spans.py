@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import mmap
+import os
+import struct
+
+# File layout: the magic bytes and the number of sentences n, followed by n
+# records of the sentence's start and end in the text it was tokenized from
+# (in characters) and in the file of tokenized sentences (in bytes).
+_MAGIC = b"CHRSPANS"
+_HEADER = struct.Struct("<8sQ")
+_SPAN = struct.Struct("<QQQQ")
+
+
+def sentence_spans_path(output_path: str) -> str:
+    return os.path.splitext(output_path)[0] + ".spans"
+
+
+class SentenceSpansWriter:
+    """
+    Writes the spans of the sentences one at a time, in the order of the
+    lines of the tokenized file.
+    """
+
+    def __init__(self, path: str):
+        self._file = open(path, "wb")
+        self._file.write(_HEADER.pack(_MAGIC, 0))
+        self._count = 0
+        self._output_offset = 0
+
+    def add(self, source_start: int, source_end: int, line: str):
+        """
+        :param line: The sentence as written to its line in the tokenized file
+        """
+        output_end = self._output_offset + len(line.encode("utf-8"))
+        self._file.write(_SPAN.pack(source_start, source_end, self._output_offset, output_end))
+        self._count += 1
+        # the lines are separated by a single newline
+        self._output_offset = output_end + 1
+
+    def close(self):
+        self._file.seek(0)
+        self._file.write(_HEADER.pack(_MAGIC, self._count))
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+
+class SentenceSpans:
+    """
+    The spans of a tokenized file's sentences, mapped into memory. The n-th
+    span is that of the sentence on the n-th line.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as file:
+            self._data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._count = _HEADER.unpack_from(self._data, 0)
+        if magic != _MAGIC:
+            raise ValueError(f"Not a sentence spans file: '{path}'")
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, idx: int) -> (int, int, int, int):
+        """
+        :return: The sentence's start and end in the source text (characters)
+                 and in the tokenized file (bytes)
+        """
+        if idx < 0:
+            idx += self._count
+        if not 0 <= idx < self._count:
+            raise IndexError(idx)
+        return _SPAN.unpack_from(self._data, _HEADER.size + idx * _SPAN.size)
+
+    def source_span(self, idx: int) -> (int, int):
+        return self[idx][:2]
+
+    def output_span(self, idx: int) -> (int, int):
+        return self[idx][2:]
+
+    def sentence(self, idx: int, tokenized_file) -> str:
+        """
+        Read a single sentence from the tokenized file opened in binary mode.
+        """
+        start, end = self.output_span(idx)
+        tokenized_file.seek(start)
+        return tokenized_file.read(end - start).decode("utf-8")
@@ -0,0 +1,331 @@
+
+import hashlib
+import inspect
+import json
+import os
+from types import ModuleType
+
+from preprocessing.file_scheme import FileScheme
+from preprocessing.instrumentation import StepMeasurement
+
+
+# the hashes of module sources used as the code version of steps, these are
+# computed only once per process
+_code_hash_cache = {}
+
+
+def hash_bytes(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def hash_file(path: str) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def hash_code(module: ModuleType) -> str:
+    result = _code_hash_cache.get(module.__name__, None)
+    if not result:
+        result = hash_file(inspect.getsourcefile(module))
+        _code_hash_cache[module.__name__] = result
+    return result
+
+
+class Step:
+    """
+    The declaration of a single processing step.
+    :param number: The step number used by the FileScheme, None for steps
+                   that produce a value instead of a file (e.g. the language)
+    :param name: The step name, also the key under which the step's state
+                 is kept in the document's manifest record
+    :param run: A function taking a StepContext. It either writes the file
+                at context.output_path or returns the step's value.
+    :param inputs: Names of the steps whose results are used by this step.
+    :param files: Paths to files not produced by any step (e.g. the input pdf)
+    :param params: Everything else that influences the step's result.
+    :param code: Modules whose source is part of the step's code version.
+    :param version: Increase to force a rerun on changes not covered by code.
+    :param output: A function returning the output path for a StepContext,
+                   defaults to the FileScheme's path for the step number.
+    :param external: The output is produced outside of the pipeline (e.g. by
+                     manual cleaning). The step is run every time, but it is
+                     not expected to create the output, which is then tracked
+                     like an input file.
+    """
+
+    def __init__(self, number, name: str, run, inputs=(), files=(), params=None, code=(), version=1,
+                 output=None, external=False):
+        self.number = number
+        self.name = name
+        self.run = run
+        self.inputs = list(inputs)
+        self.files = list(files)
+        self.params = params if params else {}
+        self.code = list(code)
+        self.version = version
+        self.output = output if output else lambda context: context.scheme.path(self.number)
+        self.external = external
+
+    @property
+    def produces_value(self) -> bool:
+        return self.number is None
+
+
+class StepContext:
+
+    def __init__(self, graph, step: Step):
+        self.graph = graph
+        self.step = step
+        self.output_path = None if step.produces_value else step.output(self)
+
+    @property
+    def scheme(self) -> FileScheme:
+        return self.graph.scheme
+
+    @property
+    def params(self) -> dict:
+        return self.step.params
+
+    def input_path(self, name: str) -> str:
+        return self.graph.state(name)["output"]
+
+    def value(self, name: str):
+        return self.graph.state(name)["value"]
+
+    def file_hash(self, path: str) -> str:
+        return self.graph.file_hash(path)
+
+
+class StepGraph:
+    """
+    Runs the declared steps of one document in the order they were added.
+    A step is rerun only if the hash of its inputs, parameters or code has
+    changed since the last run that the document's record knows of. Steps
+    downstream of a changed step are rerun only if the changed step's
+    output actually differs.
+    The record is a plain dict, cf. Manifest.record()
+    Measurements of every executed step are appended to the given list.
+    :param verify_outputs: Also rerun up to date steps whose output file was
+                           removed (e.g. to redo the step by hand), at the
+                           cost of one look at the storage per step
+    :param code: Modules whose source is part of every step's code version,
+                 e.g. the script that declares the steps
+    """
+
+    def __init__(self, scheme: FileScheme, record: dict, measurements: list = None, verify_outputs: bool = False,
+                 code=()):
+        self.scheme = scheme
+        self.record = record
+        self.measurements = measurements if measurements is not None else []
+        self.verify_outputs = verify_outputs
+        self.code = list(code)
+        self.record.setdefault("files", {})
+        self.record.setdefault("steps", {})
+        self.steps = []
+        # the names of steps that could not provide a result in this run
+        self.blocked = set()
+        # the names of steps that were actually executed in this run
+        self.executed = []
+
+    def add(self, step: Step):
+        if step.number is not None:
+            self.scheme.add_step(step.number, step.name)
+        self.steps.append(step)
+
+    def state(self, name: str) -> dict:
+        return self.record["steps"][name]
+
+    def run(self):
+        for step in self.steps:
+            if any(name in self.blocked for name in step.inputs):
+                self.blocked.add(step.name)
+                continue
+            if step.external:
+                self._run_external(step)
+            else:
+                self._run_internal(step)
+
+    def _run_internal(self, step: Step):
+        fingerprint = self._fingerprint(step)
+        state = self.record["steps"].get(step.name, None)
+        context = StepContext(self, step)
+
+        if state and state.get("fingerprint") == fingerprint and \
+                (step.produces_value or not self.verify_outputs or self.scheme.file_exists(context.output_path)):
+            return
+        elif state is None and not step.produces_value and self.scheme.file_exists(context.output_path):
+            # adopt results of runs that predate the manifest instead of
+            # recomputing them
+            pass
+        else:
+            self._remove_stale_output(state, context)
+            value = self._measured_run(step, context)
+            self.executed.append(step.name)
+            if step.produces_value:
+                self.record["steps"][step.name] = self._value_state(fingerprint, value)
+                return
+
+        if self.scheme.file_exists(context.output_path):
+            self.record["steps"][step.name] = self._file_state(fingerprint, context.output_path)
+        else:
+            self.record["steps"].pop(step.name, None)
+            self.blocked.add(step.name)
+
+    def _run_external(self, step: Step):
+        context = StepContext(self, step)
+        self._measured_run(step, context)
+        if self.scheme.file_exists(context.output_path):
+            output_hash = self.file_hash(context.output_path)
+            self.record["steps"][step.name] = self._file_state(output_hash, context.output_path, output_hash)
+        else:
+            self.record["steps"].pop(step.name, None)
+            self.blocked.add(step.name)
+
+    def _measured_run(self, step: Step, context: StepContext):
+        input_paths = [self.state(name).get("output") for name in step.inputs] + step.files
+        measurement = StepMeasurement(self.scheme.basename, step.name, input_paths, context.output_path,
+                                      size=self.scheme.storage.size)
+        try:
+            with measurement:
+                return step.run(context)
+        finally:
+            self.measurements.append(measurement.as_dict())
+
+    def _fingerprint(self, step: Step) -> str:
+        description = {
+            "inputs": {name: self.state(name)["output_hash"] for name in step.inputs},
+            "files": {path: self.file_hash(path) for path in step.files},
+            "params": step.params,
+            "code": {module.__name__: hash_code(module) for module in step.code},
+            # keyed by position, as the script's module name depends on how it is run
+            "graph_code": [hash_code(module) for module in self.code],
+            "version": step.version,
+        }
+        return hash_bytes(json.dumps(description, sort_keys=True).encode("utf-8"))
+
+    def file_hash(self, path: str) -> str:
+        # files not written by the pipeline are only rehashed if their size or
+        # modification time changed since they were seen last
+        stat = os.stat(path)
+        known = self.record["files"].get(path, None)
+        if known and known[0] == stat.st_size and known[1] == stat.st_mtime_ns:
+            return known[2]
+        result = hash_file(path)
+        self.record["files"][path] = [stat.st_size, stat.st_mtime_ns, result]
+        return result
+
+    def _remove_stale_output(self, state: dict, context: StepContext):
+        paths = {context.output_path}
+        if state and state.get("output"):
+            paths.add(state["output"])
+        for path in paths:
+            if path and self.scheme.file_exists(path):
+                self.scheme.remove_file(path)
+
+    def _file_state(self, fingerprint: str, path: str, output_hash: str = None) -> dict:
+        return {
+            "fingerprint": fingerprint,
+            "output": path,
+            "output_hash": output_hash if output_hash else self.scheme.storage.hash_file(path),
+        }
+
+    @staticmethod
+    def _value_state(fingerprint: str, value) -> dict:
+        return {
+            "fingerprint": fingerprint,
+            "value": value,
+            "output_hash": hash_bytes(json.dumps(value).encode("utf-8")),
+        }
+
+
+# TESTS
+
+def _graph_for_test(input_path: str, output_dir: str, record: dict, params: dict, runs: list,
+                    verify_outputs: bool = False) -> StepGraph:
+    # an upper case copy of the input and its length
+    def upper(context: StepContext):
+        runs.append("upper")
+        with open(input_path) as file:
+            context.scheme.write_file(context.output_path, file.read().upper(), create_dirs=True)
+
+    def length(context: StepContext):
+        runs.append("length")
+        context.scheme.write_file(context.output_path, str(len(context.scheme.read_file(context.input_path("upper")))),
+                                  create_dirs=True)
+
+    graph = StepGraph(FileScheme(input_path, output_dir=output_dir), record, verify_outputs=verify_outputs)
+    graph.add(Step(1, "upper", upper, files=[input_path], params=params))
+    graph.add(Step(3, "length", length, inputs=["upper"]))
+    return graph
+
+
+def test_step_graph_reruns():
+    import tempfile
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_path = os.path.join(tmp_dir, "doc.txt")
+        with open(input_path, "w") as file:
+            file.write("some text")
+        output_dir = os.path.join(tmp_dir, "output")
+        record = {}
+
+        def run(params=None, verify_outputs=False) -> list:
+            runs = []
+            graph = _graph_for_test(input_path, output_dir, record, params or {}, runs, verify_outputs)
+            graph.run()
+            assert runs == graph.executed
+            return runs
+
+        assert run() == ["upper", "length"]
+        assert run() == []
+        # another parameter reruns the step, but not the next one as the output is the same
+        assert run({"p": 1}) == ["upper"]
+        assert run({"p": 1}) == []
+        # another input reruns both
+        with open(input_path, "w") as file:
+            file.write("more text")
+        assert run({"p": 1}) == ["upper", "length"]
+        # the same content, but a different length downstream
+        with open(input_path, "w") as file:
+            file.write("MORE TEXT")
+        assert run({"p": 1}) == ["upper"]
+
+        # a removed output is only noticed when verifying the outputs
+        scheme = _graph_for_test(input_path, output_dir, {}, {}, []).scheme
+        os.remove(scheme.path(3))
+        assert run({"p": 1}) == []
+        assert run({"p": 1}, verify_outputs=True) == ["length"]
+        assert run({"p": 1}, verify_outputs=True) == []
+
+
+def test_step_graph_code():
+    import tempfile
+    import types
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_path = os.path.join(tmp_dir, "doc.txt")
+        with open(input_path, "w") as file:
+            file.write("some text")
+        module_path = os.path.join(tmp_dir, "steps.py")
+        module = types.ModuleType("steps_for_test")
+        module.__file__ = module_path
+        record = {}
+
+        def run() -> list:
+            runs = []
+            graph = _graph_for_test(input_path, os.path.join(tmp_dir, "output"), record, {}, runs)
+            graph.code.append(module)
+            graph.run()
+            return runs
+
+        try:
+            for version in range(2):
+                with open(module_path, "w") as file:
+                    file.write(f"VERSION = {version}\n")
+                _code_hash_cache.pop(module.__name__, None)
+                # the code of the graph is part of every step's code
+                assert run() == ["upper", "length"]
+                assert run() == []
+        finally:
+            _code_hash_cache.pop(module.__name__, None)
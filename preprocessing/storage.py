@@ -0,0 +1,439 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import contextlib
+import errno
+import fcntl
+import hashlib
+import os
+import shutil
+import sqlite3
+import tempfile
+import zlib
+
+# the ioctl request to clone a file's extents (a "reflink") on Linux
+_FICLONE = 0x40049409
+
+
+class StorageInterface:
+    """
+    Where the FileScheme keeps the artifacts of the processing steps.
+    Artifacts are addressed by their path in the output directory, even if
+    the storage does not keep them there.
+    Copies marked as editable are meant to be changed by hand (e.g. for the
+    manual cleaning) and are always written as plain files.
+    """
+
+    def read_file(self, path: str) -> str:
+        raise NotImplementedError()
+
+    def write_file(self, path: str, content: str, create_dirs=False):
+        raise NotImplementedError()
+
+    def iter_lines(self, path: str):
+        """
+        The lines of the file as str.splitlines() gives them. Storages that
+        can, read them one at a time.
+        """
+        return iter(self.read_file(path).splitlines())
+
+    def write_lines_iter(self, path: str, lines, create_dirs=False):
+        """
+        Write the lines joined by newlines. Storages that can, write them one
+        at a time.
+        """
+        self.write_file(path, "\n".join(lines), create_dirs)
+
+    def copy_file(self, src: str, dst: str, create_dirs=False, editable=False):
+        raise NotImplementedError()
+
+    def import_file(self, local_path: str, path: str):
+        """
+        Move a file written by an external tool into the storage.
+        """
+        raise NotImplementedError()
+
+    def file_exists(self, path: str) -> bool:
+        raise NotImplementedError()
+
+    def remove_file(self, path: str):
+        raise NotImplementedError()
+
+    def size(self, path: str) -> int:
+        raise NotImplementedError()
+
+    def hash_file(self, path: str) -> str:
+        raise NotImplementedError()
+
+
+def _hash_local_file(path: str) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+# The original layout: every artifact is a file in a step directory.
+class DirectoryStorage(StorageInterface):
+
+    def read_file(self, path: str) -> str:
+        with open(path, 'r') as file:
+            return file.read()
+
+    def write_file(self, path: str, content: str, create_dirs=False):
+        assert not(os.path.isfile(path)), f"File already exists: {path}"
+        if create_dirs:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def iter_lines(self, path: str):
+        with open(path, 'r') as file:
+            for line in file:
+                # splitlines() also splits at form feeds etc., which reading
+                # the file line by line does not
+                yield from line.splitlines()
+
+    def write_lines_iter(self, path: str, lines, create_dirs=False):
+        assert not(os.path.isfile(path)), f"File already exists: {path}"
+        if create_dirs:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # the lines may fail to be produced half way through, so they are
+        # written to a temporary file first and never leave a partial result
+        tmp_path = f"{path}.part"
+        try:
+            with open(tmp_path, 'w') as f:
+                for idx, line in enumerate(lines):
+                    if idx:
+                        f.write("\n")
+                    f.write(line)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.isfile(tmp_path):
+                os.remove(tmp_path)
+
+    @staticmethod
+    def _prepare_copy(dst: str, create_dirs: bool):
+        if create_dirs:
+            dir = dst if os.path.isdir(dst) else os.path.dirname(dst)
+            os.makedirs(dir, exist_ok=True)
+
+    def copy_file(self, src: str, dst: str, create_dirs=False, editable=False):
+        self._prepare_copy(dst, create_dirs)
+        shutil.copy(src, dst)
+
+    def import_file(self, local_path: str, path: str):
+        assert not(os.path.isfile(path)), f"File already exists: {path}"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.move(local_path, path)
+
+    def file_exists(self, path: str) -> bool:
+        return os.path.isfile(path)
+
+    def remove_file(self, path: str):
+        os.remove(path)
+
+    def size(self, path: str) -> int:
+        try:
+            return os.stat(path).st_size
+        except (OSError, TypeError):
+            return 0
+
+    def hash_file(self, path: str) -> str:
+        return _hash_local_file(path)
+
+
+# Like the directory layout, but copies share their data with the source.
+# A reflink (copy-on-write clone) is used where the file system supports it.
+# Otherwise copies that nobody is meant to edit become hard links, as changing
+# one of them in place would change the other as well.
+class LinkingStorage(DirectoryStorage):
+
+    @staticmethod
+    def _reflink(src: str, dst: str) -> bool:
+        try:
+            with open(src, "rb") as src_file, open(dst, "wb") as dst_file:
+                fcntl.ioctl(dst_file.fileno(), _FICLONE, src_file.fileno())
+            return True
+        except OSError as e:
+            if os.path.isfile(dst):
+                os.remove(dst)
+            if e.errno in (errno.EOPNOTSUPP, errno.EXDEV, errno.EINVAL, errno.ENOTTY, errno.EBADF):
+                return False
+            raise
+
+    def copy_file(self, src: str, dst: str, create_dirs=False, editable=False):
+        self._prepare_copy(dst, create_dirs)
+        if os.path.isdir(dst):
+            dst = os.path.join(dst, os.path.basename(src))
+        if self._reflink(src, dst):
+            return
+        if not editable:
+            try:
+                os.link(src, dst)
+                return
+            except OSError:
+                pass
+        shutil.copy(src, dst)
+
+
+# sqlite connections of this process by container path
+_connections = {}
+
+
+# All artifacts in a single sqlite file, that can be moved as one. The contents
+# are kept as blobs addressed by their hash, so copies cost nothing, and can be
+# compressed. Files that are not in the container (the editable copies for the
+# manual cleaning and everything else outside of it) are read from the disk.
+# Files are always read and written as a whole, even when streaming lines.
+class ContainerStorage(StorageInterface):
+
+    COMPRESSIONS = ["none", "zlib", "zstd"]
+
+    def __init__(self, container_path: str, output_dir: str, compression: str = "none"):
+        if compression not in self.COMPRESSIONS:
+            raise ValueError(f"Unknown compression: '{compression}'")
+        if compression == "zstd":
+            # an optional dependency only needed for this compression
+            import zstandard  # noqa: F401
+        self.container_path = container_path
+        self.output_dir = output_dir
+        self.compression = compression
+
+    @property
+    def _db(self) -> sqlite3.Connection:
+        # connections must not be shared between processes
+        key = (os.getpid(), self.container_path)
+        connection = _connections.get(key, None)
+        if not connection:
+            os.makedirs(os.path.dirname(os.path.abspath(self.container_path)), exist_ok=True)
+            connection = sqlite3.connect(self.container_path, timeout=120, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS blobs (hash TEXT PRIMARY KEY, compression TEXT, "
+                               "size INTEGER, content BLOB)")
+            connection.execute("CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, hash TEXT)")
+            _connections[key] = connection
+        return connection
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        # several workers write to the container, the blobs that a change
+        # refers to (or removes) must not change before it is committed
+        db = self._db
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def _key(self, path: str) -> str:
+        # keys are relative to the output dir so that the container can be moved
+        return os.path.relpath(os.path.abspath(path), os.path.abspath(self.output_dir))
+
+    def _hash_of(self, path: str):
+        row = self._db.execute("SELECT hash FROM files WHERE path = ?", (self._key(path),)).fetchone()
+        return row[0] if row else None
+
+    def _compress(self, data: bytes) -> bytes:
+        if self.compression == "zlib":
+            return zlib.compress(data)
+        elif self.compression == "zstd":
+            import zstandard
+            return zstandard.ZstdCompressor().compress(data)
+        return data
+
+    @staticmethod
+    def _decompress(data: bytes, compression: str) -> bytes:
+        if compression == "zlib":
+            return zlib.decompress(data)
+        elif compression == "zstd":
+            import zstandard
+            return zstandard.ZstdDecompressor().decompress(data)
+        return data
+
+    def _read_bytes(self, content_hash: str) -> bytes:
+        compression, content = self._db.execute(
+            "SELECT compression, content FROM blobs WHERE hash = ?", (content_hash,)).fetchone()
+        return self._decompress(content, compression)
+
+    def _write_bytes(self, path: str, data: bytes):
+        content_hash = hashlib.sha256(data).hexdigest()
+        compressed = self._compress(data)
+        with self._transaction() as db:
+            assert not(self.file_exists(path)), f"File already exists: {path}"
+            db.execute("INSERT OR IGNORE INTO blobs VALUES (?, ?, ?, ?)",
+                       (content_hash, self.compression, len(data), compressed))
+            db.execute("INSERT INTO files VALUES (?, ?)", (self._key(path), content_hash))
+
+    def read_file(self, path: str) -> str:
+        content_hash = self._hash_of(path)
+        if content_hash is None:
+            return DirectoryStorage().read_file(path)
+        return self._read_bytes(content_hash).decode("utf-8")
+
+    def write_file(self, path: str, content: str, create_dirs=False):
+        self._write_bytes(path, content.encode("utf-8"))
+
+    def copy_file(self, src: str, dst: str, create_dirs=False, editable=False):
+        if editable:
+            DirectoryStorage().write_file(dst, self.read_file(src), create_dirs=True)
+            return
+        with self._transaction() as db:
+            content_hash = self._hash_of(src)
+            if content_hash is not None:
+                assert not(self.file_exists(dst)), f"File already exists: {dst}"
+                db.execute("INSERT INTO files VALUES (?, ?)", (self._key(dst), content_hash))
+        if content_hash is None:
+            self.write_file(dst, DirectoryStorage().read_file(src))
+
+    def import_file(self, local_path: str, path: str):
+        with open(local_path, "rb") as file:
+            self._write_bytes(path, file.read())
+        os.remove(local_path)
+
+    def file_exists(self, path: str) -> bool:
+        return self._hash_of(path) is not None or os.path.isfile(path)
+
+    def remove_file(self, path: str):
+        with self._transaction() as db:
+            content_hash = self._hash_of(path)
+            if content_hash is not None:
+                db.execute("DELETE FROM files WHERE path = ?", (self._key(path),))
+                db.execute("DELETE FROM blobs WHERE hash = ? AND NOT EXISTS "
+                           "(SELECT 1 FROM files WHERE hash = ?)", (content_hash, content_hash))
+        if content_hash is None:
+            os.remove(path)
+
+    def size(self, path: str) -> int:
+        if path is None:
+            return 0
+        content_hash = self._hash_of(path)
+        if content_hash is None:
+            return DirectoryStorage().size(path)
+        return self._db.execute("SELECT size FROM blobs WHERE hash = ?", (content_hash,)).fetchone()[0]
+
+    def hash_file(self, path: str) -> str:
+        content_hash = self._hash_of(path)
+        return content_hash if content_hash else _hash_local_file(path)
+
+    def export(self, target_dir: str, prefix: str = ""):
+        """
+        Write all files with keys starting with the prefix below the target
+        directory, e.g. to hand the "042_separate_by_language" files to tools
+        that expect plain files.
+        """
+        rows = self._db.execute("SELECT path, hash FROM files WHERE substr(path, 1, ?) = ? ORDER BY path",
+                                (len(prefix), prefix)).fetchall()
+        for key, content_hash in rows:
+            path = os.path.join(target_dir, key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as file:
+                file.write(self._read_bytes(content_hash))
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Export the files in a storage container as plain files.")
+    parser.add_argument("container", type=str, help="The sqlite container written by preprocessing.py")
+    parser.add_argument("target_dir", type=str, help="The directory to write the files to.")
+    parser.add_argument("--prefix", type=str, default="",
+                        help="Only export files below this path, e.g. '042_separate_by_language'.")
+    args = parser.parse_args()
+
+    ContainerStorage(args.container, output_dir=args.target_dir).export(args.target_dir, args.prefix)
+
+
+# TESTS
+
+def _storage_round_trip(storage: StorageInterface, output_dir: str) -> dict:
+    # the same operations on any storage, returning what can be observed
+    path = os.path.join(output_dir, "001_a", "doc.txt")
+    storage.write_file(path, "first line\nzweite Zeile – ü\n", create_dirs=True)
+    storage.write_lines_iter(os.path.join(output_dir, "002_b", "lines.txt"), iter(["a", "b", ""]), create_dirs=True)
+    storage.copy_file(path, os.path.join(output_dir, "003_c", "copy.txt"), create_dirs=True)
+    storage.copy_file(path, os.path.join(output_dir, "003_c", "doc-TODO.txt"), create_dirs=True, editable=True)
+    local_path = os.path.join(output_dir, "local.txt")
+    with open(local_path, "w") as file:
+        file.write("written by a tool")
+    storage.import_file(local_path, os.path.join(output_dir, "001_a", "imported.txt"))
+    storage.remove_file(path)
+    try:
+        storage.write_file(os.path.join(output_dir, "003_c", "copy.txt"), "again")
+        overwritten = True
+    except (AssertionError, FileExistsError):
+        overwritten = False
+    with open(os.path.join(output_dir, "003_c", "doc-TODO.txt"), "r") as file:
+        editable = file.read()
+    paths = [path, os.path.join(output_dir, "002_b", "lines.txt"), os.path.join(output_dir, "003_c", "copy.txt"),
+             os.path.join(output_dir, "001_a", "imported.txt")]
+    return {
+        "exists": [storage.file_exists(p) for p in paths] + [os.path.exists(local_path)],
+        "contents": [storage.read_file(p) for p in paths[1:]],
+        "lines": list(storage.iter_lines(paths[2])),
+        "sizes": [storage.size(p) for p in paths[1:]],
+        "hashes": [storage.hash_file(p) == hashlib.sha256(storage.read_file(p).encode("utf-8")).hexdigest()
+                   for p in paths[1:]],
+        # the editable copy is a plain file for any storage
+        "editable": editable,
+        "overwritten": overwritten,
+    }
+
+
+def test_container_storage_round_trip():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        expected = _storage_round_trip(DirectoryStorage(), os.path.join(tmp_dir, "directory"))
+        expected.pop("overwritten")
+        for compression in ["none", "zlib"]:
+            output_dir = os.path.join(tmp_dir, compression)
+            storage = ContainerStorage(os.path.join(tmp_dir, f"{compression}.sqlite"), output_dir, compression)
+            result = _storage_round_trip(storage, output_dir)
+            # unlike a directory, the container refuses to overwrite a file
+            assert result.pop("overwritten") is False
+            assert result == expected, compression
+            # only the editable copy is on the disk
+            assert sorted(os.listdir(output_dir)) == ["003_c"]
+
+
+def test_container_storage_shares_and_removes_blobs():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        storage = ContainerStorage(os.path.join(tmp_dir, "c.sqlite"), tmp_dir, "zlib")
+        blob_count = lambda: storage._db.execute("SELECT COUNT(*) FROM blobs").fetchone()[0]
+        storage.write_file(os.path.join(tmp_dir, "a.txt"), "same")
+        storage.copy_file(os.path.join(tmp_dir, "a.txt"), os.path.join(tmp_dir, "b.txt"))
+        storage.write_file(os.path.join(tmp_dir, "c.txt"), "same")
+        assert blob_count() == 1
+        storage.remove_file(os.path.join(tmp_dir, "a.txt"))
+        storage.remove_file(os.path.join(tmp_dir, "b.txt"))
+        assert blob_count() == 1
+        storage.remove_file(os.path.join(tmp_dir, "c.txt"))
+        assert blob_count() == 0
+
+        # a failed write leaves nothing behind
+        storage.write_file(os.path.join(tmp_dir, "d.txt"), "first")
+        try:
+            storage.write_file(os.path.join(tmp_dir, "d.txt"), "second")
+        except AssertionError:
+            pass
+        assert storage.read_file(os.path.join(tmp_dir, "d.txt")) == "first" and blob_count() == 1
+
+
+def test_container_storage_export():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output_dir = os.path.join(tmp_dir, "out")
+        storage = ContainerStorage(os.path.join(tmp_dir, "c.sqlite"), output_dir, "zlib")
+        files = {"006_escape_xml_chars/a.txt": "a &amp; b", "042_separate_by_language/de/a.txt": "ä\n",
+                 "042_separate_by_language/en/b.txt": ""}
+        for key, content in files.items():
+            storage.write_file(os.path.join(output_dir, key), content)
+        target_dir = os.path.join(tmp_dir, "export")
+        storage.export(target_dir, prefix="042")
+        exported = {}
+        for root, _, names in os.walk(target_dir):
+            for name in names:
+                with open(os.path.join(root, name), "r", encoding="utf-8") as file:
+                    exported[os.path.relpath(os.path.join(root, name), target_dir)] = file.read()
+        assert exported == {k: v for k, v in files.items() if k.startswith("042")}
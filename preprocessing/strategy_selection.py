@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import glob
+import json
+import os
+import random
+import re
+import shutil
+import statistics
+import tempfile
+import unicodedata
+
+from preprocessing import cleaning
+from preprocessing.instrumentation import StepMeasurement
+from preprocessing.language_identification import LanguageIdentification
+from preprocessing.subprocess_runner import SubprocessRunner
+from preprocessing.text_extraction import TextExtractor, count_pdf_pages
+
+# By default the source of a document (its publisher, journal, series...) is
+# the part of its file name before the first "_" or "-", e.g. "aa" for
+# "aa_1998_017.pdf". Documents of a source are expected to share a layout.
+DEFAULT_SOURCE_PATTERN = r"^([^_-]+)[_-]"
+
+# the selection's entry for documents of sources that were not benchmarked
+ANY_SOURCE = "*"
+
+# how much each quality proxy adds to (or takes from) a strategy's score
+_quality_weights = {
+    "dictionary_hit_rate": 1.0,
+    "garbage_char_ratio": -2.0,
+    "hyphenated_line_ratio": -0.5,
+}
+
+_max_words_checked = 2000
+
+# the languages that there are dictionaries for
+_languages = ["de", "en", "es", "fr", "it"]
+
+# identifies the language from a sample of lines, as the pipeline does
+_language_identification = LanguageIdentification(_languages)
+
+
+def source_of(path: str, source_pattern: str = DEFAULT_SOURCE_PATTERN) -> str:
+    name = os.path.basename(path)
+    match = re.match(source_pattern, name)
+    return match.group(1) if match else os.path.splitext(name)[0]
+
+
+def _is_garbage(char: str) -> bool:
+    # control characters other than whitespace, private use, unassigned
+    # code points and the replacement character of broken encodings
+    if char in "\n\r\t\f":
+        return False
+    return char == "\ufffd" or unicodedata.category(char) in ("Cc", "Co", "Cn", "Cs")
+
+
+def quality_proxies(text: str, language_code: str) -> dict:
+    """
+    Simple measures of how usable an extracted text is, that do not need a
+    reference text.
+    """
+    lines = [l.rstrip() for l in text.splitlines() if l.strip()]
+    chars = [c for c in text if not c.isspace() or c == "\f"]
+    words = re.findall(r"[^\W\d_]{3,}", text)
+    # an even sample of the words, spellchecking is the slow part here
+    words = words[::max(1, len(words) // _max_words_checked)]
+    return {
+        "hyphenated_line_ratio": sum(l.endswith("-") for l in lines) / len(lines) if lines else 0.0,
+        "dictionary_hit_rate": sum(cleaning.is_known_word(w, language_code) for w in words) / len(words)
+                               if words else 0.0,
+        "garbage_char_ratio": sum(map(_is_garbage, chars)) / len(chars) if chars else 0.0,
+    }
+
+
+def quality_score(proxies: dict) -> float:
+    return sum(weight * proxies[name] for name, weight in _quality_weights.items())
+
+
+def benchmark_document(path: str, strategies: [TextExtractor.Strategy], runner: SubprocessRunner,
+                       work_dir: str) -> [dict]:
+    """
+    Extract the document with every strategy and measure speed and quality.
+    :return: One result per strategy, a broken document fails for all of them
+    """
+    pages = None
+    results = []
+    language_code = None
+    for strategy in strategies:
+        output_path = os.path.join(work_dir, strategy.name, os.path.basename(path) + ".txt")
+        result = {"document": path, "strategy": strategy.name, "pages": pages, "failed": False}
+        measurement = StepMeasurement(path, strategy.name, [path], output_path)
+        try:
+            # pdfminer raises its own exceptions for broken files
+            if pages is None:
+                pages = result["pages"] = count_pdf_pages(path)
+            with measurement:
+                TextExtractor(strategy, runner).extract(path, output_path)
+            with open(output_path, "r") as file:
+                text = file.read()
+        except Exception as e:
+            print("WARN:", f"{strategy.name} failed for '{path}': {e}")
+            result["failed"] = True
+            results.append(result)
+            continue
+        # all strategies are checked against the language of the first text
+        language_code = language_code or _language_identification.identify_text(text)
+        wall = measurement.values["wall_seconds"]
+        result.update(wall_seconds=wall, cpu_seconds=measurement.values["cpu_seconds"],
+                      pages_per_second=pages / wall if wall > 0 else 0.0, language=language_code,
+                      **quality_proxies(text, language_code))
+        result["quality"] = quality_score(result)
+        results.append(result)
+    return results
+
+
+def _select(results: [dict], tolerance: float) -> str:
+    # the fastest strategy among those whose quality is close to the best
+    by_strategy = {}
+    for result in results:
+        by_strategy.setdefault(result["strategy"], []).append(result)
+    summaries = {}
+    for name, strategy_results in by_strategy.items():
+        # a strategy failing on any document of the source is not selected
+        if any(r["failed"] for r in strategy_results):
+            continue
+        summaries[name] = (statistics.mean(r["quality"] for r in strategy_results),
+                           sum(r["pages"] for r in strategy_results) /
+                           max(sum(r["wall_seconds"] for r in strategy_results), 1e-9))
+    if not summaries:
+        return None
+    best_quality = max(quality for (quality, _) in summaries.values())
+    candidates = [(speed, name) for name, (quality, speed) in summaries.items()
+                  if quality >= best_quality - tolerance]
+    return max(candidates)[1]
+
+
+def selection_table(results: [dict], source_pattern: str = DEFAULT_SOURCE_PATTERN, tolerance: float = 0.02) -> dict:
+    """
+    Select a strategy per source from the benchmark results.
+    :return: The selection by source, with an entry for any other source
+    """
+    by_source = {}
+    for result in results:
+        by_source.setdefault(source_of(result["document"], source_pattern), []).append(result)
+    selection = {source: _select(source_results, tolerance) for source, source_results in by_source.items()}
+    selection[ANY_SOURCE] = _select(results, tolerance)
+    return {source: name for source, name in selection.items() if name}
+
+
+class StrategySelection:
+    """
+    The strategy selection table written by this module's benchmark, as
+    used by the pipeline to pick a pdf strategy per document.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "r") as file:
+            table = json.load(file)
+        self.source_pattern = table["source_pattern"]
+        self.selection = table["selection"]
+
+    def strategy_for(self, path: str):
+        name = self.selection.get(source_of(path, self.source_pattern), self.selection.get(ANY_SOURCE, None))
+        return TextExtractor.Strategy[name] if name else None
+
+
+def _sample(paths: [str], per_source: int, source_pattern: str, seed: int) -> [str]:
+    by_source = {}
+    for path in sorted(paths):
+        by_source.setdefault(source_of(path, source_pattern), []).append(path)
+    rng = random.Random(seed)
+    result = []
+    for source in sorted(by_source.keys()):
+        source_paths = by_source[source]
+        result += sorted(rng.sample(source_paths, min(per_source, len(source_paths))))
+    return result
+
+
+def main(args: argparse.Namespace):
+    paths = [p for p in glob.glob(f"{args.input_dir}/*") if os.path.splitext(p)[1] in (".pdf", ".PDF")]
+    strategies = [TextExtractor.Strategy[name] for name in args.strategies]
+    runner = SubprocessRunner(timeout=args.timeout or None)
+    results = []
+    work_dir = tempfile.mkdtemp(prefix="chronoi-strategy-selection-")
+    try:
+        for path in _sample(paths, args.per_source, args.source_pattern, args.seed):
+            print(f"Benchmarking: {path}", flush=True)
+            results += benchmark_document(path, strategies, runner, work_dir)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    selection = selection_table(results, args.source_pattern, args.tolerance)
+    with open(args.table, "w") as file:
+        json.dump({"source_pattern": args.source_pattern, "tolerance": args.tolerance,
+                   "selection": selection, "results": results}, file, indent=2)
+
+    print("")
+    print("%-24s %-24s %8s %10s %10s %10s %10s" % ("source", "strategy", "pages/s", "quality", "dict hits",
+                                                    "hyphens", "garbage"))
+    for source, name in sorted(selection.items()):
+        chosen = [r for r in results if r["strategy"] == name and not r["failed"]
+                  and (source == ANY_SOURCE or source_of(r["document"], args.source_pattern) == source)]
+        print("%-24s %-24s %8.1f %10.3f %10.3f %10.3f %10.4f" % (
+            source, name, statistics.mean(r["pages_per_second"] for r in chosen),
+            statistics.mean(r["quality"] for r in chosen),
+            statistics.mean(r["dictionary_hit_rate"] for r in chosen),
+            statistics.mean(r["hyphenated_line_ratio"] for r in chosen),
+            statistics.mean(r["garbage_char_ratio"] for r in chosen)))
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark the pdf extraction strategies on a sample of the input files and write a table of "
+                    "the strategy to use per source, for preprocessing.py's --strategy_table. Run this as "
+                    "'python3 -m preprocessing.strategy_selection' from the repository's directory.")
+    parser.add_argument("input_dir", type=str, help="The directory of input files, only pdfs are used.")
+    parser.add_argument("table", type=str, help="Where to write the json table with the selection and results.")
+    parser.add_argument("--strategies", type=str, nargs="+",
+                        default=[s.name for s in TextExtractor.Strategy if s.name.startswith("PDF_")],
+                        help="The strategies to compare, defaults to all pdf strategies.")
+    parser.add_argument("--per_source", type=int, default=5, help="The number of documents to sample per source.")
+    parser.add_argument("--source_pattern", type=str, default=DEFAULT_SOURCE_PATTERN,
+                        help="A regex whose first group is a document's source when matched to the file name.")
+    parser.add_argument("--tolerance", type=float, default=0.02,
+                        help="Select the fastest strategy whose quality score is at most this much below the best.")
+    parser.add_argument("--timeout", type=float, default=600,
+                        help="The number of seconds after which an external tool is stopped, 0 for none.")
+    parser.add_argument("--seed", type=int, default=0, help="The seed for sampling the documents.")
+
+    main(parser.parse_args())
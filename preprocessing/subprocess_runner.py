@@ -0,0 +1,136 @@
+
+import contextlib
+import fcntl
+import os
+import signal
+import subprocess
+import time
+
+
+def _peak_rss_kb_of(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/status", "r") as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+class ExternalToolError(Exception):
+    """
+    An external tool failed, timed out or could not be started, even after
+    all retries.
+    """
+
+    def __init__(self, message: str, calls: [dict]):
+        super().__init__(message)
+        self.calls = calls
+
+
+class SubprocessRunner:
+    """
+    Runs the external tools of the text extraction. Every call can be
+    limited in time and is retried on failure. The number of tools running at
+    once can be limited with slots, which are lock files in a directory, so
+    that the limit holds for all worker processes sharing that directory.
+    The resource usage of every attempt is kept in the list of calls.
+    """
+
+    def __init__(self, timeout: float = None, retries: int = 0, slots: int = 0, slots_dir: str = None,
+                 calls: list = None):
+        self.timeout = timeout
+        self.retries = retries
+        self.slots = slots
+        self.slots_dir = slots_dir
+        self.calls = calls if calls is not None else []
+
+    def run(self, params: [str], label: str = "", stdout=None, cwd: str = None) -> dict:
+        """
+        Run the command until it succeeds or the retries are used up.
+        :param label: What the call is about (e.g. the input file) for the accounting
+        :param stdout: An open file to write the tool's standard output to
+        :return: The accounting of the successful attempt
+        """
+        attempts = []
+        for attempt in range(self.retries + 1):
+            if stdout is not None:
+                stdout.seek(0)
+                stdout.truncate()
+            call = self._run_once(params, stdout, cwd)
+            call.update(label=label, attempt=attempt)
+            self.calls.append(call)
+            attempts.append(call)
+            if call["returncode"] == 0:
+                return call
+            if call["error"]:
+                # retrying will not help if the tool is missing
+                break
+        last = attempts[-1]
+        reason = last["error"] or ("timed out" if last["timed_out"] else f"exit code {last['returncode']}")
+        raise ExternalToolError(f"'{params[0]}' failed for '{label}' after {len(attempts)} attempt(s): {reason}",
+                                attempts)
+
+    @contextlib.contextmanager
+    def _slot(self):
+        if not self.slots:
+            yield
+            return
+        os.makedirs(self.slots_dir, exist_ok=True)
+        delay = 0.01
+        while True:
+            for idx in range(self.slots):
+                file = open(os.path.join(self.slots_dir, f"slot-{idx}.lock"), "w")
+                try:
+                    fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    file.close()
+                    continue
+                try:
+                    yield
+                finally:
+                    fcntl.flock(file, fcntl.LOCK_UN)
+                    file.close()
+                return
+            time.sleep(delay)
+            delay = min(2 * delay, 0.5)
+
+    def _run_once(self, params: [str], stdout, cwd: str) -> dict:
+        call = {"command": os.path.basename(params[0]), "returncode": None, "timed_out": False, "error": "",
+                "slot_wait_seconds": 0.0, "wall_seconds": 0.0, "cpu_seconds": 0.0, "peak_rss_kb": 0}
+        wait_start = time.perf_counter()
+        with self._slot():
+            start = time.perf_counter()
+            call["slot_wait_seconds"] = start - wait_start
+            try:
+                # in a session of its own, so that a timeout also ends the tool's children
+                process = subprocess.Popen(params, stdout=stdout, cwd=cwd, start_new_session=True)
+            except OSError as e:
+                call["error"] = str(e)
+                return call
+            # wait4() instead of wait() to get the resource usage of just this child
+            deadline = start + self.timeout if self.timeout else None
+            delay = 0.001
+            peak_rss_kb = 0
+            while True:
+                # the child's ru_maxrss counts the memory of this process it
+                # was forked from, so the tool's own high water mark is read
+                # while it runs (and may miss a peak shortly before its end)
+                peak_rss_kb = max(peak_rss_kb, _peak_rss_kb_of(process.pid))
+                pid, status, usage = os.wait4(process.pid, os.WNOHANG)
+                if pid:
+                    break
+                if deadline and time.perf_counter() > deadline:
+                    os.killpg(process.pid, signal.SIGKILL)
+                    _, status, usage = os.wait4(process.pid, 0)
+                    call["timed_out"] = True
+                    break
+                time.sleep(delay)
+                delay = min(2 * delay, 0.1)
+            process.returncode = os.waitstatus_to_exitcode(status)
+        call["wall_seconds"] = time.perf_counter() - start
+        call["cpu_seconds"] = usage.ru_utime + usage.ru_stime
+        call["peak_rss_kb"] = peak_rss_kb
+        call["returncode"] = None if call["timed_out"] else process.returncode
+        return call
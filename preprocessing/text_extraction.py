@@ -1,14 +1,26 @@
 
-import subprocess
+import argparse
+import concurrent.futures
+import io
+import json
+import sys
+import tempfile
 
 import bs4
+from lxml import etree
 from enum import Enum
 import os
 import shutil
 
+from preprocessing.subprocess_runner import ExternalToolError, SubprocessRunner
+
 
 class TextExtractionStrategyInterface:
 
+    def __init__(self, runner: SubprocessRunner = None):
+        # runs the external tools, if the strategy uses any
+        self.runner = runner if runner else SubprocessRunner()
+
     def extract(self, input_path: str, output_path: str):
         raise NotImplementedError()
 
@@ -27,7 +39,7 @@ class PdfGhostscriptTextExtractionStrategy(TextExtractionStrategyInterface):
     def extract(self, input_path, output_path):
         output_file_param = f"-sOutputFile={output_path}"
         params = self.PARAMS + [output_file_param, input_path]
-        subprocess.call(params)
+        self.runner.run(params, label=input_path)
 
 # PDFMiner is a PDF extractor with reasonably good text composition
 # It is also able to preserve page delimiters.
@@ -37,7 +49,7 @@ class PdfMinerTextExtractionStrategy(TextExtractionStrategyInterface):
 
     def extract(self, input_path, output_path):
         params = ["pdf2txt.py", "-o", output_path, input_path]
-        subprocess.call(params)
+        self.runner.run(params, label=input_path)
 
 # MuPDF's mutool command is exceptionally fast and does very good text
 # composition.
@@ -45,7 +57,95 @@ class PdfMutoolTextExtractionStrategy(TextExtractionStrategyInterface):
 
     def extract(self, input_path, output_path):
         params = [ "mutool", "convert", "-F", "text", "-o", output_path, input_path]
-        subprocess.call(params)
+        self.runner.run(params, label=input_path)
+
+
+def page_sidecar_path(output_path: str) -> str:
+    """
+    Where the page delimiters of an extracted text are kept, if they are.
+    """
+    return os.path.splitext(output_path)[0] + ".pages.json"
+
+
+def _extract_pdf_pages(input_path: str, page_numbers: [int]) -> [str]:
+    # imported here, so that the other strategies work without pdfminer
+    from pdfminer.converter import TextConverter
+    from pdfminer.layout import LAParams
+    from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+    from pdfminer.pdfpage import PDFPage
+
+    # the same conversion that pdf2txt.py does, but collecting the pages
+    # one by one (each page's text ends in a form feed)
+    result = []
+    resources = PDFResourceManager()
+    out = io.StringIO()
+    converter = TextConverter(resources, out, laparams=LAParams())
+    interpreter = PDFPageInterpreter(resources, converter)
+    with open(input_path, "rb") as file:
+        for page in PDFPage.get_pages(file, pagenos=set(page_numbers)):
+            interpreter.process_page(page)
+            result.append(out.getvalue())
+            out.seek(0)
+            out.truncate()
+    converter.close()
+    return result
+
+
+def count_pdf_pages(input_path: str) -> int:
+    from pdfminer.pdfpage import PDFPage
+    with open(input_path, "rb") as file:
+        return sum(1 for _ in PDFPage.get_pages(file))
+
+
+# The same extraction as with pdf2txt.py, but in this process and with
+# pdfminer's python bindings. Large documents are split into page ranges that
+# are extracted by parallel worker processes and put back together in order.
+# The workers are started as separate python processes, because the pipeline
+# may already run this in a (daemonic) worker process of its own, which is
+# not allowed to have children of the multiprocessing kind.
+class PdfMinerInProcessTextExtractionStrategy(TextExtractionStrategyInterface):
+
+    def __init__(self, runner: SubprocessRunner = None, workers: int = None, pages_per_worker: int = 50,
+                 page_sidecar=False):
+        super().__init__(runner)
+        self.workers = workers if workers else os.cpu_count()
+        self.pages_per_worker = pages_per_worker
+        self.page_sidecar = page_sidecar
+
+    def _extract_in_worker(self, input_path: str, first: int, last: int) -> [str]:
+        package_parent = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        params = [sys.executable, "-m", "preprocessing.text_extraction", "pdf_pages",
+                  os.path.abspath(input_path), str(first), str(last)]
+        with tempfile.TemporaryFile() as out_file:
+            self.runner.run(params, label=f"{input_path}[{first}:{last}]", stdout=out_file, cwd=package_parent)
+            out_file.seek(0)
+            return json.loads(out_file.read().decode("utf-8"))
+
+    def extract_pages(self, input_path: str) -> [str]:
+        page_count = count_pdf_pages(input_path)
+        if self.workers < 2 or page_count <= self.pages_per_worker:
+            return _extract_pdf_pages(input_path, range(page_count))
+
+        ranges = [(first, min(first + self.pages_per_worker, page_count))
+                  for first in range(0, page_count, self.pages_per_worker)]
+        # the threads only wait for the worker processes
+        with concurrent.futures.ThreadPoolExecutor(self.workers) as executor:
+            parts = executor.map(lambda r: self._extract_in_worker(input_path, *r), ranges)
+            return [page for part in parts for page in part]
+
+    def extract(self, input_path: str, output_path: str):
+        pages = self.extract_pages(input_path)
+        with open(output_path, "w") as out_file:
+            out_file.write("".join(pages))
+        if self.page_sidecar:
+            # the character offsets of each page's start and end in the text
+            offsets = []
+            start = 0
+            for page in pages:
+                offsets.append([start, start + len(page)])
+                start += len(page)
+            with open(page_sidecar_path(output_path), "w") as out_file:
+                json.dump({"pages": offsets}, out_file)
 
 
 class XMLBeautifulsoupTextExtractionStrategy(TextExtractionStrategyInterface):
@@ -57,6 +157,85 @@ class XMLBeautifulsoupTextExtractionStrategy(TextExtractionStrategyInterface):
             out_file.write(doc.text)
 
 
+class _StreamingTextTarget:
+    """
+    An lxml parser target writing the text of a document as it is parsed,
+    without building a tree. Whitespace is treated like BeautifulSoup does it,
+    so that the text is the same as that of XMLBeautifulsoupTextExtractionStrategy.
+    """
+
+    _ascii_spaces = "\x20\x0a\x09\x0c\x0d"
+
+    def __init__(self, out_file, skip_elements: [str]):
+        self.out_file = out_file
+        self.skip_elements = set(skip_elements)
+        self.skip_depth = 0
+        self.data_parts = []
+
+    def _end_data(self):
+        # like BeautifulSoup.endData(): a string that is only ascii
+        # whitespace becomes a single newline or blank
+        if not self.data_parts:
+            return
+        data = "".join(self.data_parts)
+        self.data_parts = []
+        if not data.strip(self._ascii_spaces):
+            data = "\n" if "\n" in data else " "
+        self.out_file.write(data)
+
+    def start(self, tag, attrib, nsmap=None):
+        self._end_data()
+        # the name without the namespace, e.g. "teiHeader"
+        if self.skip_depth or tag.rpartition("}")[2] in self.skip_elements:
+            self.skip_depth += 1
+
+    def end(self, tag):
+        self._end_data()
+        if self.skip_depth:
+            self.skip_depth -= 1
+
+    def data(self, content):
+        if not self.skip_depth:
+            self.data_parts.append(content)
+
+    def comment(self, text):
+        self._end_data()
+
+    def pi(self, target, data=None):
+        self._end_data()
+
+    def doctype(self, name, pubid, system):
+        self._end_data()
+
+    def close(self):
+        self._end_data()
+
+
+# Parses XML (and HTML as if it were XML) in chunks and writes the text as it
+# goes, so that memory use does not grow with the document. Elements can be
+# skipped with all their content by their name, e.g. "teiHeader" or "note".
+class XMLStreamingTextExtractionStrategy(TextExtractionStrategyInterface):
+
+    CHUNK_SIZE = 1 << 16
+
+    def __init__(self, runner: SubprocessRunner = None, skip_elements: [str] = ()):
+        super().__init__(runner)
+        self.skip_elements = skip_elements
+
+    def extract(self, input_path: str, output_path: str):
+        with open(input_path, "r") as in_file, open(output_path, "w") as out_file:
+            # the same parser options that BeautifulSoup uses for "lxml-xml"
+            parser = etree.XMLParser(target=_StreamingTextTarget(out_file, self.skip_elements), recover=True,
+                                     huge_tree=True)
+            empty = True
+            for chunk in iter(lambda: in_file.read(self.CHUNK_SIZE), ""):
+                parser.feed(chunk)
+                empty = False
+            # lxml fails on an empty document, which has no text either
+            if not empty:
+                parser.close()
+
+
 class TextFileCopyStrategy(TextExtractionStrategyInterface):
 
     def extract(self, input_path: str, output_path: str):
@@ -69,18 +248,35 @@ class TextExtractor:
         PDF_Ghostscript = PdfGhostscriptTextExtractionStrategy
         PDF_PdfMiner = PdfMinerTextExtractionStrategy
         PDF_PdfMutool = PdfMutoolTextExtractionStrategy
+        PDF_PdfMinerInProcess = PdfMinerInProcessTextExtractionStrategy
         XML_BeautifulSoup = XMLBeautifulsoupTextExtractionStrategy
+        XML_Streaming = XMLStreamingTextExtractionStrategy
         TXT_Copy = TextFileCopyStrategy
 
-        def init(self):
-            return self.value()
+        def init(self, **options):
+            return self.value(**options)
 
-    def __init__(self, strategy: Strategy = Strategy.PDF_PdfMiner):
-        self.strategy = strategy.init()
+    def __init__(self, strategy: Strategy = Strategy.PDF_PdfMiner, runner: SubprocessRunner = None,
+                 fallback: Strategy = None, **options):
+        self.strategy = strategy.init(runner=runner, **options)
+        self.fallback = fallback.init(runner=runner) if fallback and fallback != strategy else None
+        # the strategy that produced the last text, which is the fallback
+        # if the strategy's external tool failed
+        self.used_strategy = None
 
     def extract(self, input_path: str, output_path: str):
         self.__prepare_output_folder_for(output_path)
-        self.strategy.extract(input_path, output_path)
+        try:
+            self.used_strategy = self.strategy
+            self.strategy.extract(input_path, output_path)
+        except ExternalToolError as e:
+            if not self.fallback:
+                raise
+            print("WARN:", f"{e}, falling back to {type(self.fallback).__name__}")
+            if os.path.isfile(output_path):
+                os.remove(output_path)
+            self.used_strategy = self.fallback
+            self.fallback.extract(input_path, output_path)
 
     @staticmethod
     def __prepare_output_folder_for(path: str):
@@ -88,13 +284,91 @@ class TextExtractor:
         os.makedirs(dir_name, 0o777, True)
 
     @classmethod
-    def create_by_file_ext(cls, path: str):
+    def create_by_file_ext(cls, path: str, pdf_strategy: Strategy = Strategy.PDF_PdfMutool,
+                           pdf_fallback: Strategy = None, runner: SubprocessRunner = None,
+                           xml_skip_elements: [str] = (), **pdf_options):
         _, ext = os.path.splitext(path)
         if ext in [".pdf", ".PDF"]:
-            return cls(cls.Strategy.PDF_PdfMutool)
+            return cls(pdf_strategy, runner, pdf_fallback, **pdf_options)
         elif ext in [".xml", ".XML", ".html", ".HTML", ".htm", ".HTM"]:
-            return cls(cls.Strategy.XML_BeautifulSoup)
+            return cls(cls.Strategy.XML_Streaming, runner, skip_elements=xml_skip_elements)
         elif ext in [".txt", ".TXT"]:
-            return cls(cls.Strategy.TXT_Copy)
+            return cls(cls.Strategy.TXT_Copy, runner)
         else:
             raise ValueError(f"Text extraction not defined for extension: '{ext}'")
+
+
+if __name__ == "__main__":
+
+    # the entry point for the page range workers of the in-process strategy
+    parser = argparse.ArgumentParser(description="Extract a range of pages from a pdf as a json list of texts.")
+    parser.add_argument("command", type=str, choices=["pdf_pages"])
+    parser.add_argument("input_path", type=str)
+    parser.add_argument("first_page", type=int, help="The first page to extract, counting from zero.")
+    parser.add_argument("end_page", type=int, help="The page after the last one to extract.")
+    args = parser.parse_args()
+
+    json.dump(_extract_pdf_pages(args.input_path, range(args.first_page, args.end_page)), sys.stdout)
+
+
+# TESTS
+
+def _extracted_texts(content: str, encoding: str = "utf-8", chunk_size: int = 7) -> (str, str):
+    # the texts of the BeautifulSoup and the streaming strategy, the latter
+    # fed in tiny chunks to split every construct somewhere
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_path = os.path.join(tmp_dir, "in.xml")
+        with open(input_path, "w", encoding=encoding) as file:
+            file.write(content)
+        results = []
+        streaming = XMLStreamingTextExtractionStrategy()
+        streaming.CHUNK_SIZE = chunk_size
+        for idx, strategy in enumerate([XMLBeautifulsoupTextExtractionStrategy(), streaming]):
+            output_path = os.path.join(tmp_dir, f"{idx}.txt")
+            try:
+                strategy.extract(input_path, output_path)
+            except ValueError as e:
+                # e.g. a file in another encoding than the locale's
+                results.append(type(e).__name__)
+                continue
+            with open(output_path, "r") as file:
+                results.append(file.read())
+        return tuple(results)
+
+
+def test_xml_streaming_same_as_beautifulsoup():
+    documents = [
+        '<?xml version="1.0"?>\n<!DOCTYPE TEI SYSTEM "tei.dtd">\n<TEI>\n  <text>Ein  Text\n</text>\n</TEI>\n',
+        "<doc><!-- a comment --><p>before<!-- inside -->after</p>\n\n<p> </p><p>\t</p></doc>",
+        '<doc><?pi some data?><p>text<?other?> more</p></doc><?after the root?>',
+        "<doc><p><![CDATA[x < y & <b>not a tag</b>]]></p>\n</doc>",
+        '<TEI xmlns="http://www.tei-c.org/ns/1.0" xmlns:x="urn:x"><x:p>name&#160;space</x:p> <p>&amp; &lt;</p></TEI>',
+        "﻿<doc><p>with a byte order mark</p></doc>",
+        "<doc><p>unclosed <b>tags<p>and & stray</x> markup</doc",
+        "<html><body><p>Some <i>html</i><br>as xml</p>\r\n<p>été – \U0001F600</p></body></html>",
+        "",
+        "no markup at all",
+    ]
+    for document in documents:
+        for chunk_size in [1, 7, 1 << 16]:
+            expected, streamed = _extracted_texts(document, chunk_size=chunk_size)
+            assert streamed == expected, (document, chunk_size)
+
+    # both read the file in the locale's encoding, whatever the declaration
+    latin1 = '<?xml version="1.0" encoding="ISO-8859-1"?>\n<doc><p>%s</p></doc>\n'
+    for text in ["ascii only", "äöü ß"]:
+        expected, streamed = _extracted_texts(latin1 % text, encoding="latin-1")
+        assert streamed == expected, text
+
+
+def test_xml_streaming_skip_elements():
+    document = '<TEI xmlns="http://www.tei-c.org/ns/1.0"><teiHeader><title>Header</title></teiHeader>' \
+               '<text><p>Text<note>a <b>note</b></note> goes on</p></text></TEI>'
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_path = os.path.join(tmp_dir, "in.xml")
+        with open(input_path, "w") as file:
+            file.write(document)
+        XMLStreamingTextExtractionStrategy(skip_elements=["teiHeader", "note"]).extract(
+            input_path, os.path.join(tmp_dir, "out.txt"))
+        with open(os.path.join(tmp_dir, "out.txt"), "r") as file:
+            assert file.read() == "Text goes on"
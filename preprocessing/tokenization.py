@@ -1,6 +1,17 @@
 
 from nltk.data import load
-import string
+import argparse
+import concurrent.futures
+import hashlib
+import json
+import nltk
+import os
+import pickle
+import re
+import sys
+import tempfile
+
+from preprocessing.subprocess_runner import ExternalToolError, SubprocessRunner
 
 # We use one set of abbreviations for multiple languages as they share some of them
 # and a falsely concatenated sentence is not too bad for us.
@@ -48,35 +59,372 @@ abbreviations = [
 # https://www.uni-trier.de/fileadmin/fb3/prof/GES/AG1/Abk%C3%BCrzungen_Zeitschriften.pdf
 # https://guides.lib.berkeley.edu/c.php?g=381579&p=2585381
 
-# single letters are often used to abbreviate first names
-abc = string.ascii_lowercase
+# Besides the words above, some classes of tokens are abbreviations, that are
+# recognized by pattern, as punkt would otherwise need all of them in a set:
+#  - single letters, that are often used to abbreviate first names
+#  - two letters, e.g. the "E.F." in "E.F. Wallace"
+#  - numbers from 1 to 998, to not split sentences on "19. Jahrhundert" etc.
+#  - page numbers from 1 to 9998 followed by "f" or "ff", to not split
+#    sentences on "see p. 19f. or p. 20ff."
+# Punkt looks up the types in lower case, so roman numerals are only known as
+# far as they are single letters.
+_abbreviation_pattern = re.compile(r"[a-z]|[a-z]\.[a-z]|[1-9][0-9]{0,2}|[1-9][0-9]{0,3}ff?")
+
+
+def is_pattern_abbreviation(typ: str) -> bool:
+    if not _abbreviation_pattern.fullmatch(typ):
+        return False
+    number = typ.rstrip("f")
+    if not number.isdigit():
+        return True
+    return int(number) < (999 if number == typ else 9999)
+
+
+class AbbreviationTypes(set):
+    """
+    The abbreviation types of a punkt model, that also contain all types
+    matching our patterns.
+    """
+
+    def __contains__(self, typ) -> bool:
+        return set.__contains__(self, typ) or (isinstance(typ, str) and is_pattern_abbreviation(typ))
+
 
-# two-letter abbreviations of firstnames are also excepted, e.g. the "E.F." in E.F. Wallace"
-abc_product = [(a,b) for a in abc for b in abc]
-abc_dot_abc = [f"{a}.{b}" for (a,b) in abc_product]
+# the ready to use tokenizers of this process by language
+_tokenizer_cache = {}
 
-# to not split sentences on "19. Jahrhundert" etc.
-number_strings = list(map(str, range(1, 999)))
+# a directory to keep the ready to use tokenizers in for other processes and runs
+_tokenizer_cache_dir = ""
 
-# to not split sentences on "see p. 19f. or p. 20ff."
-page_number_f_strings = list(map(lambda i: str(i) + "f", range(1, 9999)))
-page_number_ff_strings = list(map(lambda i: str(i) + "ff", range(1, 9999)))
 
-# roman numerals up to 2000
-roman_numerals_strings = ["I", "II", "III", "IV", "V", "VI", "VII", "VIII", "IX", "X", "XI", "XII", "XIII", "XIV", "XV", "XVI", "XVII", "XVIII", "XIX", "XX", "XXI", "XXII", "XXIII", "XXIV", "XXV", "XXVI", "XXVII", "XXVIII", "XXIX", "XXX", "XXXI", "XXXII", "XXXIII", "XXXIV", "XXXV", "XXXVI", "XXXVII", "XXXVIII", "XXXIX", "XL", "XLI", "XLII", "XLIII", "XLIV", "XLV", "XLVI", "XLVII", "XLVIII", "XLIX", "L", "LI", "LII", "LIII", "LIV", "LV", "LVI", "LVII", "LVIII", "LIX", "LX", "LXI", "LXII", "LXIII", "LXIV", "LXV", "LXVI", "LXVII", "LXVIII", "LXIX", "LXX", "LXXI", "LXXII", "LXXIII", "LXXIV", "LXXV", "LXXVI", "LXXVII", "LXXVIII", "LXXIX", "LXXX", "LXXXI", "LXXXII", "LXXXIII", "LXXXIV", "LXXXV", "LXXXVI", "LXXXVII", "LXXXVIII", "LXXXIX", "XC", "XCI", "XCII", "XCIII", "XCIV", "XCV", "XCVI", "XCVII", "XCVIII", "XCIX", "C", "CI", "CII", "CIII", "CIV", "CV", "CVI", "CVII", "CVIII", "CIX", "CX", "CXI", "CXII", "CXIII", "CXIV", "CXV", "CXVI", "CXVII", "CXVIII", "CXIX", "CXX", "CXXI", "CXXII", "CXXIII", "CXXIV", "CXXV", "CXXVI", "CXXVII", "CXXVIII", "CXXIX", "CXXX", "CXXXI", "CXXXII", "CXXXIII", "CXXXIV", "CXXXV", "CXXXVI", "CXXXVII", "CXXXVIII", "CXXXIX", "CXL", "CXLI", "CXLII", "CXLIII", "CXLIV", "CXLV", "CXLVI", "CXLVII", "CXLVIII", "CXLIX", "CL", "CLI", "CLII", "CLIII", "CLIV", "CLV", "CLVI", "CLVII", "CLVIII", "CLIX", "CLX", "CLXI", "CLXII", "CLXIII", "CLXIV", "CLXV", "CLXVI", "CLXVII", "CLXVIII", "CLXIX", "CLXX", "CLXXI", "CLXXII", "CLXXIII", "CLXXIV", "CLXXV", "CLXXVI", "CLXXVII", "CLXXVIII", "CLXXIX", "CLXXX", "CLXXXI", "CLXXXII", "CLXXXIII", "CLXXXIV", "CLXXXV", "CLXXXVI", "CLXXXVII", "CLXXXVIII", "CLXXXIX", "CXC", "CXCI", "CXCII", "CXCIII", "CXCIV", "CXCV", "CXCVI", "CXCVII", "CXCVIII", "CXCIX", "CC", "CCI", "CCII", "CCIII", "CCIV", "CCV", "CCVI", "CCVII", "CCVIII", "CCIX", "CCX", "CCXI", "CCXII", "CCXIII", "CCXIV", "CCXV", "CCXVI", "CCXVII", "CCXVIII", "CCXIX", "CCXX", "CCXXI", "CCXXII", "CCXXIII", "CCXXIV", "CCXXV", "CCXXVI", "CCXXVII", "CCXXVIII", "CCXXIX", "CCXXX", "CCXXXI", "CCXXXII", "CCXXXIII", "CCXXXIV", "CCXXXV", "CCXXXVI", "CCXXXVII", "CCXXXVIII", "CCXXXIX", "CCXL", "CCXLI", "CCXLII", "CCXLIII", "CCXLIV", "CCXLV", "CCXLVI", "CCXLVII", "CCXLVIII", "CCXLIX", "CCL", "CCLI", "CCLII", "CCLIII", "CCLIV", "CCLV", "CCLVI", "CCLVII", "CCLVIII", "CCLIX", "CCLX", "CCLXI", "CCLXII", "CCLXIII", "CCLXIV", "CCLXV", "CCLXVI", "CCLXVII", "CCLXVIII", "CCLXIX", "CCLXX", "CCLXXI", "CCLXXII", "CCLXXIII", "CCLXXIV", "CCLXXV", "CCLXXVI", "CCLXXVII", "CCLXXVIII", "CCLXXIX", "CCLXXX", "CCLXXXI", "CCLXXXII", "CCLXXXIII", "CCLXXXIV", "CCLXXXV", "CCLXXXVI", "CCLXXXVII", "CCLXXXVIII", "CCLXXXIX", "CCXC", "CCXCI", "CCXCII", "CCXCIII", "CCXCIV", "CCXCV", "CCXCVI", "CCXCVII", "CCXCVIII", "CCXCIX", "CCC", "CCCI", "CCCII", "CCCIII", "CCCIV", "CCCV", "CCCVI", "CCCVII", "CCCVIII", "CCCIX", "CCCX", "CCCXI", "CCCXII", "CCCXIII", "CCCXIV", "CCCXV", "CCCXVI", "CCCXVII", "CCCXVIII", "CCCXIX", "CCCXX", "CCCXXI", "CCCXXII", "CCCXXIII", "CCCXXIV", "CCCXXV", "CCCXXVI", "CCCXXVII", "CCCXXVIII", "CCCXXIX", "CCCXXX", "CCCXXXI", "CCCXXXII", "CCCXXXIII", "CCCXXXIV", "CCCXXXV", "CCCXXXVI", "CCCXXXVII", "CCCXXXVIII", "CCCXXXIX", "CCCXL", "CCCXLI", "CCCXLII", "CCCXLIII", "CCCXLIV", "CCCXLV", "CCCXLVI", "CCCXLVII", "CCCXLVIII", "CCCXLIX", "CCCL", "CCCLI", "CCCLII", "CCCLIII", "CCCLIV", "CCCLV", "CCCLVI", "CCCLVII", "CCCLVIII", "CCCLIX", "CCCLX", "CCCLXI", "CCCLXII", "CCCLXIII", "CCCLXIV", "CCCLXV", "CCCLXVI", "CCCLXVII", "CCCLXVIII", "CCCLXIX", "CCCLXX", "CCCLXXI", "CCCLXXII", "CCCLXXIII", "CCCLXXIV", "CCCLXXV", "CCCLXXVI", "CCCLXXVII", "CCCLXXVIII", "CCCLXXIX", "CCCLXXX", "CCCLXXXI", "CCCLXXXII", "CCCLXXXIII", "CCCLXXXIV", "CCCLXXXV", "CCCLXXXVI", "CCCLXXXVII", "CCCLXXXVIII", "CCCLXXXIX", "CCCXC", "CCCXCI", "CCCXCII", "CCCXCIII", "CCCXCIV", "CCCXCV", "CCCXCVI", "CCCXCVII", "CCCXCVIII", "CCCXCIX", "CD", "CDI", "CDII", "CDIII", "CDIV", "CDV", "CDVI", "CDVII", "CDVIII", "CDIX", "CDX", "CDXI", "CDXII", "CDXIII", "CDXIV", "CDXV", "CDXVI", "CDXVII", "CDXVIII", "CDXIX", "CDXX", "CDXXI", "CDXXII", "CDXXIII", "CDXXIV", "CDXXV", "CDXXVI", "CDXXVII", "CDXXVIII", "CDXXIX", "CDXXX", "CDXXXI", "CDXXXII", "CDXXXIII", "CDXXXIV", "CDXXXV", "CDXXXVI", "CDXXXVII", "CDXXXVIII", "CDXXXIX", "CDXL", "CDXLI", "CDXLII", "CDXLIII", "CDXLIV", "CDXLV", "CDXLVI", "CDXLVII", "CDXLVIII", "CDXLIX", "CDL", "CDLI", "CDLII", "CDLIII", "CDLIV", "CDLV", "CDLVI", "CDLVII", "CDLVIII", "CDLIX", "CDLX", "CDLXI", "CDLXII", "CDLXIII", "CDLXIV", "CDLXV", "CDLXVI", "CDLXVII", "CDLXVIII", "CDLXIX", "CDLXX", "CDLXXI", "CDLXXII", "CDLXXIII", "CDLXXIV", "CDLXXV", "CDLXXVI", "CDLXXVII", "CDLXXVIII", "CDLXXIX", "CDLXXX", "CDLXXXI", "CDLXXXII", "CDLXXXIII", "CDLXXXIV", "CDLXXXV", "CDLXXXVI", "CDLXXXVII", "CDLXXXVIII", "CDLXXXIX", "CDXC", "CDXCI", "CDXCII", "CDXCIII", "CDXCIV", "CDXCV", "CDXCVI", "CDXCVII", "CDXCVIII", "CDXCIX", "D", "DI", "DII", "DIII", "DIV", "DV", "DVI", "DVII", "DVIII", "DIX", "DX", "DXI", "DXII", "DXIII", "DXIV", "DXV", "DXVI", "DXVII", "DXVIII", "DXIX", "DXX", "DXXI", "DXXII", "DXXIII", "DXXIV", "DXXV", "DXXVI", "DXXVII", "DXXVIII", "DXXIX", "DXXX", "DXXXI", "DXXXII", "DXXXIII", "DXXXIV", "DXXXV", "DXXXVI", "DXXXVII", "DXXXVIII", "DXXXIX", "DXL", "DXLI", "DXLII", "DXLIII", "DXLIV", "DXLV", "DXLVI", "DXLVII", "DXLVIII", "DXLIX", "DL", "DLI", "DLII", "DLIII", "DLIV", "DLV", "DLVI", "DLVII", "DLVIII", "DLIX", "DLX", "DLXI", "DLXII", "DLXIII", "DLXIV", "DLXV", "DLXVI", "DLXVII", "DLXVIII", "DLXIX", "DLXX", "DLXXI", "DLXXII", "DLXXIII", "DLXXIV", "DLXXV", "DLXXVI", "DLXXVII", "DLXXVIII", "DLXXIX", "DLXXX", "DLXXXI", "DLXXXII", "DLXXXIII", "DLXXXIV", "DLXXXV", "DLXXXVI", "DLXXXVII", "DLXXXVIII", "DLXXXIX", "DXC", "DXCI", "DXCII", "DXCIII", "DXCIV", "DXCV", "DXCVI", "DXCVII", "DXCVIII", "DXCIX", "DC", "DCI", "DCII", "DCIII", "DCIV", "DCV", "DCVI", "DCVII", "DCVIII", "DCIX", "DCX", "DCXI", "DCXII", "DCXIII", "DCXIV", "DCXV", "DCXVI", "DCXVII", "DCXVIII", "DCXIX", "DCXX", "DCXXI", "DCXXII", "DCXXIII", "DCXXIV", "DCXXV", "DCXXVI", "DCXXVII", "DCXXVIII", "DCXXIX", "DCXXX", "DCXXXI", "DCXXXII", "DCXXXIII", "DCXXXIV", "DCXXXV", "DCXXXVI", "DCXXXVII", "DCXXXVIII", "DCXXXIX", "DCXL", "DCXLI", "DCXLII", "DCXLIII", "DCXLIV", "DCXLV", "DCXLVI", "DCXLVII", "DCXLVIII", "DCXLIX", "DCL", "DCLI", "DCLII", "DCLIII", "DCLIV", "DCLV", "DCLVI", "DCLVII", "DCLVIII", "DCLIX", "DCLX", "DCLXI", "DCLXII", "DCLXIII", "DCLXIV", "DCLXV", "DCLXVI", "DCLXVII", "DCLXVIII", "DCLXIX", "DCLXX", "DCLXXI", "DCLXXII", "DCLXXIII", "DCLXXIV", "DCLXXV", "DCLXXVI", "DCLXXVII", "DCLXXVIII", "DCLXXIX", "DCLXXX", "DCLXXXI", "DCLXXXII", "DCLXXXIII", "DCLXXXIV", "DCLXXXV", "DCLXXXVI", "DCLXXXVII", "DCLXXXVIII", "DCLXXXIX", "DCXC", "DCXCI", "DCXCII", "DCXCIII", "DCXCIV", "DCXCV", "DCXCVI", "DCXCVII", "DCXCVIII", "DCXCIX", "DCC", "DCCI", "DCCII", "DCCIII", "DCCIV", "DCCV", "DCCVI", "DCCVII", "DCCVIII", "DCCIX", "DCCX", "DCCXI", "DCCXII", "DCCXIII", "DCCXIV", "DCCXV", "DCCXVI", "DCCXVII", "DCCXVIII", "DCCXIX", "DCCXX", "DCCXXI", "DCCXXII", "DCCXXIII", "DCCXXIV", "DCCXXV", "DCCXXVI", "DCCXXVII", "DCCXXVIII", "DCCXXIX", "DCCXXX", "DCCXXXI", "DCCXXXII", "DCCXXXIII", "DCCXXXIV", "DCCXXXV", "DCCXXXVI", "DCCXXXVII", "DCCXXXVIII", "DCCXXXIX", "DCCXL", "DCCXLI", "DCCXLII", "DCCXLIII", "DCCXLIV", "DCCXLV", "DCCXLVI", "DCCXLVII", "DCCXLVIII", "DCCXLIX", "DCCL", "DCCLI", "DCCLII", "DCCLIII", "DCCLIV", "DCCLV", "DCCLVI", "DCCLVII", "DCCLVIII", "DCCLIX", "DCCLX", "DCCLXI", "DCCLXII", "DCCLXIII", "DCCLXIV", "DCCLXV", "DCCLXVI", "DCCLXVII", "DCCLXVIII", "DCCLXIX", "DCCLXX", "DCCLXXI", "DCCLXXII", "DCCLXXIII", "DCCLXXIV", "DCCLXXV", "DCCLXXVI", "DCCLXXVII", "DCCLXXVIII", "DCCLXXIX", "DCCLXXX", "DCCLXXXI", "DCCLXXXII", "DCCLXXXIII", "DCCLXXXIV", "DCCLXXXV", "DCCLXXXVI", "DCCLXXXVII", "DCCLXXXVIII", "DCCLXXXIX", "DCCXC", "DCCXCI", "DCCXCII", "DCCXCIII", "DCCXCIV", "DCCXCV", "DCCXCVI", "DCCXCVII", "DCCXCVIII", "DCCXCIX", "DCCC", "DCCCI", "DCCCII", "DCCCIII", "DCCCIV", "DCCCV", "DCCCVI", "DCCCVII", "DCCCVIII", "DCCCIX", "DCCCX", "DCCCXI", "DCCCXII", "DCCCXIII", "DCCCXIV", "DCCCXV", "DCCCXVI", "DCCCXVII", "DCCCXVIII", "DCCCXIX", "DCCCXX", "DCCCXXI", "DCCCXXII", "DCCCXXIII", "DCCCXXIV", "DCCCXXV", "DCCCXXVI", "DCCCXXVII", "DCCCXXVIII", "DCCCXXIX", "DCCCXXX", "DCCCXXXI", "DCCCXXXII", "DCCCXXXIII", "DCCCXXXIV", "DCCCXXXV", "DCCCXXXVI", "DCCCXXXVII", "DCCCXXXVIII", "DCCCXXXIX", "DCCCXL", "DCCCXLI", "DCCCXLII", "DCCCXLIII", "DCCCXLIV", "DCCCXLV", "DCCCXLVI", "DCCCXLVII", "DCCCXLVIII", "DCCCXLIX", "DCCCL", "DCCCLI", "DCCCLII", "DCCCLIII", "DCCCLIV", "DCCCLV", "DCCCLVI", "DCCCLVII", "DCCCLVIII", "DCCCLIX", "DCCCLX", "DCCCLXI", "DCCCLXII", "DCCCLXIII", "DCCCLXIV", "DCCCLXV", "DCCCLXVI", "DCCCLXVII", "DCCCLXVIII", "DCCCLXIX", "DCCCLXX", "DCCCLXXI", "DCCCLXXII", "DCCCLXXIII", "DCCCLXXIV", "DCCCLXXV", "DCCCLXXVI", "DCCCLXXVII", "DCCCLXXVIII", "DCCCLXXIX", "DCCCLXXX", "DCCCLXXXI", "DCCCLXXXII", "DCCCLXXXIII", "DCCCLXXXIV", "DCCCLXXXV", "DCCCLXXXVI", "DCCCLXXXVII", "DCCCLXXXVIII", "DCCCLXXXIX", "DCCCXC", "DCCCXCI", "DCCCXCII", "DCCCXCIII", "DCCCXCIV", "DCCCXCV", "DCCCXCVI", "DCCCXCVII", "DCCCXCVIII", "DCCCXCIX", "CM", "CMI", "CMII", "CMIII", "CMIV", "CMV", "CMVI", "CMVII", "CMVIII", "CMIX", "CMX", "CMXI", "CMXII", "CMXIII", "CMXIV", "CMXV", "CMXVI", "CMXVII", "CMXVIII", "CMXIX", "CMXX", "CMXXI", "CMXXII", "CMXXIII", "CMXXIV", "CMXXV", "CMXXVI", "CMXXVII", "CMXXVIII", "CMXXIX", "CMXXX", "CMXXXI", "CMXXXII", "CMXXXIII", "CMXXXIV", "CMXXXV", "CMXXXVI", "CMXXXVII", "CMXXXVIII", "CMXXXIX", "CMXL", "CMXLI", "CMXLII", "CMXLIII", "CMXLIV", "CMXLV", "CMXLVI", "CMXLVII", "CMXLVIII", "CMXLIX", "CML", "CMLI", "CMLII", "CMLIII", "CMLIV", "CMLV", "CMLVI", "CMLVII", "CMLVIII", "CMLIX", "CMLX", "CMLXI", "CMLXII", "CMLXIII", "CMLXIV", "CMLXV", "CMLXVI", "CMLXVII", "CMLXVIII", "CMLXIX", "CMLXX", "CMLXXI", "CMLXXII", "CMLXXIII", "CMLXXIV", "CMLXXV", "CMLXXVI", "CMLXXVII", "CMLXXVIII", "CMLXXIX", "CMLXXX", "CMLXXXI", "CMLXXXII", "CMLXXXIII", "CMLXXXIV", "CMLXXXV", "CMLXXXVI", "CMLXXXVII", "CMLXXXVIII", "CMLXXXIX", "CMXC", "CMXCI", "CMXCII", "CMXCIII", "CMXCIV", "CMXCV", "CMXCVI", "CMXCVII", "CMXCVIII", "CMXCIX", "M", "MI", "MII", "MIII", "MIV", "MV", "MVI", "MVII", "MVIII", "MIX", "MX", "MXI", "MXII", "MXIII", "MXIV", "MXV", "MXVI", "MXVII", "MXVIII", "MXIX", "MXX", "MXXI", "MXXII", "MXXIII", "MXXIV", "MXXV", "MXXVI", "MXXVII", "MXXVIII", "MXXIX", "MXXX", "MXXXI", "MXXXII", "MXXXIII", "MXXXIV", "MXXXV", "MXXXVI", "MXXXVII", "MXXXVIII", "MXXXIX", "MXL", "MXLI", "MXLII", "MXLIII", "MXLIV", "MXLV", "MXLVI", "MXLVII", "MXLVIII", "MXLIX", "ML", "MLI", "MLII", "MLIII", "MLIV", "MLV", "MLVI", "MLVII", "MLVIII", "MLIX", "MLX", "MLXI", "MLXII", "MLXIII", "MLXIV", "MLXV", "MLXVI", "MLXVII", "MLXVIII", "MLXIX", "MLXX", "MLXXI", "MLXXII", "MLXXIII", "MLXXIV", "MLXXV", "MLXXVI", "MLXXVII", "MLXXVIII", "MLXXIX", "MLXXX", "MLXXXI", "MLXXXII", "MLXXXIII", "MLXXXIV", "MLXXXV", "MLXXXVI", "MLXXXVII", "MLXXXVIII", "MLXXXIX", "MXC", "MXCI", "MXCII", "MXCIII", "MXCIV", "MXCV", "MXCVI", "MXCVII", "MXCVIII", "MXCIX", "MC", "MCI", "MCII", "MCIII", "MCIV", "MCV", "MCVI", "MCVII", "MCVIII", "MCIX", "MCX", "MCXI", "MCXII", "MCXIII", "MCXIV", "MCXV", "MCXVI", "MCXVII", "MCXVIII", "MCXIX", "MCXX", "MCXXI", "MCXXII", "MCXXIII", "MCXXIV", "MCXXV", "MCXXVI", "MCXXVII", "MCXXVIII", "MCXXIX", "MCXXX", "MCXXXI", "MCXXXII", "MCXXXIII", "MCXXXIV", "MCXXXV", "MCXXXVI", "MCXXXVII", "MCXXXVIII", "MCXXXIX", "MCXL", "MCXLI", "MCXLII", "MCXLIII", "MCXLIV", "MCXLV", "MCXLVI", "MCXLVII", "MCXLVIII", "MCXLIX", "MCL", "MCLI", "MCLII", "MCLIII", "MCLIV", "MCLV", "MCLVI", "MCLVII", "MCLVIII", "MCLIX", "MCLX", "MCLXI", "MCLXII", "MCLXIII", "MCLXIV", "MCLXV", "MCLXVI", "MCLXVII", "MCLXVIII", "MCLXIX", "MCLXX", "MCLXXI", "MCLXXII", "MCLXXIII", "MCLXXIV", "MCLXXV", "MCLXXVI", "MCLXXVII", "MCLXXVIII", "MCLXXIX", "MCLXXX", "MCLXXXI", "MCLXXXII", "MCLXXXIII", "MCLXXXIV", "MCLXXXV", "MCLXXXVI", "MCLXXXVII", "MCLXXXVIII", "MCLXXXIX", "MCXC", "MCXCI", "MCXCII", "MCXCIII", "MCXCIV", "MCXCV", "MCXCVI", "MCXCVII", "MCXCVIII", "MCXCIX", "MCC", "MCCI", "MCCII", "MCCIII", "MCCIV", "MCCV", "MCCVI", "MCCVII", "MCCVIII", "MCCIX", "MCCX", "MCCXI", "MCCXII", "MCCXIII", "MCCXIV", "MCCXV", "MCCXVI", "MCCXVII", "MCCXVIII", "MCCXIX", "MCCXX", "MCCXXI", "MCCXXII", "MCCXXIII", "MCCXXIV", "MCCXXV", "MCCXXVI", "MCCXXVII", "MCCXXVIII", "MCCXXIX", "MCCXXX", "MCCXXXI", "MCCXXXII", "MCCXXXIII", "MCCXXXIV", "MCCXXXV", "MCCXXXVI", "MCCXXXVII", "MCCXXXVIII", "MCCXXXIX", "MCCXL", "MCCXLI", "MCCXLII", "MCCXLIII", "MCCXLIV", "MCCXLV", "MCCXLVI", "MCCXLVII", "MCCXLVIII", "MCCXLIX", "MCCL", "MCCLI", "MCCLII", "MCCLIII", "MCCLIV", "MCCLV", "MCCLVI", "MCCLVII", "MCCLVIII", "MCCLIX", "MCCLX", "MCCLXI", "MCCLXII", "MCCLXIII", "MCCLXIV", "MCCLXV", "MCCLXVI", "MCCLXVII", "MCCLXVIII", "MCCLXIX", "MCCLXX", "MCCLXXI", "MCCLXXII", "MCCLXXIII", "MCCLXXIV", "MCCLXXV", "MCCLXXVI", "MCCLXXVII", "MCCLXXVIII", "MCCLXXIX", "MCCLXXX", "MCCLXXXI", "MCCLXXXII", "MCCLXXXIII", "MCCLXXXIV", "MCCLXXXV", "MCCLXXXVI", "MCCLXXXVII", "MCCLXXXVIII", "MCCLXXXIX", "MCCXC", "MCCXCI", "MCCXCII", "MCCXCIII", "MCCXCIV", "MCCXCV", "MCCXCVI", "MCCXCVII", "MCCXCVIII", "MCCXCIX", "MCCC", "MCCCI", "MCCCII", "MCCCIII", "MCCCIV", "MCCCV", "MCCCVI", "MCCCVII", "MCCCVIII", "MCCCIX", "MCCCX", "MCCCXI", "MCCCXII", "MCCCXIII", "MCCCXIV", "MCCCXV", "MCCCXVI", "MCCCXVII", "MCCCXVIII", "MCCCXIX", "MCCCXX", "MCCCXXI", "MCCCXXII", "MCCCXXIII", "MCCCXXIV", "MCCCXXV", "MCCCXXVI", "MCCCXXVII", "MCCCXXVIII", "MCCCXXIX", "MCCCXXX", "MCCCXXXI", "MCCCXXXII", "MCCCXXXIII", "MCCCXXXIV", "MCCCXXXV", "MCCCXXXVI", "MCCCXXXVII", "MCCCXXXVIII", "MCCCXXXIX", "MCCCXL", "MCCCXLI", "MCCCXLII", "MCCCXLIII", "MCCCXLIV", "MCCCXLV", "MCCCXLVI", "MCCCXLVII", "MCCCXLVIII", "MCCCXLIX", "MCCCL", "MCCCLI", "MCCCLII", "MCCCLIII", "MCCCLIV", "MCCCLV", "MCCCLVI", "MCCCLVII", "MCCCLVIII", "MCCCLIX", "MCCCLX", "MCCCLXI", "MCCCLXII", "MCCCLXIII", "MCCCLXIV", "MCCCLXV", "MCCCLXVI", "MCCCLXVII", "MCCCLXVIII", "MCCCLXIX", "MCCCLXX", "MCCCLXXI", "MCCCLXXII", "MCCCLXXIII", "MCCCLXXIV", "MCCCLXXV", "MCCCLXXVI", "MCCCLXXVII", "MCCCLXXVIII", "MCCCLXXIX", "MCCCLXXX", "MCCCLXXXI", "MCCCLXXXII", "MCCCLXXXIII", "MCCCLXXXIV", "MCCCLXXXV", "MCCCLXXXVI", "MCCCLXXXVII", "MCCCLXXXVIII", "MCCCLXXXIX", "MCCCXC", "MCCCXCI", "MCCCXCII", "MCCCXCIII", "MCCCXCIV", "MCCCXCV", "MCCCXCVI", "MCCCXCVII", "MCCCXCVIII", "MCCCXCIX", "MCD", "MCDI", "MCDII", "MCDIII", "MCDIV", "MCDV", "MCDVI", "MCDVII", "MCDVIII", "MCDIX", "MCDX", "MCDXI", "MCDXII", "MCDXIII", "MCDXIV", "MCDXV", "MCDXVI", "MCDXVII", "MCDXVIII", "MCDXIX", "MCDXX", "MCDXXI", "MCDXXII", "MCDXXIII", "MCDXXIV", "MCDXXV", "MCDXXVI", "MCDXXVII", "MCDXXVIII", "MCDXXIX", "MCDXXX", "MCDXXXI", "MCDXXXII", "MCDXXXIII", "MCDXXXIV", "MCDXXXV", "MCDXXXVI", "MCDXXXVII", "MCDXXXVIII", "MCDXXXIX", "MCDXL", "MCDXLI", "MCDXLII", "MCDXLIII", "MCDXLIV", "MCDXLV", "MCDXLVI", "MCDXLVII", "MCDXLVIII", "MCDXLIX", "MCDL", "MCDLI", "MCDLII", "MCDLIII", "MCDLIV", "MCDLV", "MCDLVI", "MCDLVII", "MCDLVIII", "MCDLIX", "MCDLX", "MCDLXI", "MCDLXII", "MCDLXIII", "MCDLXIV", "MCDLXV", "MCDLXVI", "MCDLXVII", "MCDLXVIII", "MCDLXIX", "MCDLXX", "MCDLXXI", "MCDLXXII", "MCDLXXIII", "MCDLXXIV", "MCDLXXV", "MCDLXXVI", "MCDLXXVII", "MCDLXXVIII", "MCDLXXIX", "MCDLXXX", "MCDLXXXI", "MCDLXXXII", "MCDLXXXIII", "MCDLXXXIV", "MCDLXXXV", "MCDLXXXVI", "MCDLXXXVII", "MCDLXXXVIII", "MCDLXXXIX", "MCDXC", "MCDXCI", "MCDXCII", "MCDXCIII", "MCDXCIV", "MCDXCV", "MCDXCVI", "MCDXCVII", "MCDXCVIII", "MCDXCIX", "MD", "MDI", "MDII", "MDIII", "MDIV", "MDV", "MDVI", "MDVII", "MDVIII", "MDIX", "MDX", "MDXI", "MDXII", "MDXIII", "MDXIV", "MDXV", "MDXVI", "MDXVII", "MDXVIII", "MDXIX", "MDXX", "MDXXI", "MDXXII", "MDXXIII", "MDXXIV", "MDXXV", "MDXXVI", "MDXXVII", "MDXXVIII", "MDXXIX", "MDXXX", "MDXXXI", "MDXXXII", "MDXXXIII", "MDXXXIV", "MDXXXV", "MDXXXVI", "MDXXXVII", "MDXXXVIII", "MDXXXIX", "MDXL", "MDXLI", "MDXLII", "MDXLIII", "MDXLIV", "MDXLV", "MDXLVI", "MDXLVII", "MDXLVIII", "MDXLIX", "MDL", "MDLI", "MDLII", "MDLIII", "MDLIV", "MDLV", "MDLVI", "MDLVII", "MDLVIII", "MDLIX", "MDLX", "MDLXI", "MDLXII", "MDLXIII", "MDLXIV", "MDLXV", "MDLXVI", "MDLXVII", "MDLXVIII", "MDLXIX", "MDLXX", "MDLXXI", "MDLXXII", "MDLXXIII", "MDLXXIV", "MDLXXV", "MDLXXVI", "MDLXXVII", "MDLXXVIII", "MDLXXIX", "MDLXXX", "MDLXXXI", "MDLXXXII", "MDLXXXIII", "MDLXXXIV", "MDLXXXV", "MDLXXXVI", "MDLXXXVII", "MDLXXXVIII", "MDLXXXIX", "MDXC", "MDXCI", "MDXCII", "MDXCIII", "MDXCIV", "MDXCV", "MDXCVI", "MDXCVII", "MDXCVIII", "MDXCIX", "MDC", "MDCI", "MDCII", "MDCIII", "MDCIV", "MDCV", "MDCVI", "MDCVII", "MDCVIII", "MDCIX", "MDCX", "MDCXI", "MDCXII", "MDCXIII", "MDCXIV", "MDCXV", "MDCXVI", "MDCXVII", "MDCXVIII", "MDCXIX", "MDCXX", "MDCXXI", "MDCXXII", "MDCXXIII", "MDCXXIV", "MDCXXV", "MDCXXVI", "MDCXXVII", "MDCXXVIII", "MDCXXIX", "MDCXXX", "MDCXXXI", "MDCXXXII", "MDCXXXIII", "MDCXXXIV", "MDCXXXV", "MDCXXXVI", "MDCXXXVII", "MDCXXXVIII", "MDCXXXIX", "MDCXL", "MDCXLI", "MDCXLII", "MDCXLIII", "MDCXLIV", "MDCXLV", "MDCXLVI", "MDCXLVII", "MDCXLVIII", "MDCXLIX", "MDCL", "MDCLI", "MDCLII", "MDCLIII", "MDCLIV", "MDCLV", "MDCLVI", "MDCLVII", "MDCLVIII", "MDCLIX", "MDCLX", "MDCLXI", "MDCLXII", "MDCLXIII", "MDCLXIV", "MDCLXV", "MDCLXVI", "MDCLXVII", "MDCLXVIII", "MDCLXIX", "MDCLXX", "MDCLXXI", "MDCLXXII", "MDCLXXIII", "MDCLXXIV", "MDCLXXV", "MDCLXXVI", "MDCLXXVII", "MDCLXXVIII", "MDCLXXIX", "MDCLXXX", "MDCLXXXI", "MDCLXXXII", "MDCLXXXIII", "MDCLXXXIV", "MDCLXXXV", "MDCLXXXVI", "MDCLXXXVII", "MDCLXXXVIII", "MDCLXXXIX", "MDCXC", "MDCXCI", "MDCXCII", "MDCXCIII", "MDCXCIV", "MDCXCV", "MDCXCVI", "MDCXCVII", "MDCXCVIII", "MDCXCIX", "MDCC", "MDCCI", "MDCCII", "MDCCIII", "MDCCIV", "MDCCV", "MDCCVI", "MDCCVII", "MDCCVIII", "MDCCIX", "MDCCX", "MDCCXI", "MDCCXII", "MDCCXIII", "MDCCXIV", "MDCCXV", "MDCCXVI", "MDCCXVII", "MDCCXVIII", "MDCCXIX", "MDCCXX", "MDCCXXI", "MDCCXXII", "MDCCXXIII", "MDCCXXIV", "MDCCXXV", "MDCCXXVI", "MDCCXXVII", "MDCCXXVIII", "MDCCXXIX", "MDCCXXX", "MDCCXXXI", "MDCCXXXII", "MDCCXXXIII", "MDCCXXXIV", "MDCCXXXV", "MDCCXXXVI", "MDCCXXXVII", "MDCCXXXVIII", "MDCCXXXIX", "MDCCXL", "MDCCXLI", "MDCCXLII", "MDCCXLIII", "MDCCXLIV", "MDCCXLV", "MDCCXLVI", "MDCCXLVII", "MDCCXLVIII", "MDCCXLIX", "MDCCL", "MDCCLI", "MDCCLII", "MDCCLIII", "MDCCLIV", "MDCCLV", "MDCCLVI", "MDCCLVII", "MDCCLVIII", "MDCCLIX", "MDCCLX", "MDCCLXI", "MDCCLXII", "MDCCLXIII", "MDCCLXIV", "MDCCLXV", "MDCCLXVI", "MDCCLXVII", "MDCCLXVIII", "MDCCLXIX", "MDCCLXX", "MDCCLXXI", "MDCCLXXII", "MDCCLXXIII", "MDCCLXXIV", "MDCCLXXV", "MDCCLXXVI", "MDCCLXXVII", "MDCCLXXVIII", "MDCCLXXIX", "MDCCLXXX", "MDCCLXXXI", "MDCCLXXXII", "MDCCLXXXIII", "MDCCLXXXIV", "MDCCLXXXV", "MDCCLXXXVI", "MDCCLXXXVII", "MDCCLXXXVIII", "MDCCLXXXIX", "MDCCXC", "MDCCXCI", "MDCCXCII", "MDCCXCIII", "MDCCXCIV", "MDCCXCV", "MDCCXCVI", "MDCCXCVII", "MDCCXCVIII", "MDCCXCIX", "MDCCC", "MDCCCI", "MDCCCII", "MDCCCIII", "MDCCCIV", "MDCCCV", "MDCCCVI", "MDCCCVII", "MDCCCVIII", "MDCCCIX", "MDCCCX", "MDCCCXI", "MDCCCXII", "MDCCCXIII", "MDCCCXIV", "MDCCCXV", "MDCCCXVI", "MDCCCXVII", "MDCCCXVIII", "MDCCCXIX", "MDCCCXX", "MDCCCXXI", "MDCCCXXII", "MDCCCXXIII", "MDCCCXXIV", "MDCCCXXV", "MDCCCXXVI", "MDCCCXXVII", "MDCCCXXVIII", "MDCCCXXIX", "MDCCCXXX", "MDCCCXXXI", "MDCCCXXXII", "MDCCCXXXIII", "MDCCCXXXIV", "MDCCCXXXV", "MDCCCXXXVI", "MDCCCXXXVII", "MDCCCXXXVIII", "MDCCCXXXIX", "MDCCCXL", "MDCCCXLI", "MDCCCXLII", "MDCCCXLIII", "MDCCCXLIV", "MDCCCXLV", "MDCCCXLVI", "MDCCCXLVII", "MDCCCXLVIII", "MDCCCXLIX", "MDCCCL", "MDCCCLI", "MDCCCLII", "MDCCCLIII", "MDCCCLIV", "MDCCCLV", "MDCCCLVI", "MDCCCLVII", "MDCCCLVIII", "MDCCCLIX", "MDCCCLX", "MDCCCLXI", "MDCCCLXII", "MDCCCLXIII", "MDCCCLXIV", "MDCCCLXV", "MDCCCLXVI", "MDCCCLXVII", "MDCCCLXVIII", "MDCCCLXIX", "MDCCCLXX", "MDCCCLXXI", "MDCCCLXXII", "MDCCCLXXIII", "MDCCCLXXIV", "MDCCCLXXV", "MDCCCLXXVI", "MDCCCLXXVII", "MDCCCLXXVIII", "MDCCCLXXIX", "MDCCCLXXX", "MDCCCLXXXI", "MDCCCLXXXII", "MDCCCLXXXIII", "MDCCCLXXXIV", "MDCCCLXXXV", "MDCCCLXXXVI", "MDCCCLXXXVII", "MDCCCLXXXVIII", "MDCCCLXXXIX", "MDCCCXC", "MDCCCXCI", "MDCCCXCII", "MDCCCXCIII", "MDCCCXCIV", "MDCCCXCV", "MDCCCXCVI", "MDCCCXCVII", "MDCCCXCVIII", "MDCCCXCIX", "MCM", "MCMI", "MCMII", "MCMIII", "MCMIV", "MCMV", "MCMVI", "MCMVII", "MCMVIII", "MCMIX", "MCMX", "MCMXI", "MCMXII", "MCMXIII", "MCMXIV", "MCMXV", "MCMXVI", "MCMXVII", "MCMXVIII", "MCMXIX", "MCMXX", "MCMXXI", "MCMXXII", "MCMXXIII", "MCMXXIV", "MCMXXV", "MCMXXVI", "MCMXXVII", "MCMXXVIII", "MCMXXIX", "MCMXXX", "MCMXXXI", "MCMXXXII", "MCMXXXIII", "MCMXXXIV", "MCMXXXV", "MCMXXXVI", "MCMXXXVII", "MCMXXXVIII", "MCMXXXIX", "MCMXL", "MCMXLI", "MCMXLII", "MCMXLIII", "MCMXLIV", "MCMXLV", "MCMXLVI", "MCMXLVII", "MCMXLVIII", "MCMXLIX", "MCML", "MCMLI", "MCMLII", "MCMLIII", "MCMLIV", "MCMLV", "MCMLVI", "MCMLVII", "MCMLVIII", "MCMLIX", "MCMLX", "MCMLXI", "MCMLXII", "MCMLXIII", "MCMLXIV", "MCMLXV", "MCMLXVI", "MCMLXVII", "MCMLXVIII", "MCMLXIX", "MCMLXX", "MCMLXXI", "MCMLXXII", "MCMLXXIII", "MCMLXXIV", "MCMLXXV", "MCMLXXVI", "MCMLXXVII", "MCMLXXVIII", "MCMLXXIX", "MCMLXXX", "MCMLXXXI", "MCMLXXXII", "MCMLXXXIII", "MCMLXXXIV", "MCMLXXXV", "MCMLXXXVI", "MCMLXXXVII", "MCMLXXXVIII", "MCMLXXXIX", "MCMXC", "MCMXCI", "MCMXCII", "MCMXCIII", "MCMXCIV", "MCMXCV", "MCMXCVI", "MCMXCVII", "MCMXCVIII", "MCMXCIX", "MM"]
+def use_tokenizer_cache(directory: str):
+    global _tokenizer_cache_dir
+    _tokenizer_cache_dir = directory
+
+
+def _tokenizer_key(language: str) -> str:
+    # a new key whenever the abbreviations or the nltk version change
+    sha = hashlib.sha256()
+    for part in [nltk.__version__, language, abbreviations, _abbreviation_pattern.pattern]:
+        sha.update(repr(part).encode("utf-8"))
+    return sha.hexdigest()
+
+
+def _load_cached_tokenizer(language: str):
+    path = os.path.join(_tokenizer_cache_dir, f"punkt-{language}-{_tokenizer_key(language)[:16]}.pickle")
+    try:
+        with open(path, "rb") as file:
+            return pickle.load(file)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        # a missing, truncated or foreign file or one pickled with other
+        # classes than ours is built again
+        pass
+    tokenizer = _augmented_tokenizer(language)
+    os.makedirs(_tokenizer_cache_dir, exist_ok=True)
+    # other processes might write the same file at the same time
+    fd, tmp_path = tempfile.mkstemp(dir=_tokenizer_cache_dir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            pickle.dump(tokenizer, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return tokenizer
+
 
 def sentence_tokenizer(language='english'):
+    """
+    The punkt tokenizer for the language with our abbreviations. It is only
+    built once per process, or once per abbreviation list with a tokenizer
+    cache directory.
+    """
+    tokenizer = _tokenizer_cache.get(language, None)
+    if tokenizer is None:
+        tokenizer = _load_cached_tokenizer(language) if _tokenizer_cache_dir else _augmented_tokenizer(language)
+        _tokenizer_cache[language] = tokenizer
+    return tokenizer
+
+
+def _augmented_tokenizer(language: str):
     # load the punkt tokenizer directly, so that we can add some abbreviations
     # cf. https://github.com/nltk/nltk/blob/develop/nltk/tokenize/__init__.py#L105
     tokenizer = load(f"tokenizers/punkt/{language}.pickle")
 
     # add some abbreviations to those that were learned with the model
+    # and recognize the others by pattern
+    tokenizer._params.abbrev_types = AbbreviationTypes(tokenizer._params.abbrev_types)
     tokenizer._params.abbrev_types.update(abbreviations)
-    tokenizer._params.abbrev_types.update(abc)
-    tokenizer._params.abbrev_types.update(abc_dot_abc)
-    tokenizer._params.abbrev_types.update(number_strings)
-    tokenizer._params.abbrev_types.update(page_number_f_strings)
-    tokenizer._params.abbrev_types.update(page_number_ff_strings)
-    tokenizer._params.abbrev_types.update(roman_numerals_strings)
 
     return tokenizer
+
+
+# a sentence that is carried over into the next chunk is cut off once it is
+# longer than this many chunks, so that a text without sentence ends (e.g. a
+# long table) is not tokenized again and again as it grows
+_max_carry_chunks = 4
+
+
+def iter_span_tokenize(tokenizer, lines, chunk_size: int = 1 << 20):
+    """
+    Yield the sentences that tokenizer.tokenize() would find in the lines
+    joined by newlines, but tokenize about chunk_size characters at a time.
+    The last sentence of a chunk might go on in the next one, so its text
+    is tokenized again together with the next chunk. Only a sentence longer
+    than a few chunks is split differently, it ends at a chunk's end.
+    :return: Tuples of the sentence's start and end in the joined lines and
+             the sentence
+    """
+    chunk = []
+    chunk_length = 0
+    carry = None
+    # the offset of the carried over text in the joined lines
+    offset = 0
+    for line in lines:
+        chunk.append(line)
+        chunk_length += len(line) + 1
+        if chunk_length < chunk_size:
+            continue
+        text = "\n".join(chunk) if carry is None else carry + "\n" + "\n".join(chunk)
+        spans = list(tokenizer.span_tokenize(text))
+        for start, end in spans[:-1]:
+            yield offset + start, offset + end, text[start:end]
+        if spans:
+            carry = text[spans[-1][0]:]
+            offset += spans[-1][0]
+        else:
+            carry = text
+        if len(carry) > _max_carry_chunks * chunk_size:
+            start = len(carry) - len(carry.lstrip())
+            end = len(carry.rstrip())
+            if start < end:
+                yield offset + start, offset + end, carry[start:end]
+            # the next chunk follows the newline after the carried text
+            offset += len(carry) + 1
+            carry = None
+        chunk = []
+        chunk_length = 0
+
+    if chunk:
+        text = "\n".join(chunk) if carry is None else carry + "\n" + "\n".join(chunk)
+    else:
+        text = carry
+    if text is not None:
+        for start, end in tokenizer.span_tokenize(text):
+            yield offset + start, offset + end, text[start:end]
+
+
+def iter_tokenize(tokenizer, lines, chunk_size: int = 1 << 20):
+    """
+    Like iter_span_tokenize(), but only yield the sentences.
+    """
+    for _, _, sentence in iter_span_tokenize(tokenizer, lines, chunk_size):
+        yield sentence
+
+
+class TokenizationError(Exception):
+    """
+    A worker process of the ParallelTokenizer failed. Unlike the
+    ExternalToolError of the text extraction, this does not count as a
+    failed extraction of the document.
+    """
+
+
+# A large text is split into chunks at line starts, that are tokenized in
+# parallel worker processes. The sentences at the start and end of a chunk
+# might go on in the neighbouring chunk, everything in between is decided
+# from the chunk's own tokens like in the whole text. So the text from the
+# last sentence start of a chunk up to the second sentence start of the next
+# chunk is tokenized again to get the sentences around the chunk border.
+# The workers are separate python processes for the same reason as the page
+# workers of the pdf extraction (cf. preprocessing.text_extraction). Starting
+# one takes about as long as tokenizing a few MB (importing nltk is most of
+# it), so there is at most one chunk (and one process) per worker and the
+# workers unpickle the tokenizer built here instead of building their own.
+class ParallelTokenizer:
+
+    def __init__(self, language: str, workers: int = None, chunk_size: int = 1 << 22, runner=None):
+        self.language = language
+        # more workers than cpus only add to the time needed to start them
+        self.workers = min(workers, os.cpu_count()) if workers else os.cpu_count()
+        self.chunk_size = chunk_size
+        self.runner = runner if runner else SubprocessRunner()
+        self.tokenizer = sentence_tokenizer(language)
+
+    def _chunk_starts(self, text: str) -> [int]:
+        chunk_size = max(self.chunk_size, -(-len(text) // self.workers))
+        result = [0]
+        while True:
+            idx = text.find("\n", result[-1] + chunk_size)
+            if idx < 0 or idx + 1 >= len(text):
+                return result
+            result.append(idx + 1)
+
+    def _tokenize_in_worker(self, path: str, offset: int, tokenizer_path: str) -> [(int, int)]:
+        package_parent = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        params = [sys.executable, "-m", "preprocessing.tokenization", "spans", self.language, path,
+                  "--tokenizer_pickle", tokenizer_path]
+        with tempfile.TemporaryFile() as out_file:
+            try:
+                self.runner.run(params, label=f"{self.language}:{offset}", stdout=out_file, cwd=package_parent)
+            except ExternalToolError as e:
+                raise TokenizationError(str(e)) from e
+            out_file.seek(0)
+            return [(offset + start, offset + end) for start, end in json.loads(out_file.read().decode("utf-8"))]
+
+    def _chunk_spans(self, text: str, starts: [int]) -> [[(int, int)]]:
+        ends = starts[1:] + [len(text)]
+        with tempfile.TemporaryDirectory(prefix="chronoi-tokenize-") as tmp_dir:
+            tokenizer_path = os.path.join(tmp_dir, "tokenizer.pickle")
+            with open(tokenizer_path, "wb") as file:
+                pickle.dump(self.tokenizer, file, protocol=pickle.HIGHEST_PROTOCOL)
+            paths = []
+            for idx, (start, end) in enumerate(zip(starts, ends)):
+                paths.append(os.path.join(tmp_dir, f"{idx}.txt"))
+                with open(paths[-1], "w", encoding="utf-8", newline="") as file:
+                    file.write(text[start:end])
+            # the threads only wait for the worker processes
+            with concurrent.futures.ThreadPoolExecutor(self.workers) as executor:
+                return list(executor.map(self._tokenize_in_worker, paths, starts,
+                                         [tokenizer_path] * len(paths)))
+
+    def span_tokenize(self, text: str) -> [(int, int)]:
+        """
+        The same spans as the tokenizer's span_tokenize() for the whole text.
+        """
+        starts = self._chunk_starts(text)
+        if self.workers < 2 or len(starts) < 2:
+            return list(self.tokenizer.span_tokenize(text))
+
+        result = []
+        # the start of the sentences not known yet, a sentence start for sure
+        pending = 0
+        for spans in self._chunk_spans(text, starts):
+            if len(spans) < 2:
+                # no sentence starts in this chunk for sure
+                continue
+            known = spans[1][0]
+            result += [(pending + start, pending + end)
+                       for start, end in self.tokenizer.span_tokenize(text[pending:known])]
+            result += spans[1:-1]
+            pending = spans[-1][0]
+        result += [(pending + start, pending + end) for start, end in self.tokenizer.span_tokenize(text[pending:])]
+        return result
+
+    def tokenize(self, text: str) -> [str]:
+        return [text[start:end] for start, end in self.span_tokenize(text)]
+
+
+if __name__ == "__main__":
+
+    # the entry point for the workers of the ParallelTokenizer
+    parser = argparse.ArgumentParser(description="Tokenize a text file into sentences and print their spans as json.")
+    parser.add_argument("command", type=str, choices=["spans"])
+    parser.add_argument("language", type=str)
+    parser.add_argument("path", type=str)
+    parser.add_argument("--tokenizer_pickle", type=str, default="",
+                        help="A pickled tokenizer to use instead of building one.")
+    args = parser.parse_args()
+
+    if args.tokenizer_pickle:
+        with open(args.tokenizer_pickle, "rb") as file:
+            worker_tokenizer = pickle.load(file)
+    else:
+        worker_tokenizer = sentence_tokenizer(args.language)
+    # no newline translation, the spans are offsets into the chunk as written
+    with open(args.path, "r", encoding="utf-8", newline="") as file:
+        json.dump(list(worker_tokenizer.span_tokenize(file.read())), sys.stdout)
+
+
+# TESTS
+
+def _enumerated_abbreviation_types() -> set:
+    # the types that were added to the punkt model one by one before they
+    # were recognized by pattern
+    def roman(number: int) -> str:
+        result = ""
+        for value, numeral in [(1000, "M"), (900, "CM"), (500, "D"), (400, "CD"), (100, "C"), (90, "XC"),
+                               (50, "L"), (40, "XL"), (10, "X"), (9, "IX"), (5, "V"), (4, "IV"), (1, "I")]:
+            while number >= value:
+                result += numeral
+                number -= value
+        return result
+
+    abc = "abcdefghijklmnopqrstuvwxyz"
+    result = set(abc)
+    result.update(f"{a}.{b}" for a in abc for b in abc)
+    result.update(map(str, range(1, 999)))
+    result.update(f"{i}{f}" for i in range(1, 9999) for f in ["f", "ff"])
+    result.update(roman(i) for i in range(1, 2001))
+    return result
+
+
+def test_abbreviation_pattern():
+    enumerated = _enumerated_abbreviation_types()
+    types = AbbreviationTypes()
+    # punkt looks up the lower case of a token (without its period)
+    candidates = {t.lower() for t in enumerated}
+    candidates.update(f"{i}{f}" for i in range(0, 100000) for f in ["", "f", "ff", "fff"])
+    candidates.update(f"{a}{b}" for a in "abcxyz019" for b in "abcxyz019.")
+    candidates.update(["##number##", "0", "00", "01", "1000", "10000ff", "9999f", "a.b.c", "a.", ".a", "e.f.",
+                       "xiv", "ä", "é", "a-b", "", " ", "f", "ff", "1.2"])
+    wrong = sorted(t for t in candidates if (t in types) != (t in enumerated))
+    assert wrong == []
+    for typ in ["0", "1000", "10000ff", "a.b.c", "##number##"]:
+        assert typ not in types
+
+
+def test_abbreviation_pattern_sentences():
+    enumerated = load("tokenizers/punkt/english.pickle", cache=False)
+    enumerated._params.abbrev_types = set(enumerated._params.abbrev_types)
+    enumerated._params.abbrev_types.update(abbreviations)
+    enumerated._params.abbrev_types.update(_enumerated_abbreviation_types())
+    text = "See p. 19f. and p. 20ff. for it. In the 19. century E.F. Wallace wrote XIV. chapters. " \
+           "There were 999. and 1000. and 9999f. and 10000ff. of them. J. Smith came. A.B.C. is not one. " \
+           "It was 0. Then hist.-phil. work. Page 12-13. The end."
+    assert _augmented_tokenizer("english").tokenize(text) == enumerated.tokenize(text)
+
+
+def test_tokenizer_cache_rebuilds_unusable_files():
+    text = "See p. 19f. and p. 20ff. for it. In the 19. century E.F. Wallace wrote XIV. chapters."
+    expected = _augmented_tokenizer("english").tokenize(text)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        use_tokenizer_cache(tmp_dir)
+        try:
+            path = os.path.join(tmp_dir, f"punkt-english-{_tokenizer_key('english')[:16]}.pickle")
+            unusable = [b"", b"not a pickle", pickle.dumps(AbbreviationTypes())[:-3],
+                        # pickles of classes that are gone
+                        pickle.dumps(AbbreviationTypes()).replace(b"AbbreviationTypes", b"AbbreviationTypeX"),
+                        pickle.dumps(AbbreviationTypes()).replace(b"tokenization", b"tokenizationX")]
+            for content in unusable:
+                with open(path, "wb") as file:
+                    file.write(content)
+                assert _load_cached_tokenizer("english").tokenize(text) == expected
+                assert os.listdir(tmp_dir) == [os.path.basename(path)]
+                assert _load_cached_tokenizer("english").tokenize(text) == expected
+        finally:
+            use_tokenizer_cache("")
+
+
+def test_iter_span_tokenize():
+    tokenizer = _augmented_tokenizer("english")
+    lines = ["See p. 19f. and p. 20ff. for it. In the", "19. century E.F. Wallace wrote", "", "XIV. chapters. The",
+             "end.  ", "  It goes on"] * 20
+    text = "\n".join(lines)
+    expected = [(start, end, text[start:end]) for start, end in tokenizer.span_tokenize(text)]
+    # the sentences are much shorter than the carry limit of each chunk size
+    for chunk_size in [20, 100, 1000, 1 << 20]:
+        assert list(iter_span_tokenize(tokenizer, lines, chunk_size)) == expected, chunk_size
+
+
+def test_iter_span_tokenize_without_sentence_ends():
+    tokenizer = _augmented_tokenizer("english")
+    lines = [f"  row {idx} of a table without any sentence end " for idx in range(2000)]
+    text = "\n".join(lines)
+    chunk_size = 1000
+    spans = list(iter_span_tokenize(tokenizer, lines, chunk_size))
+    assert len(spans) > 1
+    # cut at chunk ends, where the text is tokenized as a whole
+    assert all(end - start <= (_max_carry_chunks + 1) * chunk_size for start, end, _ in spans)
+    assert all(text[start:end] == sentence for start, end, sentence in spans)
+    assert " ".join(sentence for _, _, sentence in spans).split() == text.split()
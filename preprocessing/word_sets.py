@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import bisect
+import json
+import mmap
+import os
+import re
+import struct
+
+# File layout: the magic bytes, the number of words n, the length of the
+# prefixes' json, the json, n + 1 offsets into the data and the data, i.e.
+# the sorted utf-8 encoded words back to back. The words include a marker
+# per word and prefix flag for the words that a prefix can be added to.
+_MAGIC = b"CHRWORD2"
+_HEADER = struct.Struct("<8sQQ")
+_OFFSET = struct.Struct("<Q")
+
+
+class _Affix:
+
+    def __init__(self, strip: str, add: str, flags: str, condition: str, is_prefix: bool):
+        self.strip = strip
+        self.add = add
+        # the continuation classes, that apply to the affixed word
+        self.flags = flags
+        self.condition = condition
+        if condition == ".":
+            self._condition = None
+        elif is_prefix:
+            self._condition = re.compile("^" + condition)
+        else:
+            self._condition = re.compile(condition + "$")
+        self.is_prefix = is_prefix
+
+    def apply(self, word: str):
+        """
+        :return: The affixed word or None if the affix does not apply
+        """
+        if self.is_prefix:
+            if not word.startswith(self.strip) or (self._condition and not self._condition.match(word)):
+                return None
+            return self.add + word[len(self.strip):]
+        if not word.endswith(self.strip) or (self._condition and not self._condition.search(word)):
+            return None
+        return word[:len(word) - len(self.strip)] + self.add
+
+
+class AffixRules:
+    """
+    The parts of a hunspell .aff file that are needed to expand the words of
+    a dictionary: the encoding, the flag format and the prefix and suffix
+    rules. Compounding is not expanded.
+    Applying prefixes to all suffixed forms would multiply the number of
+    words for some languages (e.g. the elided articles in Italian), so those
+    prefixes are only applied to the words themselves. The suffixed forms
+    are marked with the flags of the prefixes they allow instead and the
+    prefixes are kept apart to be removed when looking up a word.
+    """
+
+    def __init__(self, aff_path: str):
+        self.encoding = "utf-8"
+        self.flag_format = "short"
+        self.flag_aliases = []
+        # by flag: whether the affix combines with affixes of the other kind
+        # and the affixes themselves
+        self.prefixes = {}
+        self.suffixes = {}
+        self.cross_product = {}
+        self.need_affix = None
+        self.only_in_compound = None
+        self.forbidden_word = None
+        self.circumfix = None
+
+        with open(aff_path, "rb") as file:
+            raw = file.read()
+        match = re.search(rb"^SET\s+(\S+)", raw, re.MULTILINE)
+        if match:
+            self.encoding = {"UTF-8": "utf-8", "ISO8859-1": "latin-1", "ISO8859-15": "iso8859-15"}.get(
+                match.group(1).decode("ascii"), match.group(1).decode("ascii"))
+        for line in raw.decode(self.encoding, errors="replace").splitlines():
+            self._parse_line(line.split())
+
+    def _parse_line(self, fields: [str]):
+        if not fields:
+            return
+        keyword = fields[0]
+        if keyword == "FLAG" and len(fields) > 1:
+            self.flag_format = fields[1]
+        elif keyword == "AF" and len(fields) > 1 and not fields[1].isdigit():
+            self.flag_aliases.append(fields[1])
+        elif keyword == "NEEDAFFIX" and len(fields) > 1:
+            self.need_affix = fields[1]
+        elif keyword == "ONLYINCOMPOUND" and len(fields) > 1:
+            self.only_in_compound = fields[1]
+        elif keyword == "FORBIDDENWORD" and len(fields) > 1:
+            self.forbidden_word = fields[1]
+        elif keyword == "CIRCUMFIX" and len(fields) > 1:
+            self.circumfix = fields[1]
+        elif keyword in ("PFX", "SFX") and len(fields) >= 4:
+            rules = self.prefixes if keyword == "PFX" else self.suffixes
+            flag = fields[1]
+            if flag not in rules:
+                # the header of the rules for a flag
+                rules[flag] = []
+                self.cross_product[flag] = fields[2] == "Y"
+                return
+            strip = "" if fields[2] == "0" else fields[2]
+            add, _, flags = fields[3].partition("/")
+            add = "" if add == "0" else add
+            condition = fields[4] if len(fields) > 4 else "."
+            rules[flag].append(_Affix(strip, add, self.split_flags(flags), condition, keyword == "PFX"))
+
+    def split_flags(self, flags: str) -> [str]:
+        if not flags:
+            return []
+        if self.flag_aliases and flags.isdigit():
+            flags = self.flag_aliases[int(flags) - 1]
+        if self.flag_format == "long":
+            return [flags[i:i + 2] for i in range(0, len(flags), 2)]
+        elif self.flag_format == "num":
+            return flags.split(",")
+        return list(flags)
+
+    def _affixed(self, word: str, flags: [str], rules: dict) -> [(str, str, _Affix)]:
+        result = []
+        for flag in flags:
+            for affix in rules.get(flag, ()):
+                affixed = affix.apply(word)
+                if affixed is not None:
+                    result.append((affixed, flag, affix))
+        return result
+
+    def cross_product_prefixes(self) -> [(str, str, str, str)]:
+        """
+        :return: The flag, the stripped and added strings and the condition
+                 of the prefixes that combine with suffixes
+        """
+        return sorted({(flag, affix.strip, affix.add, affix.condition) for flag, affixes in self.prefixes.items()
+                       if self.cross_product[flag] for affix in affixes if affix.add})
+
+    def expand(self, word: str, flags: [str]):
+        """
+        Yield the word and the forms the affix rules allow for its flags.
+        Suffixes of suffixes (the continuation classes) are applied once.
+        The suffixed forms that a prefix can be added to are also yielded
+        as prefix_marker() of each such prefix flag.
+        """
+        if self.forbidden_word in flags or self.only_in_compound in flags:
+            return
+        if self.need_affix not in flags:
+            yield word
+        for form, flag, affix in self._affixed(word, flags, self.suffixes):
+            if self.need_affix not in affix.flags and self.circumfix not in affix.flags:
+                yield form
+            twice_forms = [twice for twice, _, _ in self._affixed(form, affix.flags, self.suffixes)]
+            yield from twice_forms
+            if self.cross_product[flag]:
+                # like hunspell, only prefixes that combine with suffixes
+                prefix_flags = {f for f in flags + affix.flags if self.cross_product.get(f) and f in self.prefixes}
+                for prefix_flag in sorted(prefix_flags):
+                    yield prefix_marker(prefix_flag, form)
+                    for twice in twice_forms:
+                        yield prefix_marker(prefix_flag, twice)
+        for form, _, affix in self._affixed(word, flags, self.prefixes):
+            if self.need_affix not in affix.flags and self.circumfix not in affix.flags:
+                yield form
+
+
+def prefix_marker(flag: str, word: str) -> str:
+    """
+    :return: The entry of a word set saying that the prefixes of the flag can
+             be added to the word, it is not a word itself
+    """
+    return f"\0{flag}\0{word}"
+
+
+def _split_entry(line: str) -> (str, str):
+    # the word ends at the first unescaped "/", morphological fields follow
+    # after whitespace
+    entry = line.split("\t")[0].split(" ")[0]
+    idx = 0
+    while True:
+        idx = entry.find("/", idx)
+        if idx <= 0 or entry[idx - 1] != "\\":
+            break
+        idx += 1
+    if idx < 0:
+        return entry.replace("\\/", "/"), ""
+    return entry[:idx].replace("\\/", "/"), entry[idx + 1:]
+
+
+def expand_dictionary(dic_path: str, rules: AffixRules):
+    """
+    Yield all words of a hunspell dictionary with their affixed forms.
+    """
+    with open(dic_path, "r", encoding=rules.encoding, errors="replace") as file:
+        # the first line is the number of words
+        next(file, None)
+        for line in file:
+            word, flags = _split_entry(line.strip())
+            if word:
+                yield from rules.expand(word, rules.split_flags(flags))
+
+
+def compile_dictionary(dic_path: str, aff_path: str, path: str):
+    rules = AffixRules(aff_path)
+    compile_word_set(expand_dictionary(dic_path, rules), path, rules.cross_product_prefixes())
+
+
+def compile_word_set(words, path: str, prefixes: [(str, str, str, str)] = ()):
+    """
+    Write the words as a sorted word set file for WordSet.
+    :param prefixes: The flag, stripped and added string and condition of
+                     prefixes to remove from words that are not in the set,
+                     cf. AffixRules.cross_product_prefixes()
+    """
+    encoded = sorted({w.encode("utf-8") for w in words})
+    prefixes_json = json.dumps([list(p) for p in prefixes]).encode("utf-8")
+    tmp_path = f"{path}.part"
+    with open(tmp_path, "wb") as file:
+        file.write(_HEADER.pack(_MAGIC, len(encoded), len(prefixes_json)))
+        file.write(prefixes_json)
+        offset = 0
+        for word in encoded:
+            file.write(_OFFSET.pack(offset))
+            offset += len(word)
+        file.write(_OFFSET.pack(offset))
+        for word in encoded:
+            file.write(word)
+    os.replace(tmp_path, path)
+
+
+class _WordsView:
+    # the words of the mapped file as a sequence for bisect
+
+    def __init__(self, data: mmap.mmap, count: int, offsets_start: int):
+        self._data = data
+        self._count = count
+        self._offsets_start = offsets_start
+        self._words_start = offsets_start + (count + 1) * _OFFSET.size
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, idx: int) -> bytes:
+        start, end = struct.unpack_from("<QQ", self._data, self._offsets_start + idx * _OFFSET.size)
+        return self._data[self._words_start + start:self._words_start + end]
+
+
+class WordSet:
+    """
+    A compiled word set file, mapped into memory. The pages are shared by
+    all processes using the same file and only read as they are needed.
+    Can be used in place of a HunSpell object to check words.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as file:
+            self._data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count, prefixes_length = _HEADER.unpack_from(self._data, 0)
+        if magic != _MAGIC:
+            raise ValueError(f"Not a word set file of this version, compile it again: '{path}'")
+        prefixes = json.loads(self._data[_HEADER.size:_HEADER.size + prefixes_length].decode("utf-8"))
+        self._prefixes = [(flag, _Affix(strip, add, [], condition, True)) for flag, strip, add, condition in prefixes]
+        self._words = _WordsView(self._data, count, _HEADER.size + prefixes_length)
+
+    def __len__(self):
+        return len(self._words)
+
+    def _contains(self, word: str) -> bool:
+        encoded = word.encode("utf-8")
+        idx = bisect.bisect_left(self._words, encoded)
+        return idx < len(self._words) and self._words[idx] == encoded
+
+    def __contains__(self, word: str) -> bool:
+        if "\0" in word:
+            # only the prefix markers contain these
+            return False
+        if self._contains(word):
+            return True
+        # a prefix is only removed if the rest is a word that allows it
+        for flag, affix in self._prefixes:
+            if len(word) > len(affix.add) and word.startswith(affix.add):
+                stem = affix.strip + word[len(affix.add):]
+                if affix.apply(stem) == word and self._contains(prefix_marker(flag, stem)):
+                    return True
+        return False
+
+    def spell(self, word: str) -> bool:
+        # like hunspell, capitalized and upper case words are also known in
+        # their lower case (and capitalized) forms
+        if word in self:
+            return True
+        if word[:1].isupper():
+            if word[1:].islower() or len(word) == 1:
+                return word.lower() in self
+            if word.isupper():
+                return word.lower() in self or word.capitalize() in self
+        return word.isdigit()
+
+
+def word_set_path(directory: str, language_code: str) -> str:
+    return os.path.join(directory, f"{language_code}.words")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Compile hunspell dictionaries with all affixed forms of their words into word set files, that "
+                    "preprocessing.py's --word_sets can use instead of hunspell. Run this as "
+                    "'python3 -m preprocessing.word_sets' from the repository's directory.")
+    parser.add_argument("directory", type=str, help="The directory to write the word set files to.")
+    parser.add_argument("--languages", type=str, nargs="+", default=None,
+                        help="The languages to compile, defaults to all that there are dictionaries for.")
+    args = parser.parse_args()
+
+    # the dictionary locations are those of the cleaning
+    from preprocessing.cleaning import _hunspell_files
+
+    os.makedirs(args.directory, exist_ok=True)
+    for language_code in args.languages or sorted(_hunspell_files.keys()):
+        dic_path, aff_path = _hunspell_files[language_code]
+        if not os.path.isfile(dic_path):
+            print("WARN:", f"No dictionary for '{language_code}' at: {dic_path}")
+            continue
+        path = word_set_path(args.directory, language_code)
+        compile_dictionary(dic_path, aff_path, path)
+        print(f"{language_code}: {len(WordSet(path))} words and prefix markers in {path}")
+
+
+# TESTS
+
+def test_word_set_prefixes():
+    import tempfile
+    aff = ["SET UTF-8",
+           "PFX A Y 1", "PFX A 0 re .",
+           "PFX B N 1", "PFX B 0 un .",
+           "PFX C Y 1", "PFX C 0 in [^p]",
+           "SFX S Y 1", "SFX S 0 s .",
+           "SFX N N 1", "SFX N 0 ing .",
+           "SFX D Y 1", "SFX D 0 ed/A ."]
+    dic = ["8", "work/AS", "play/S", "walk/AN", "talk/BS", "port/CS", "act/CS", "jump/D", "re"]
+    known = ["work", "works", "rework", "reworks", "play", "plays", "walk", "walking", "rewalk", "talk", "talks",
+             "untalk", "port", "ports", "act", "acts", "inact", "inacts", "jump", "jumped", "rejumped", "re"]
+    unknown = ["replay", "replays", "rewalking", "untalks", "inport", "inports", "rejump", "reacts", "rere",
+               "unwork", "reworking", "\0A\0works"]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        aff_path, dic_path = os.path.join(tmp_dir, "xx.aff"), os.path.join(tmp_dir, "xx.dic")
+        with open(aff_path, "w") as file:
+            file.write("\n".join(aff) + "\n")
+        with open(dic_path, "w") as file:
+            file.write("\n".join(dic) + "\n")
+        path = os.path.join(tmp_dir, "xx.words")
+        compile_dictionary(dic_path, aff_path, path)
+        words = WordSet(path)
+        assert [w for w in known if w not in words] == []
+        assert [w for w in unknown if w in words] == []
+        assert words.spell("Reworks") and words.spell("REWORKS") and not words.spell("Replays")